@@ -33,6 +33,7 @@ class SearchResponse(BaseModel):
     success: bool = True
     message: Optional[str] = None
     documents: List[DocumentResponse] = []
+    timings: Optional[Dict[str, float]] = None
 
 class ErrorResponse(BaseModel):
     success: bool = False
@@ -79,6 +80,7 @@ async def rag_search(
         # -------------------------------------------------
         # 1. RETRIEVE RAW CHUNKS
         # -------------------------------------------------
+        timings: Dict[str, float] = {}
         docs = retrieve_documents_advanced(
             prompt=request.query,
             top_k=request.top_k,
@@ -86,7 +88,8 @@ async def rag_search(
             rerank=request.rerank,
             use_hyde=request.use_hyde,
             collection=request.collection,
-            metadata_filter=request.metadata_filter
+            metadata_filter=request.metadata_filter,
+            timings=timings
         )
 
         # -------------------------------------------------
@@ -156,7 +159,8 @@ async def rag_search(
         return SearchResponse(
             success=True,
             message=f"{len(final_docs)} documents merged",
-            documents=final_docs
+            documents=final_docs,
+            timings=timings
         )
 
     except Exception as e:
@@ -18,7 +18,7 @@ from src.services.auth.google_auth import get_drive_service
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
 from google.oauth2.credentials import Credentials
 
-from src.services.auth.google_auth import get_google_service
+from src.services.auth.google_auth import get_google_service, google_backoff_delay, is_retryable_google_error
 from src.core.logger import log
 from src.core.adapters.provider_change_tracker import ProviderChangeTracker
 
@@ -41,36 +41,28 @@ def retry_with_backoff(max_retries: int = 3, initial_backoff: float = 1,
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            backoff = initial_backoff
             retries = 0
             
             while True:
                 try:
                     return func(*args, **kwargs)
                 except retryable_errors as error:
-                    # Only retry on certain HTTP errors (e.g., 429, 500, 503)
-                    if isinstance(error, HttpError):
-                        status_code = error.resp.status
-                        # Don't retry on client errors (except rate limiting)
-                        if status_code < 500 and status_code != 429:
-                            raise
+                    # Only retry transient HTTP errors (5xx, 429 and 403 quota errors)
+                    if isinstance(error, HttpError) and not is_retryable_google_error(error):
+                        raise
                     
                     retries += 1
                     if retries > max_retries:
                         # If we've exceeded max retries, re-raise the exception
                         raise
                     
-                    # Log the retry attempt
+                    # Exponential backoff with jitter, shared with the Gmail batch fetching
+                    delay = google_backoff_delay(retries - 1, initial_backoff, backoff_factor)
                     log.warning(
                         f"Retry {retries}/{max_retries} for {func.__name__} after error: {error}. "
-                        f"Waiting {backoff} seconds..."
+                        f"Waiting {delay:.1f} seconds..."
                     )
-                    
-                    # Wait with exponential backoff
-                    time.sleep(backoff)
-                    
-                    # Increase backoff for next retry
-                    backoff *= backoff_factor
+                    time.sleep(delay)
         
         return wrapper
     return decorator
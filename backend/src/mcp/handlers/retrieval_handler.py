@@ -72,6 +72,7 @@ class RetrievalHandler:
         )
         
         # Execute retrieval
+        timings: Dict[str, float] = {}
         docs = retrieve_documents_advanced(
             prompt=retrieval_config.prompt,
             top_k=retrieval_config.top_k,
@@ -79,7 +80,8 @@ class RetrievalHandler:
             split_prompt=retrieval_config.split_prompt,
             use_hyde=retrieval_config.use_hyde,
             rerank=retrieval_config.rerank,
-            metadata_filter=retrieval_config.metadata_filter
+            metadata_filter=retrieval_config.metadata_filter,
+            timings=timings
         )
         
         # Convert to structured results
@@ -95,7 +97,7 @@ class RetrievalHandler:
         
         logger.info(
             "[RetrievalHandler] Retrieved documents",
-            extra={"count": len(results)}
+            extra={"count": len(results), "timings": timings}
         )
         
         # Format response
@@ -12,6 +12,8 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import base64
 import json
+import random
+import time
 from src.core.config import (
     GMAIL_CLIENT_ID, GMAIL_CLIENT_SECRET, GMAIL_AUTH_URI, GMAIL_TOKEN_URI,
     GMAIL_REDIRECT_URI, GMAIL_SCOPES, GDRIVE_SCOPES, GCALENDAR_SCOPES, GMAIL_AUTH_PROVIDER_X509_CERT_URL
@@ -87,6 +89,61 @@ def get_google_service(service_name, version, scopes, user_id):
 
     return build(service_name, version, credentials=creds)
 
+# Raisons des erreurs 403 signalant un dépassement de quota (à réessayer après une attente)
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+def is_retryable_google_error(error: Exception) -> bool:
+    """
+    Indique si une erreur d'API Google est transitoire : erreur serveur (5xx),
+    limitation de débit (429) ou dépassement de quota (403 rateLimitExceeded).
+    """
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status >= 500 or status == 429:
+        return True
+    if status == 403:
+        try:
+            details = json.loads(error.content.decode('utf-8')).get('error', {}).get('errors', [])
+        except (ValueError, AttributeError):
+            return False
+        return any(detail.get('reason') in RATE_LIMIT_REASONS for detail in details)
+    return False
+
+def google_backoff_delay(attempt: int, initial_backoff: float = 1, backoff_factor: float = 2,
+                         max_backoff: float = 32) -> float:
+    """
+    Délai avant la tentative suivante : exponentiel, plafonné, avec une gigue aléatoire
+    pour ne pas resynchroniser les requêtes concurrentes (recommandation Google).
+    
+    Args:
+        attempt: Numéro de la tentative échouée (0 pour la première)
+    """
+    return min(max_backoff, initial_backoff * backoff_factor ** attempt) + random.uniform(0, 1)
+
+def execute_with_backoff(request, max_retries: int = 5):
+    """
+    Exécute une requête d'API Google en la réessayant après les erreurs transitoires.
+    
+    Args:
+        request: Requête googleapiclient (HttpRequest ou BatchHttpRequest)
+        max_retries: Nombre maximum de nouvelles tentatives
+        
+    Returns:
+        Réponse de la requête
+    """
+    attempt = 0
+    while True:
+        try:
+            return request.execute()
+        except HttpError as error:
+            if not is_retryable_google_error(error) or attempt >= max_retries:
+                raise
+            delay = google_backoff_delay(attempt)
+            logger.warning(f"Erreur transitoire de l'API Google ({error.resp.status}), nouvelle tentative dans {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
 def get_gmail_service(user_id):
     return get_google_service("gmail", "v1", GMAIL_SCOPES, user_id)
 
@@ -0,0 +1,260 @@
+"""
+Cache persistant des embeddings, adressé par contenu.
+
+Les vecteurs sont stockés sur disque (SQLite) sous la clé
+(provider, model, type, sha256(texte)) afin qu'un chunk déjà encodé ne soit jamais
+renvoyé à l'API d'embeddings, quelle que soit la source qui le réingère.
+Le type (doc ou query) sépare les vecteurs de documents de ceux de requêtes,
+que certains fournisseurs encodent différemment pour un même texte.
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from src.core.constants import DATA_DIR
+from src.core.logger import log
+
+logger = log.bind(name="src.services.embeddings.embedding_cache")
+
+DEFAULT_CACHE_PATH = str(DATA_DIR / "embedding_cache" / "embeddings.sqlite")
+DEFAULT_MAX_ENTRIES = 500000
+
+# Limite de variables SQLite par requête (999 sur les anciennes versions)
+_SQLITE_MAX_VARS = 900
+# Part de max_entries à partir de laquelle le nombre d'entrées est recompté avant éviction
+_RECOUNT_RATIO = 0.95
+
+
+class EmbeddingCache:
+    """
+    Stockage clé/vecteur sur disque avec éviction LRU et compteurs hit/miss.
+
+    Une seule instance est partagée par chemin de fichier dans le processus
+    (voir get_embedding_cache) afin que les compteurs soient cumulés.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        """
+        Initialise le cache.
+
+        Args:
+            path: Chemin du fichier SQLite. Par défaut data/embedding_cache/embeddings.sqlite.
+            max_entries: Nombre maximum de vecteurs conservés avant éviction LRU.
+        """
+        self.path = path or DEFAULT_CACHE_PATH
+        self.max_entries = max_entries or DEFAULT_MAX_ENTRIES
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        logger.info(f"Cache d'embeddings ouvert: {self.path} ({self._count} entrées, max {self.max_entries})")
+
+    @staticmethod
+    def make_key(provider: str, model: str, text: str, kind: str = "doc") -> str:
+        """Construit la clé de cache (provider, model, type doc/query, sha256 du texte)."""
+        digest = hashlib.sha256((text or "").encode("utf-8", errors="replace")).hexdigest()
+        return f"{provider}:{model}:{kind}:{digest}"
+
+    @staticmethod
+    def _pack(vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _unpack(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Récupère les vecteurs présents dans le cache et met à jour leur date d'accès.
+
+        Args:
+            keys: Clés à rechercher.
+
+        Returns:
+            Dict[str, List[float]]: Vecteurs trouvés, indexés par clé.
+        """
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+        if not keys:
+            return found
+
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _SQLITE_MAX_VARS):
+                chunk = keys[i:i + _SQLITE_MAX_VARS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = self._unpack(blob)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """
+        Enregistre des vecteurs dans le cache puis applique l'éviction LRU si nécessaire.
+
+        Args:
+            items: Vecteurs à enregistrer, indexés par clé.
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, self._pack(vector), now) for key, vector in items.items()]
+            )
+            self._count += max(cursor.rowcount, 0)
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        """Supprime les entrées les moins récemment utilisées au-delà de max_entries."""
+        if self._count < self.max_entries * _RECOUNT_RATIO:
+            return
+        # Le fichier peut être partagé entre processus : le compteur local, tenu à jour à chaque
+        # insertion, est recompté seulement à l'approche de la limite
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (excess,)
+        )
+        self._count -= excess
+        logger.debug(f"Cache d'embeddings: {excess} entrées évincées (LRU)")
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Retourne les compteurs du cache.
+
+        Returns:
+            Dict contenant hits, misses, hit_rate et entries.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": self._count,
+        }
+
+    def clear(self) -> None:
+        """Vide le cache et remet les compteurs à zéro."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+            self.hits = 0
+            self.misses = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Enveloppe un objet Embeddings LangChain et passe par l'EmbeddingCache.
+
+    Utilisable partout où un Embeddings est attendu (QdrantVectorStore, etc.).
+    """
+
+    def __init__(self, embedder: Embeddings, cache: EmbeddingCache, provider: str, model: str):
+        self.embedder = embedder
+        self.cache = cache
+        self.provider = provider
+        self.model = model
+
+    def _key(self, text: str, kind: str = "doc") -> str:
+        return self.cache.make_key(self.provider, self.model, text, kind)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Encode une liste de textes en n'appelant le fournisseur que pour les textes absents du cache.
+        Les doublons d'un même lot ne sont encodés qu'une fois.
+        """
+        if not texts:
+            return []
+        keys = [self._key(t) for t in texts]
+        vectors = self.cache.get_many(keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            new_vectors = self.embedder.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            self.cache.put_many(computed)
+            vectors.update(computed)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Encode une requête en passant par le cache."""
+        key = self._key(text, "query")
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        vector = self.embedder.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+
+# Instances partagées par chemin de fichier, pour cumuler les compteurs dans le processus
+_cache_instances: Dict[str, EmbeddingCache] = {}
+_cache_instances_lock = threading.Lock()
+
+
+def get_embedding_cache(path: Optional[str] = None, max_entries: Optional[int] = None) -> EmbeddingCache:
+    """
+    Retourne l'instance de cache partagée pour le chemin donné, en la créant si nécessaire.
+
+    Args:
+        path: Chemin du fichier SQLite (relatif au répertoire backend si non absolu).
+        max_entries: Nombre maximum d'entrées avant éviction.
+
+    Returns:
+        EmbeddingCache: Instance partagée.
+    """
+    if path and not os.path.isabs(path):
+        path = str(DATA_DIR.parent / path)
+    path = path or DEFAULT_CACHE_PATH
+    with _cache_instances_lock:
+        if path not in _cache_instances:
+            _cache_instances[path] = EmbeddingCache(path, max_entries)
+        return _cache_instances[path]
@@ -17,6 +17,7 @@ from src.core.config import (
     CONFIG
 )
 from src.core.logger import log
+from src.services.embeddings.embedding_cache import CachedEmbeddings, get_embedding_cache
 from langchain_openai import OpenAIEmbeddings
 try:
     from langchain_huggingface import HuggingFaceEmbeddings
@@ -40,12 +41,13 @@ class EmbeddingService(BaseEmbedder):
     Prend en charge différentes sources d'embeddings (OpenAI, Hugging Face, etc.).
     """
     
-    def __init__(self, provider: str = None, model: str = None):
+    def __init__(self, provider: str = None, model: str = None, use_cache: Optional[bool] = None):
         """
         Initialise le service d'embeddings.
         
         Args:
             provider (str, optional): Fournisseur d'embeddings ('openai' ou 'huggingface'). Par défaut 'openai'.
+            use_cache (bool, optional): Passer par le cache disque des embeddings. Par défaut embedder.cache.enabled.
         """
         if provider is None:
             provider = CONFIG.get("embedder", {}).get("provider", "openai")
@@ -69,6 +71,24 @@ class EmbeddingService(BaseEmbedder):
             self._embedder = HuggingFaceEmbeddings(model_name=self.model, model_kwargs={"device": "cpu"})
         else:
             raise ValueError(f"Fournisseur d'embeddings '{provider}' non pris en charge")
+
+        # Cache disque adressé par contenu devant l'embedder LangChain
+        cache_cfg = CONFIG.get("embedder", {}).get("cache", {}) or {}
+        if use_cache is None:
+            use_cache = cache_cfg.get("enabled", False)
+        self.cache = None
+        if use_cache:
+            self.cache = get_embedding_cache(cache_cfg.get("path"), cache_cfg.get("max_entries"))
+            self._embedder = CachedEmbeddings(self._embedder, self.cache, self.provider, self.model)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Retourne les compteurs du cache d'embeddings (hits, misses, hit_rate, entries).
+        
+        Returns:
+            Dict[str, Any]: Statistiques du cache, vide si le cache est désactivé
+        """
+        return self.cache.stats() if self.cache else {}
                     
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
@@ -4,11 +4,17 @@ import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')))
 import json
+import multiprocessing
+import threading
+import time
 import uuid
 import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from src.core.config import CONFIG
 from src.core.logger import log
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from langchain_text_splitters.character import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from langchain_community.document_loaders import (
@@ -153,13 +159,7 @@ def load_and_split_document(filepath: str, metadata: Dict[str, Any], chunk_size:
         #text = "\n".join([el.text for el in elements if hasattr(el, "text") and el.text])
         #docs = [Document(page_content=text)]
         # Construction d'un texte structuré à partir des métadonnées
-        text = (
-            f"Sent by: {metadata.get('sender', 'Unknown')}\n"
-            f"Date: {metadata.get('date', 'Unknown')}\n"
-            f"Subject: {metadata.get('subject', 'No subject')}\n\n"
-            f"{metadata.get('body_text', '')}"
-        )
-        docs = [Document(page_content=text)]
+        docs = [Document(page_content=_format_email_text(metadata, metadata.get('body_text', '')))]
 
 
     # Fichiers tableurs (Excel, CSV, LibreOffice Calc, etc.)
@@ -268,7 +268,36 @@ def load_and_split_document(filepath: str, metadata: Dict[str, Any], chunk_size:
     # Map extension to document_type and update metadata
     ext_map = {".pdf": "pdf", ".docx": "docx", ".txt": "txt", ".eml": "email", ".csv": "csv", ".xlsx": "xlsx", ".xlsm": "xlsm", ".xls": "xls", ".ods": "ods", ".fods": "fods"}
     doc_type = ext_map.get(ext, ext.lstrip('.'))
-    
+    return _split_loaded_documents(docs, metadata, doc_type, chunk_size, chunk_overlap)
+
+
+def _format_email_text(metadata: Dict[str, Any], body: Optional[str]) -> str:
+    """Construit le texte indexé d'un email : en-têtes principaux suivis du corps."""
+    return (
+        f"Sent by: {metadata.get('sender', 'Unknown')}\n"
+        f"Date: {metadata.get('date', 'Unknown')}\n"
+        f"Subject: {metadata.get('subject', 'No subject')}\n\n"
+        f"{body or ''}"
+    )
+
+
+def split_text_document(text: str, metadata: Dict[str, Any], chunk_size: int = 1000, chunk_overlap: int = 100) -> List[Document]:
+    """
+    Découpe un document déjà en mémoire (corps d'email, texte extrait par le fournisseur),
+    sans passer par un fichier temporaire.
+
+    Le type est lu dans metadata["document_type"] ("txt" par défaut) ; pour "email", le texte
+    est le corps du message et reçoit les mêmes en-têtes que le chargeur .eml.
+    """
+    doc_type = metadata.get("document_type") or "txt"
+    if doc_type == "email":
+        text = _format_email_text(metadata, text)
+    return _split_loaded_documents([Document(page_content=text or "")], metadata, doc_type, chunk_size, chunk_overlap)
+
+
+def _split_loaded_documents(docs: List[Document], metadata: Dict[str, Any], doc_type: str,
+                            chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """Applique les métadonnées aux documents chargés puis les découpe en chunks."""
     # Update the passed metadata with document type
     metadata["document_type"] = doc_type
     # Ensure all docs have the correct metadata
@@ -291,36 +320,214 @@ def load_and_split_document(filepath: str, metadata: Dict[str, Any], chunk_size:
         chunk.metadata["num_chunks"] = len(chunks)
     return chunks
 
-def batch_load_and_split_document(filepaths: List[dict], chunk_size: int = 1000, chunk_overlap: int = 100) -> List[str]:
+def _load_and_split_file(file_info: dict, chunk_size: int, chunk_overlap: int) -> List[Document]:
     """
-    Charge et découpe une liste de documents en chunks.
+    Charge et découpe un document de lot : fichier ({"tmp_path", "metadata"}) ou texte en
+    mémoire ({"text", "metadata"}). Point d'entrée des processus de parsing :
+    doit rester une fonction de module pour être sérialisable.
+    """
+    metadata = file_info.get("metadata").copy()
+    if "text" in file_info:
+        return split_text_document(file_info["text"], metadata, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return load_and_split_document(file_info.get("tmp_path"), metadata, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _get_parsing_config() -> Dict[str, Any]:
+    """Lit la section ingestion.parsing du fichier de configuration."""
+    return CONFIG.get('ingestion', {}).get('parsing', {}) or {}
+
+
+# Pool de processus partagé, recréé si un fichier dépasse le timeout ou si un worker plante
+_parsing_pool: Optional[ProcessPoolExecutor] = None
+_parsing_pool_workers = 0
+_parsing_pool_lock = threading.Lock()
+
+
+def _get_parsing_pool(max_workers: int, start_method: str) -> ProcessPoolExecutor:
+    """Retourne le pool de parsing partagé, en le créant si nécessaire."""
+    global _parsing_pool, _parsing_pool_workers
+    if _parsing_pool is None or _parsing_pool_workers != max_workers:
+        if _parsing_pool is not None:
+            _terminate_parsing_pool()
+        _parsing_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method))
+        _parsing_pool_workers = max_workers
+    return _parsing_pool
+
+
+def _terminate_parsing_pool() -> None:
+    """Arrête le pool partagé sans attendre, en tuant les workers bloqués."""
+    global _parsing_pool
+    pool, _parsing_pool = _parsing_pool, None
+    if pool is None:
+        return
+    # Copie avant shutdown, qui vide la table des processus
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.kill()
+
+
+def _parse_in_process_pool(filepaths: List[dict], chunk_size: int, chunk_overlap: int,
+                           max_workers: int, file_timeout: float, start_method: str) -> List[Optional[List[Document]]]:
+    """
+    Parse les fichiers dans un pool de processus.
+
+    Au plus max_workers fichiers sont soumis à la fois, de sorte que chaque fichier démarre
+    dès sa soumission et que file_timeout s'applique au fichier lui-même et non à son attente.
+    Un fichier qui dépasse le timeout est abandonné et le pool est recréé ; les autres fichiers
+    en cours sont resoumis. Un fichier présent lors d'un crash de worker est réessayé une fois, seul,
+    pour ne pas pénaliser ses voisins.
+
+    Returns:
+        List[Optional[List[Document]]]: Chunks de chaque fichier, dans l'ordre d'entrée
+        (None si le fichier a échoué).
+    """
+    results: List[Optional[List[Document]]] = [None] * len(filepaths)
+    pending = deque(range(len(filepaths)))
+    in_flight: Dict[Any, tuple] = {}
+    suspects: deque = deque()
+    crashed: set = set()
+
+    def path_of(index: int) -> str:
+        return filepaths[index].get("metadata", {}).get("path", filepaths[index].get("tmp_path"))
+
+    with _parsing_pool_lock:
+        try:
+            while pending or suspects or in_flight:
+                pool = _get_parsing_pool(max_workers, start_method)
+                if suspects and not in_flight:
+                    # Fichier présent lors d'un crash : réessayé seul pour identifier le coupable
+                    index = suspects.popleft()
+                    future = pool.submit(_load_and_split_file, filepaths[index], chunk_size, chunk_overlap)
+                    in_flight[future] = (index, time.monotonic())
+                while pending and not suspects and len(in_flight) < max_workers:
+                    index = pending.popleft()
+                    future = pool.submit(_load_and_split_file, filepaths[index], chunk_size, chunk_overlap)
+                    in_flight[future] = (index, time.monotonic())
+
+                oldest = min(started for _, started in in_flight.values())
+                remaining = max(0.0, file_timeout - (time.monotonic() - oldest))
+                done, _ = wait(list(in_flight), timeout=remaining, return_when=FIRST_COMPLETED)
+
+                restart = False
+                for future in done:
+                    index, _ = in_flight.pop(future)
+                    try:
+                        results[index] = future.result()
+                    except BrokenProcessPool:
+                        restart = True
+                        if index in crashed:
+                            logger.error(f"Le worker de parsing a planté sur {path_of(index)}, fichier ignoré")
+                        else:
+                            crashed.add(index)
+                            suspects.append(index)
+                    except Exception as e:
+                        logger.error(f"Erreur lors du traitement du fichier {path_of(index)}: {str(e)}")
+
+                now = time.monotonic()
+                for future, (index, started) in list(in_flight.items()):
+                    if now - started >= file_timeout:
+                        in_flight.pop(future)
+                        restart = True
+                        logger.error(f"Timeout de parsing ({file_timeout}s) dépassé pour {path_of(index)}, fichier ignoré")
+
+                if restart:
+                    # Les workers bloqués ne libèrent pas leur slot : on recrée le pool
+                    # et on resoumet les fichiers encore en cours.
+                    pending.extendleft(sorted((index for index, _ in in_flight.values()), reverse=True))
+                    in_flight.clear()
+                    _terminate_parsing_pool()
+        except BaseException:
+            _terminate_parsing_pool()
+            raise
+
+    return results
+
+
+def batch_load_and_split_document_grouped(filepaths: List[dict], chunk_size: int = 1000, chunk_overlap: int = 100,
+                                          mode: Optional[str] = None, max_workers: Optional[int] = None,
+                                          file_timeout: Optional[float] = None) -> Dict[str, List[Document]]:
+    """
+    Charge et découpe une liste de documents en chunks, regroupés par doc_id.
+
+    Le parsing (PDF, Office, Unstructured, pandas) est CPU-bound : en mode "process" il est
+    réparti sur un pool de processus, avec un timeout par fichier pour qu'un fichier
+    pathologique ne bloque pas tout le lot. Les valeurs par défaut viennent de ingestion.parsing.
 
     Args:
-        filepaths (List[dict]): Liste de dictionnaires contenant tmp_path et metadata des documents à traiter.
-        chunk_size (int, optional): Taille d'un chunk. Default est 500.
+        filepaths (List[dict]): Liste de dictionnaires contenant metadata et soit tmp_path (fichier
+            à charger), soit text (document déjà en mémoire).
+        chunk_size (int, optional): Taille d'un chunk. Default est 1000.
         chunk_overlap (int, optional): Chevauchement entre les chunks. Default est 100.
+        mode (str, optional): "serial" ou "process".
+        max_workers (int, optional): Nombre de processus de parsing (0 = nombre de CPU).
+        file_timeout (float, optional): Durée maximale de parsing d'un fichier, en secondes.
 
     Returns:
-        List[str]: Liste de chunks de tous les documents.
+        Dict[str, List[Document]]: Chunks de chaque document, indexés par doc_id, dans l'ordre
+        des fichiers d'entrée. Les documents sans chunk sont absents du dictionnaire ;
+        le nombre de chunks d'un document est len(grouped[doc_id]).
     """
-    all_chunks = []
-    for file_info in filepaths:
-        tmp_path = file_info.get("tmp_path")
-        metadata = file_info.get("metadata").copy()
-        original_path = metadata.get("path", tmp_path)
-        
+    parsing_config = _get_parsing_config()
+    mode = mode or parsing_config.get("mode", "serial")
+    if max_workers is None:
+        max_workers = parsing_config.get("max_workers", 0)
+    # Les documents en mémoire ne font que du découpage de texte : ils restent dans le
+    # processus courant, seuls les fichiers à charger justifient un passage par le pool.
+    file_indexes = [i for i, file_info in enumerate(filepaths) if "text" not in file_info]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(file_indexes))
+    file_timeout = file_timeout or parsing_config.get("file_timeout", 300)
+
+    results: List[Optional[List[Document]]] = [None] * len(filepaths)
+    if mode == "process" and max_workers > 1:
+        start_method = parsing_config.get("start_method", "spawn")
+        logger.info(f"Parsing de {len(file_indexes)} fichiers sur {max_workers} processus (timeout {file_timeout}s)")
+        pooled = _parse_in_process_pool([filepaths[i] for i in file_indexes], chunk_size, chunk_overlap,
+                                        max_workers, file_timeout, start_method)
+        for index, chunks in zip(file_indexes, pooled):
+            results[index] = chunks
+        inline_indexes = [i for i, file_info in enumerate(filepaths) if "text" in file_info]
+    else:
+        inline_indexes = range(len(filepaths))
+
+    for index in inline_indexes:
+        file_info = filepaths[index]
         try:
-            chunks = load_and_split_document(tmp_path, metadata, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-            
-            if not chunks:
-                logger.warning(f"Aucun chunk généré pour {original_path}")
-            else:
-                all_chunks.extend(chunks)
-                logger.info(f"✓ {len(chunks)} chunks générés pour {original_path}")
-                
+            results[index] = _load_and_split_file(file_info, chunk_size, chunk_overlap)
         except Exception as e:
+            original_path = file_info.get("metadata", {}).get("path", file_info.get("tmp_path"))
             logger.error(f"Erreur lors du traitement du fichier {original_path}: {str(e)}")
-            logger.info(f"Suggestion: Si le PDF est illisible, les méthodes de fallback (PDFMiner + OCR + GPT Vision) seront automatiquement utilisées.")
+            if "text" not in file_info:
+                logger.info(f"Suggestion: Si le PDF est illisible, les méthodes de fallback (PDFMiner + OCR + GPT Vision) seront automatiquement utilisées.")
 
-    
-    return all_chunks
+    grouped: Dict[str, List[Document]] = {}
+    for file_info, chunks in zip(filepaths, results):
+        if chunks is None:
+            continue
+        metadata = file_info.get("metadata")
+        original_path = metadata.get("path", file_info.get("tmp_path"))
+        if not chunks:
+            logger.warning(f"Aucun chunk généré pour {original_path}")
+        else:
+            grouped.setdefault(metadata.get("doc_id"), []).extend(chunks)
+            logger.info(f"✓ {len(chunks)} chunks générés pour {original_path}")
+
+    return grouped
+
+
+def batch_load_and_split_document(filepaths: List[dict], chunk_size: int = 1000, chunk_overlap: int = 100) -> List[Document]:
+    """
+    Charge et découpe une liste de documents en chunks.
+
+    Args:
+        filepaths (List[dict]): Liste de dictionnaires contenant metadata et soit tmp_path (fichier
+            à charger), soit text (document déjà en mémoire).
+        chunk_size (int, optional): Taille d'un chunk. Default est 1000.
+        chunk_overlap (int, optional): Chevauchement entre les chunks. Default est 100.
+
+    Returns:
+        List[Document]: Liste de chunks de tous les documents.
+    """
+    grouped = batch_load_and_split_document_grouped(filepaths, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return [chunk for chunks in grouped.values() for chunk in chunks]
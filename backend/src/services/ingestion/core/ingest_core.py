@@ -5,10 +5,10 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')))
 import traceback
 from src.services.vectorstore.qdrant_manager import VectorStoreManager
-from src.services.ingestion.core.chunking import batch_load_and_split_document
+from src.services.ingestion.core.chunking import batch_load_and_split_document_grouped
 from src.services.storage.file_registry import FileRegistry
 from datetime import datetime
-from src.services.ingestion.core.utils import compute_doc_id, compute_file_content_hash
+from src.services.ingestion.core.utils import compute_doc_id, compute_file_content_hash, compute_text_doc_id
 from src.core.logger import log
 from src.services.db.models import SyncStatus
 
@@ -57,6 +57,216 @@ def flush_batch(batch_documents, user_id, result, file_registry, syncstatus: Syn
         # Clear the batch list for the next batch
         batch_documents.clear()
 
+def select_documents_to_process(batch_documents, file_registry, pending_doc_ids=None):
+    """
+    Filtre les documents inchangés d'après le registre et collecte les anciennes versions à supprimer.
+
+    Les documents sont soit des fichiers {"tmp_path", "metadata"}, soit des documents en
+    mémoire {"text", "metadata"} ; sans doc_id fourni, celui d'un document en mémoire est
+    dérivé de son contenu plutôt que d'un stat du fichier.
+
+    Un doc_id déjà indexé sous un autre chemin (pièce jointe identique dans plusieurs emails),
+    présent plus tôt dans le lot ou en cours de traitement dans un autre lot (pending_doc_ids)
+    n'est pas reparsé : le document devient une simple référence vers les chunks existants.
+    Les chunks d'une ancienne version ne sont supprimés que si plus aucun chemin n'y fait référence.
+    Si un même chemin apparaît plusieurs fois dans le lot, seule sa dernière occurrence est retenue.
+    Un document peut indiquer l'ancien chemin qui l'indexait (legacy_path) : cette entrée est
+    traitée comme une ancienne version, ses chunks supprimés et son entrée retirée du registre.
+
+    Args:
+        batch_documents: Documents du lot
+        file_registry: Registre de fichiers de l'utilisateur
+        pending_doc_ids: doc_ids en cours de traitement par d'autres lots, complété sur place
+
+    Returns:
+        tuple: (documents à traiter, doc_ids des anciennes versions à supprimer,
+        références à enregistrer après l'ingestion du lot)
+    """
+    filepaths_to_process = []
+    references = []
+    old_doc_ids = []
+    changed_paths = set()
+    batch_doc_ids = set()
+    last_index = {document["metadata"].get("path"): index for index, document in enumerate(batch_documents)}
+    for index, document in enumerate(batch_documents):
+        metadata = document["metadata"]
+        original_path = metadata.get("path")
+        if last_index[original_path] != index:
+            logger.info(f"[SKIP] Version plus récente plus loin dans le lot: {original_path}")
+            continue
+        if "text" in document:
+            doc_id = metadata.get("doc_id") or compute_text_doc_id(original_path, document["text"])
+            source = {"text": document["text"]}
+        else:
+            tmp_path = document["tmp_path"]
+            doc_id = metadata.get("doc_id") or compute_doc_id(original_path, os.stat(tmp_path))
+            source = {"tmp_path": tmp_path}
+        metadata["doc_id"] = doc_id
+
+        if file_registry.file_exists(original_path) and not file_registry.has_changed(original_path, doc_id):
+            logger.info(f"[SKIP] Document inchangé: {original_path}")
+            continue
+
+        if file_registry.file_exists(original_path):
+            old_doc_id = file_registry.get_doc_id(original_path)
+            if old_doc_id:
+                old_doc_ids.append(old_doc_id)
+            changed_paths.add(original_path)
+
+        # Ancien schéma de chemin (pièces jointes avant le doc_id par contenu)
+        legacy_path = document.get("legacy_path")
+        if legacy_path and legacy_path != original_path and file_registry.file_exists(legacy_path):
+            legacy_doc_id = file_registry.get_doc_id(legacy_path)
+            if legacy_doc_id:
+                old_doc_ids.append(legacy_doc_id)
+            changed_paths.add(legacy_path)
+        else:
+            legacy_path = None
+
+        shared = (
+            doc_id in batch_doc_ids
+            or (pending_doc_ids is not None and doc_id in pending_doc_ids)
+            or any(path != original_path for path in file_registry.get_paths_by_doc_id(doc_id))
+        )
+        if shared:
+            logger.info(f"[REF] Contenu déjà indexé, référence ajoutée: {original_path}")
+            references.append({"metadata": metadata, "legacy_path": legacy_path})
+            batch_doc_ids.add(doc_id)
+            continue
+
+        batch_doc_ids.add(doc_id)
+        if pending_doc_ids is not None:
+            pending_doc_ids.add(doc_id)
+        filepaths_to_process.append({
+            **source,
+            "metadata": metadata,
+            "legacy_path": legacy_path
+        })
+
+    # Une ancienne version n'est supprimée que si aucun autre chemin ne la référence encore
+    old_doc_ids_to_delete = []
+    for old_doc_id in dict.fromkeys(old_doc_ids):
+        if old_doc_id in batch_doc_ids or set(file_registry.get_paths_by_doc_id(old_doc_id)) - changed_paths:
+            logger.info(f"Ancienne version {old_doc_id} conservée, encore référencée")
+            continue
+        logger.info(f"Suppression ancienne version {old_doc_id}")
+        old_doc_ids_to_delete.append(old_doc_id)
+    return filepaths_to_process, old_doc_ids_to_delete, references
+
+def fill_email_metadata(split_docs):
+    """Complète les métadonnées attendues sur les chunks d'emails."""
+    email_fields = [
+        "sender", "receiver", "cc", "bcc", "subject", "date", 
+        "message_id", "document_type", "source", "content_type",
+        "parent_email_id", "ingestion_date"
+    ]
+    for doc in split_docs:
+        if doc.metadata.get("document_type") == "email":
+            for key in email_fields:
+                doc.metadata.setdefault(key, None)
+            doc.metadata["ingest_date"] = datetime.now().isoformat()
+
+def register_processed_files(file_registry, filepaths_to_process, chunks_by_doc_id, references=()):
+    """
+    Enregistre les fichiers traités et les références de contenu partagé dans le registre,
+    en une seule écriture.
+    Les fichiers sans chunk sont enregistrés comme non embedded pour ne pas être retraités.
+    L'entrée de l'ancien chemin d'un document enregistré (legacy_path) est retirée du registre.
+    """
+    with file_registry.batch():
+        for file_info in filepaths_to_process:
+            doc_id = file_info["metadata"]["doc_id"]
+            # Representative chunk for this file
+            chunks = chunks_by_doc_id.get(doc_id)
+            doc = chunks[0] if chunks else None
+            if doc:
+                metadata = doc.metadata
+            else:
+                logger.warning(f"Aucun chunk à uploader. Mais document non embedded a ne pas traiter pour {file_info['metadata']['path']}")
+                file_info["metadata"]["embedded"] = False
+                file_info["metadata"]["unique_id"] = doc_id
+                metadata = file_info["metadata"]
+            file_registry.add_file(
+                doc_id=doc_id,
+                file_hash=doc_id,
+                source_path=file_info["metadata"]["path"],
+                last_modified=datetime.now().isoformat(),
+                metadata=metadata
+            )
+            if file_info.get("legacy_path"):
+                file_registry.remove_file(file_info["legacy_path"])
+
+        # Les références pointent vers les chunks d'un document du lot ou déjà enregistré.
+        # Sans document de référence (lot en échec ou pas encore upserté), la référence
+        # n'est pas enregistrée pour être retraitée à la prochaine synchronisation.
+        for reference in references:
+            metadata = reference["metadata"]
+            doc_id = metadata["doc_id"]
+            if doc_id in chunks_by_doc_id:
+                embedded = True
+            else:
+                owners = [path for path in file_registry.get_paths_by_doc_id(doc_id) if path != metadata["path"]]
+                owner = file_registry.get_file_info(owners[0]) if owners else None
+                if owner is None:
+                    logger.warning(f"Document de référence absent pour {metadata['path']}, référence non enregistrée")
+                    continue
+                embedded = owner.get("metadata", {}).get("embedded", True)
+            file_registry.add_file(
+                doc_id=doc_id,
+                file_hash=doc_id,
+                source_path=metadata["path"],
+                last_modified=datetime.now().isoformat(),
+                metadata={**metadata, "embedded": embedded}
+            )
+            if reference.get("legacy_path"):
+                file_registry.remove_file(reference["legacy_path"])
+
+def delete_documents_by_paths(paths, file_registry, collection):
+    """
+    Supprime des documents du registre et leurs chunks de Qdrant, sauf les chunks encore
+    référencés par un chemin conservé.
+
+    Args:
+        paths: Chemins des entrées du registre à supprimer
+        file_registry: Registre de fichiers de l'utilisateur
+        collection: Collection Qdrant de l'utilisateur
+
+    Returns:
+        int: Nombre d'entrées du registre supprimées
+    """
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return 0
+    # Comptage de références : les chunks d'un contenu partagé restent tant qu'un autre chemin y pointe
+    removed = set(paths)
+    doc_ids = [
+        doc_id for doc_id in dict.fromkeys(file_registry.get_doc_id(path) for path in paths)
+        if doc_id and not set(file_registry.get_paths_by_doc_id(doc_id)) - removed
+    ]
+    if doc_ids:
+        deleted = get_vector_store_manager(collection).delete_by_doc_ids(doc_ids)
+        logger.info(f"{deleted} chunks supprimés pour {len(paths)} documents")
+    with file_registry.batch():
+        for path in paths:
+            file_registry.remove_file(path)
+    return len(paths)
+
+def delete_documents_by_provider_ids(provider_ids, file_registry, collection):
+    """
+    Propage des suppressions signalées par un fournisseur (message ou fichier supprimé) :
+    retire les chunks de Qdrant et les entrées du registre, pièces jointes comprises.
+
+    Args:
+        provider_ids: Identifiants des éléments supprimés chez le fournisseur
+        file_registry: Registre de fichiers de l'utilisateur
+        collection: Collection Qdrant de l'utilisateur
+
+    Returns:
+        int: Nombre d'entrées du registre supprimées
+    """
+    paths = [path for provider_id in provider_ids for path in file_registry.get_paths_by_provider_id(provider_id)]
+    return delete_documents_by_paths(paths, file_registry, collection)
+
 def batch_ingest_documents(batch_documents, user, collection=None, file_registry=None):
     import time
     timing = {"total_start": time.time(), "steps": {}, "total_duration": 0}
@@ -75,64 +285,37 @@ def batch_ingest_documents(batch_documents, user, collection=None, file_registry
 
     if file_registry is None:
         file_registry = FileRegistry(user)
-        logger.info(f"Nouveau registre de fichiers chargé: {len(file_registry.registry)} entrées")
+        logger.info(f"Nouveau registre de fichiers chargé: {len(file_registry)} entrées")
 
     if collection is None:
         collection = user
     manager = VectorStoreManager(collection)
 
-    filepaths_to_process = []
-    source_paths_to_process = []
-
     record_step_time("document_verification")
-    for document in batch_documents:
-        tmp_path = document["tmp_path"]
-        metadata = document["metadata"]
-        original_path = metadata.get("path")
-        stat = os.stat(tmp_path)
-        doc_id = metadata.get("doc_id") or compute_doc_id(original_path, stat)
-        metadata["doc_id"] = doc_id
+    filepaths_to_process, old_doc_ids_to_delete, references = select_documents_to_process(batch_documents, file_registry)
 
-        if file_registry.file_exists(original_path) and not file_registry.has_changed(original_path, doc_id):
-            logger.info(f"[SKIP] Document inchangé: {original_path}")
-            continue
-
-        if file_registry.file_exists(original_path):
-            old_doc_id = file_registry.get_doc_id(original_path)
-            if old_doc_id:
-                logger.info(f"Suppression ancienne version de {original_path}")
-                manager.delete_by_doc_id(old_doc_id)
-
-        filepaths_to_process.append({
-            "tmp_path": tmp_path,
-            "metadata": metadata
-        })
+    # Une seule suppression filtrée pour toutes les anciennes versions du lot
+    if old_doc_ids_to_delete:
+        record_step_time("document_deletion")
+        deleted = manager.delete_by_doc_ids(old_doc_ids_to_delete)
+        logger.info(f"{deleted} chunks supprimés pour {len(old_doc_ids_to_delete)} anciennes versions")
 
     if not filepaths_to_process:
+        if references:
+            register_processed_files(file_registry, [], {}, references)
         logger.info("Aucun fichier à traiter.")
         return
 
     record_step_time("document_chunking")
     try:
-        split_docs = batch_load_and_split_document(filepaths_to_process)
+        chunks_by_doc_id = batch_load_and_split_document_grouped(filepaths_to_process)
+        split_docs = [chunk for chunks in chunks_by_doc_id.values() for chunk in chunks]
     except Exception as e:
         logger.error(f"Erreur lors du split des documents: {e}")
         return
 
     record_step_time("document_metadata")
-    for doc in split_docs:
-        filepath = doc.metadata.get("path")
-        doc_id = doc.metadata.get("doc_id")
-
-        if doc.metadata.get("document_type") == "email":
-            email_fields = [
-                "sender", "receiver", "cc", "bcc", "subject", "date", 
-                "message_id", "document_type", "source", "content_type",
-                "parent_email_id", "ingestion_date"
-            ]
-            for key in email_fields:
-                doc.metadata.setdefault(key, None)
-            doc.metadata["ingest_date"] = datetime.now().isoformat()
+    fill_email_metadata(split_docs)
 
     if split_docs:
         try:
@@ -144,42 +327,11 @@ def batch_ingest_documents(batch_documents, user, collection=None, file_registry
             logger.error(f"Erreur lors de l'upload: {e}")
 
         record_step_time("document_registry")
-        for file_info in filepaths_to_process:
-            doc_id = file_info["metadata"]["doc_id"]
-            # Find a representative doc for this file
-            doc = next((d for d in split_docs if d.metadata["doc_id"] == file_info["metadata"]["doc_id"]), None)
-            if doc:
-                file_registry.add_file(
-                    doc_id=doc_id,
-                    file_hash=doc_id,
-                    source_path=file_info["metadata"]["path"],
-                    last_modified=datetime.now().isoformat(),
-                    metadata=doc.metadata
-                )
-            else:
-                logger.warning(f"Aucun chunk à uploader. Mais document non embedded a ne pas traiter pour {file_info['tmp_path']}")
-                file_info["metadata"]["embedded"] = False
-                file_info["metadata"]["unique_id"] = doc_id
-                file_registry.add_file(
-                    doc_id=doc_id,
-                    file_hash=doc_id,
-                    source_path=file_info["metadata"]["path"],
-                    last_modified=datetime.now().isoformat(),
-                    metadata=file_info["metadata"]
-                )
+        # Une seule écriture du registre pour tout le lot
+        register_processed_files(file_registry, filepaths_to_process, chunks_by_doc_id, references)
     elif filepaths_to_process:
         logger.info("Aucun chunk à uploader. Mais document non embedded a ne pas traiter")
-        for file_info in filepaths_to_process:
-            doc_id = file_info["metadata"]["doc_id"]
-            file_info["metadata"]["embedded"] = False
-            file_info["metadata"]["unique_id"] = doc_id
-            file_registry.add_file(
-                doc_id=doc_id,
-                file_hash=doc_id,
-                source_path=file_info["metadata"]["path"],
-                last_modified=datetime.now().isoformat(),
-                metadata=file_info["metadata"]
-            )
+        register_processed_files(file_registry, filepaths_to_process, {}, references)
     else:
         logger.warning("Aucun chunk à uploader.")
 
@@ -0,0 +1,386 @@
+"""
+Pipeline d'ingestion en flux : fetch → parse/chunk → embed → upsert.
+
+Chaque étage tourne dans ses propres threads et passe ses lots au suivant par une file
+bornée. La mémoire est donc bornée par la profondeur des files et non par la taille de la
+source, et les étages se recouvrent dans le temps (le lot N est upserté pendant que le lot
+N+1 est encodé et que le lot N+2 est parsé).
+
+Les fournisseurs ne fournissent qu'un générateur de documents {"tmp_path", "metadata"}
+ou {"text", "metadata"} pour un contenu déjà en mémoire (ou de listes de documents, par
+exemple un email et ses pièces jointes).
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')))
+
+import queue
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from src.core.config import CONFIG
+from src.core.logger import log
+from src.services.db.models import SyncStatus
+from src.services.embeddings.embedding_service import EmbeddingService
+from src.services.ingestion.core.chunking import batch_load_and_split_document_grouped
+from src.services.ingestion.core.ingest_core import (
+    fill_email_metadata,
+    get_vector_store_manager,
+    register_processed_files,
+    select_documents_to_process,
+)
+from src.services.storage.file_registry import FileRegistry
+from src.services.vectorstore.qdrant_manager import VectorStoreManager
+
+logger = log.bind(name="src.services.ingestion.core.pipeline")
+
+# Marqueur de fin de flux entre deux étages
+_END = object()
+
+# Intervalle de réveil des threads bloqués sur une file, pour réagir à un arrêt
+_POLL_INTERVAL = 0.5
+
+
+class IngestionPipeline:
+    """
+    Pipeline d'ingestion à étages reliés par des files bornées.
+
+    Étages et concurrence (ingestion.pipeline dans config.yaml) :
+        - fetch : 1 thread, consomme le générateur du fournisseur
+        - parse : parse_workers threads, vérification registre + chunking par lot
+        - embed : embed_workers threads, embeddings des chunks du lot
+        - upsert : thread appelant, suppression des anciennes versions, upsert, registre
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        file_registry: Optional[FileRegistry] = None,
+        collection: Optional[str] = None,
+        syncstatus: Optional[SyncStatus] = None,
+        batch_size: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        parse_workers: Optional[int] = None,
+        embed_workers: Optional[int] = None,
+        delete_files: bool = False,
+        on_batch_ingested: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ):
+        """
+        Initialise le pipeline.
+
+        Args:
+            user_id: Identifiant de l'utilisateur
+            file_registry: Registre de fichiers (créé si absent)
+            collection: Collection Qdrant cible (par défaut user_id)
+            syncstatus: Statut de synchronisation mis à jour après chaque lot
+            batch_size: Nombre de documents par lot
+            queue_size: Nombre de lots en attente entre deux étages
+            parse_workers: Nombre de threads de parsing/chunking
+            embed_workers: Nombre de threads d'embedding
+            delete_files: Supprimer les fichiers temporaires de chaque lot une fois traité
+            on_batch_ingested: Appelé (thread upsert) avec les documents de chaque lot ingéré sans
+                erreur, par exemple pour faire avancer un point de reprise
+        """
+        pipeline_cfg = CONFIG.get("ingestion", {}).get("pipeline", {}) or {}
+        upload_cfg = CONFIG.get("ingestion", {}).get("upload", {}) or {}
+
+        self.user_id = user_id
+        self.collection = collection or user_id
+        self.file_registry = file_registry if file_registry is not None else FileRegistry(user_id)
+        self.syncstatus = syncstatus
+        self.batch_size = batch_size or CONFIG.get("ingestion", {}).get("batch_size", 10)
+        self.queue_size = queue_size or pipeline_cfg.get("queue_size", 4)
+        self.parse_workers = parse_workers or pipeline_cfg.get("parse_workers", 1)
+        self.embed_workers = embed_workers or pipeline_cfg.get("embed_workers", 2)
+        self.batch_linger = pipeline_cfg.get("batch_linger", 1.0)
+        self.max_batch_chars = upload_cfg.get("max_batch_chars", 40000)
+        self.max_batch_docs = upload_cfg.get("max_batch_docs", 64)
+        self.delete_files = delete_files
+        self.on_batch_ingested = on_batch_ingested
+
+        # Documents en attente de parsing, puis lots en attente d'embedding et d'upsert
+        self._documents_queue = queue.Queue(maxsize=self.queue_size * self.batch_size)
+        self._parsed_queue = queue.Queue(maxsize=self.queue_size)
+        self._embedded_queue = queue.Queue(maxsize=self.queue_size)
+
+        self._abort = threading.Event()
+        self._registry_lock = threading.Lock()
+        self._registry_released = threading.Condition(self._registry_lock)
+        # doc_ids parsés par un lot pas encore upserté : un contenu identique dans un lot
+        # suivant devient une référence au lieu d'être parsé et encodé une seconde fois
+        self._pending_doc_ids: set = set()
+        # Chemins sélectionnés par un lot pas encore upserté : un lot qui contient l'un de ces
+        # chemins attend que le registre soit à jour avant de faire sa propre sélection
+        self._pending_paths: set = set()
+        self._stats_lock = threading.Lock()
+        self._running = {"parse": self.parse_workers, "embed": self.embed_workers}
+        self._timings = {"fetch": 0.0, "parse": 0.0, "embed": 0.0, "upsert": 0.0}
+        self._errors: List[str] = []
+
+    # ------------------------------------------------------------------
+    # Files bornées interruptibles
+    # ------------------------------------------------------------------
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """Ajoute un élément à la file, en attendant une place tant que le pipeline n'est pas arrêté."""
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue, timeout: Optional[float] = None) -> Any:
+        """
+        Retire un élément de la file. Retourne _END si le pipeline est arrêté,
+        None si timeout est donné et qu'aucun élément n'est arrivé à temps.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self._abort.is_set():
+            wait = _POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return None
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _add_time(self, stage: str, seconds: float) -> None:
+        with self._stats_lock:
+            self._timings[stage] += seconds
+
+    def _add_error(self, message: str) -> None:
+        logger.error(message)
+        with self._stats_lock:
+            self._errors.append(message)
+
+    def _finish_worker(self, stage: str, next_queue: queue.Queue, consumers: int) -> None:
+        """Le dernier worker d'un étage propage la fin du flux aux workers de l'étage suivant."""
+        with self._stats_lock:
+            self._running[stage] -= 1
+            last = self._running[stage] == 0
+        if last:
+            for _ in range(consumers):
+                self._put(next_queue, _END)
+
+    def _run_stage(self, name: str, target, *args) -> None:
+        """Exécute un worker d'étage ; une erreur inattendue arrête tout le pipeline."""
+        try:
+            target(*args)
+        except Exception as e:
+            self._add_error(f"Erreur inattendue dans l'étage {name} du pipeline: {e}")
+            logger.error(traceback.format_exc())
+            self._abort.set()
+
+    # ------------------------------------------------------------------
+    # Étages
+    # ------------------------------------------------------------------
+
+    def _fetch_stage(self, documents: Iterable[Union[Dict[str, Any], List[Dict[str, Any]]]]) -> None:
+        iterator = iter(documents)
+        try:
+            while not self._abort.is_set():
+                step_start = time.time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    # Le générateur du fournisseur est terminé après une exception
+                    self._add_error(f"Erreur lors de la récupération des documents: {e}")
+                    logger.error(traceback.format_exc())
+                    break
+                finally:
+                    self._add_time("fetch", time.time() - step_start)
+                for document in (item if isinstance(item, list) else [item]):
+                    if not self._put(self._documents_queue, document):
+                        return
+        finally:
+            for _ in range(self.parse_workers):
+                self._put(self._documents_queue, _END)
+
+    def _next_documents(self) -> tuple:
+        """
+        Constitue le prochain lot de documents : attend le premier, puis complète jusqu'à
+        batch_size pendant au plus batch_linger secondes.
+
+        Returns:
+            tuple: (documents du lot, True si la fin du flux a été atteinte)
+        """
+        first = self._get(self._documents_queue)
+        if first is _END:
+            return [], True
+        documents = [first]
+        deadline = time.monotonic() + self.batch_linger
+        while len(documents) < self.batch_size:
+            item = self._get(self._documents_queue, timeout=max(0.0, deadline - time.monotonic()))
+            if item is None:
+                break
+            if item is _END:
+                return documents, True
+            documents.append(item)
+        return documents, False
+
+    def _parse_stage(self) -> None:
+        try:
+            done = False
+            while not done:
+                documents, done = self._next_documents()
+                if not documents:
+                    continue
+                step_start = time.time()
+                batch = {"documents": documents, "files": [], "old_doc_ids": [], "references": [],
+                         "chunks_by_doc_id": {}, "chunks": []}
+                try:
+                    with self._registry_released:
+                        paths = {document["metadata"].get("path") for document in documents}
+                        while paths & self._pending_paths and not self._abort.is_set():
+                            self._registry_released.wait(_POLL_INTERVAL)
+                        batch["files"], batch["old_doc_ids"], batch["references"] = select_documents_to_process(
+                            documents, self.file_registry, self._pending_doc_ids)
+                        self._pending_paths.update(
+                            item["metadata"]["path"] for item in batch["files"] + batch["references"])
+                    if batch["files"]:
+                        batch["chunks_by_doc_id"] = batch_load_and_split_document_grouped(batch["files"])
+                        batch["chunks"] = [chunk for chunks in batch["chunks_by_doc_id"].values() for chunk in chunks]
+                        fill_email_metadata(batch["chunks"])
+                except Exception as e:
+                    batch["error"] = f"Erreur lors du split des documents: {e}"
+                self._add_time("parse", time.time() - step_start)
+                if not self._put(self._parsed_queue, batch):
+                    return
+        finally:
+            self._finish_worker("parse", self._parsed_queue, self.embed_workers)
+
+    def _embed_stage(self, embedder) -> None:
+        try:
+            while True:
+                batch = self._get(self._parsed_queue)
+                if batch is _END:
+                    return
+                if batch["chunks"] and "error" not in batch:
+                    step_start = time.time()
+                    try:
+                        vectors = []
+                        for sub_batch in VectorStoreManager._iter_char_batches(batch["chunks"], self.max_batch_chars, self.max_batch_docs):
+                            vectors.extend(embedder.embed_documents([doc.page_content for doc in sub_batch]))
+                        batch["vectors"] = vectors
+                    except Exception as e:
+                        batch["error"] = f"Erreur lors de l'embedding du lot: {e}"
+                    self._add_time("embed", time.time() - step_start)
+                if not self._put(self._embedded_queue, batch):
+                    return
+        finally:
+            self._finish_worker("embed", self._embedded_queue, 1)
+
+    def _upsert_batch(self, manager: VectorStoreManager, batch: Dict[str, Any], result: Dict[str, Any]) -> None:
+        step_start = time.time()
+        try:
+            if "error" in batch:
+                raise RuntimeError(batch["error"])
+            if batch["old_doc_ids"]:
+                deleted = manager.delete_by_doc_ids(batch["old_doc_ids"])
+                logger.info(f"{deleted} chunks supprimés pour {len(batch['old_doc_ids'])} anciennes versions")
+            if batch["chunks"]:
+                manager.upsert_embedded(batch["chunks"], batch["vectors"])
+            if batch["files"] or batch["references"]:
+                with self._registry_lock:
+                    register_processed_files(self.file_registry, batch["files"], batch["chunks_by_doc_id"], batch["references"])
+
+            if self.on_batch_ingested:
+                self.on_batch_ingested(batch["documents"])
+
+            result["items_ingested"] += len(batch["documents"])
+            logger.info(f"Lot de {len(batch['documents'])} documents ingéré ({len(batch['chunks'])} chunks), total: {result['items_ingested']}")
+            if self.syncstatus:
+                self.syncstatus.update_status("in_progress", result["items_ingested"])
+        except Exception as e:
+            self._add_error(f"Batch error: {e}")
+        finally:
+            result["batches"] = result.get("batches", 0) + 1
+            with self._registry_released:
+                self._pending_doc_ids.difference_update(file_info["metadata"]["doc_id"] for file_info in batch["files"])
+                self._pending_paths.difference_update(
+                    item["metadata"]["path"] for item in batch["files"] + batch["references"])
+                self._registry_released.notify_all()
+            self._add_time("upsert", time.time() - step_start)
+            if self.delete_files:
+                self._delete_files(batch["documents"])
+
+    @staticmethod
+    def _delete_files(documents: List[Dict[str, Any]]) -> None:
+        for document in documents:
+            tmp_path = document.get("tmp_path")
+            try:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+            except OSError as e:
+                logger.warning(f"Erreur lors de la suppression du fichier temporaire {tmp_path}: {e}")
+
+    # ------------------------------------------------------------------
+    # Exécution
+    # ------------------------------------------------------------------
+
+    def run(self, documents: Iterable[Union[Dict[str, Any], List[Dict[str, Any]]]],
+            result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Ingère les documents produits par le générateur du fournisseur.
+
+        Args:
+            documents: Générateur de documents {"tmp_path", "metadata"} ou {"text", "metadata"},
+                ou de listes de documents
+            result: Dictionnaire de résultats du fournisseur, mis à jour sur place
+                (items_ingested, batches, errors)
+
+        Returns:
+            Dict[str, Any]: Le dictionnaire de résultats, avec les durées cumulées par étage
+            sous "pipeline_timings"
+        """
+        if result is None:
+            result = {}
+        result.setdefault("items_ingested", 0)
+        result.setdefault("batches", 0)
+        result.setdefault("errors", [])
+
+        start_time = time.time()
+        manager = get_vector_store_manager(self.collection)
+        manager.ensure_collection_exists()
+        embedder = EmbeddingService()._embedder
+
+        threads = [threading.Thread(target=self._run_stage, args=("fetch", self._fetch_stage, documents),
+                                    name="ingest-fetch", daemon=True)]
+        threads += [threading.Thread(target=self._run_stage, args=("parse", self._parse_stage),
+                                     name=f"ingest-parse-{i}", daemon=True) for i in range(self.parse_workers)]
+        threads += [threading.Thread(target=self._run_stage, args=("embed", self._embed_stage, embedder),
+                                     name=f"ingest-embed-{i}", daemon=True) for i in range(self.embed_workers)]
+        logger.info(f"Pipeline d'ingestion démarré: lots de {self.batch_size}, {self.parse_workers} parse, "
+                    f"{self.embed_workers} embed, {self.queue_size} lots max par file")
+        for thread in threads:
+            thread.start()
+
+        try:
+            # Étage upsert dans le thread appelant : un seul écrivain pour Qdrant et le registre
+            while True:
+                batch = self._get(self._embedded_queue)
+                if batch is _END:
+                    break
+                self._upsert_batch(manager, batch, result)
+        except BaseException:
+            self._abort.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+
+        result["errors"].extend(self._errors)
+        result["pipeline_timings"] = {stage: round(seconds, 3) for stage, seconds in self._timings.items()}
+        result["pipeline_timings"]["total"] = round(time.time() - start_time, 3)
+        logger.info(f"Pipeline d'ingestion terminé: {result['items_ingested']} documents en {result['batches']} lots, "
+                    f"durées cumulées par étage: {result['pipeline_timings']}")
+        return result
@@ -6,6 +6,11 @@ def compute_doc_id(filepath, stat):
     base = f"{filepath}:{stat.st_size}:{stat.st_mtime}"
     return hashlib.sha256(base.encode()).hexdigest()
 
+def compute_text_doc_id(path, text):
+    """doc_id d'un document en mémoire, dérivé de son chemin logique et de son contenu."""
+    base = f"{path}:{text or ''}"
+    return hashlib.sha256(base.encode('utf-8', errors='replace')).hexdigest()
+
 # For file content hashing (for stable doc_id)
 def compute_file_content_hash(filepath):
     with open(filepath, "rb") as fobj:
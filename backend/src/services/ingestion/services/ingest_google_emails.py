@@ -14,18 +14,27 @@ import base64
 import pickle
 import time
 import traceback
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import json
 import email.utils
 import dateutil.parser
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.errors import HttpError
 # Ajouter le chemin du projet pour les imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')))
 
 # Importer les modules nécessaires
 from src.services.ingestion.core.model import Email, EmailAttachment, EmailContent, EmailMetadata
 from src.core.logger import log
-from src.services.ingestion.core.ingest_core import flush_batch
+from src.services.ingestion.core.pipeline import IngestionPipeline
+from src.services.ingestion.core.ingest_core import delete_documents_by_provider_ids
 from src.services.storage.file_registry import FileRegistry
+from src.services.storage.sync_cursors import SyncCursorStore
+from src.core.config import CONFIG
 from src.services.ingestion.core.utils import generate_email_id
 from src.services.db.models import SyncStatus
 from src.services.db.email_manager import EmailManager
@@ -33,9 +42,18 @@ from src.services.db.email_manager import EmailManager
 logger = log.bind(name="src.services.ingestion.services.ingest_gmail_emails")
 
 # --- IMPORTED FROM auth/google_gmail_auth.py ---
-from src.services.auth.google_auth import get_gmail_service
-
-def parse_gmail_message(message: Dict, gmail_service: Any, user: str) -> Optional[Email]:
+from src.services.auth.google_auth import (
+    execute_with_backoff,
+    get_gmail_service,
+    google_backoff_delay,
+    is_retryable_google_error,
+)
+
+# Taille maximale d'une page de messages().list et d'une requête batch Gmail
+GMAIL_LIST_PAGE_SIZE = 500
+GMAIL_MAX_BATCH_SIZE = 100
+
+def parse_gmail_message(message: Dict, gmail_service: Any, user: str, msg: Optional[Dict] = None) -> Optional[Email]:
     """
     Parse un message Gmail en un objet Email.
     
@@ -43,13 +61,15 @@ def parse_gmail_message(message: Dict, gmail_service: Any, user: str) -> Optiona
         message: Message Gmail à parser
         gmail_service: Service Gmail authentifié
         user: Adresse email de l'utilisateur
+        msg: Message complet (format full) déjà récupéré, par exemple par fetch_gmail_messages_batched
         
     Returns:
         Objet Email ou None en cas d'erreur
     """
     try:
         # Récupérer les détails complets du message
-        msg = gmail_service.users().messages().get(userId='me', id=message['id'], format='full').execute()
+        if msg is None:
+            msg = execute_with_backoff(gmail_service.users().messages().get(userId='me', id=message['id'], format='full'))
         
         payload = msg.get('payload', {})
         headers = payload.get('headers', [])
@@ -106,11 +126,11 @@ def parse_gmail_message(message: Dict, gmail_service: Any, user: str) -> Optiona
                     attachment_id = part['body']['attachmentId']
                     
                     # Récupérer le contenu de la pièce jointe
-                    attachment = gmail_service.users().messages().attachments().get(
+                    attachment = execute_with_backoff(gmail_service.users().messages().attachments().get(
                         userId='me',
                         messageId=message['id'],
                         id=attachment_id
-                    ).execute()
+                    ))
                     
                     if 'data' in attachment:
                         content = base64.urlsafe_b64decode(attachment['data'])
@@ -195,6 +215,237 @@ def parse_email_date(date_str):
         logging.error(f"Failed to parse date: '{date_str}'")
         return datetime.datetime.now()
 
+def list_gmail_messages(
+    gmail_service: Any,
+    labels: List[str] = ['INBOX'],
+    limit: int = 10,
+    query: str = None
+) -> List[Dict]:
+    """
+    Liste les messages Gmail correspondant aux critères (identifiants seulement).
+    
+    Args:
+        gmail_service: Service Gmail authentifié
+        labels: Labels Gmail à rechercher (INBOX, SENT, etc.)
+        limit: Nombre maximum de messages
+        query: Requête de recherche Gmail (syntaxe Gmail)
+        
+    Returns:
+        Liste des références de messages ({"id", "threadId"})
+    """
+    # Construire la requête
+    q = query or ""
+    label_query = " OR ".join([f"label:{label}" for label in labels])
+    if label_query:
+        q = f"({q}) AND ({label_query})" if q else label_query
+    
+    # Récupérer les messages correspondant à la requête, page par page (500 au plus par page)
+    messages = []
+    page_token = None
+    while len(messages) < limit:
+        response = execute_with_backoff(gmail_service.users().messages().list(
+            userId='me',
+            q=q,
+            maxResults=min(limit - len(messages), GMAIL_LIST_PAGE_SIZE),
+            pageToken=page_token
+        ))
+        messages.extend(response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    
+    return messages[:limit]
+
+def _get_fetch_config() -> Tuple[int, int, int]:
+    """Taille des lots, nombre de lots concurrents et nombre de tentatives (ingestion.gmail)."""
+    gmail_cfg = CONFIG.get("ingestion", {}).get("gmail", {}) or {}
+    batch_size = min(max(1, gmail_cfg.get("fetch_batch_size", 50)), GMAIL_MAX_BATCH_SIZE)
+    return batch_size, max(1, gmail_cfg.get("fetch_workers", 2)), gmail_cfg.get("fetch_max_retries", 5)
+
+def _execute_gmail_batch(gmail_service: Any, message_ids: List[str], http: Any, max_retries: int) -> Dict[str, Dict]:
+    """
+    Récupère des messages complets par une requête batch Gmail. Les sous-requêtes en erreur
+    transitoire (quota, 5xx) sont renvoyées dans un nouveau batch après une attente.
+    
+    Args:
+        gmail_service: Service Gmail authentifié
+        message_ids: Identifiants des messages (au plus GMAIL_MAX_BATCH_SIZE)
+        http: Transport HTTP propre au thread appelant (None pour celui du service)
+        max_retries: Nombre maximum de nouvelles tentatives
+        
+    Returns:
+        Messages récupérés, par identifiant (les messages en erreur définitive sont absents)
+    """
+    results: Dict[str, Dict] = {}
+    pending = list(message_ids)
+    
+    for attempt in range(max_retries + 1):
+        retry_ids = []
+        
+        def callback(request_id, response, exception):
+            if exception is None:
+                results[request_id] = response
+            elif is_retryable_google_error(exception):
+                retry_ids.append(request_id)
+            else:
+                logger.error(f"Erreur lors de la récupération du message {request_id}: {exception}")
+        
+        batch = gmail_service.new_batch_http_request(callback=callback)
+        for message_id in pending:
+            batch.add(gmail_service.users().messages().get(userId='me', id=message_id, format='full'), request_id=message_id)
+        try:
+            batch.execute(http=http)
+        except HttpError as e:
+            if not is_retryable_google_error(e):
+                raise
+            retry_ids = [message_id for message_id in pending if message_id not in results]
+        
+        if not retry_ids:
+            return results
+        pending = retry_ids
+        if attempt < max_retries:
+            delay = google_backoff_delay(attempt)
+            logger.warning(f"Quota Gmail atteint pour {len(pending)} messages, nouvelle tentative dans {delay:.1f}s")
+            time.sleep(delay)
+    
+    logger.error(f"Abandon de la récupération de {len(pending)} messages après {max_retries} tentatives")
+    return results
+
+def fetch_gmail_messages_batched(
+    gmail_service: Any,
+    messages: List[Dict],
+    batch_size: Optional[int] = None,
+    max_workers: Optional[int] = None
+) -> Iterator[Tuple[Dict, Dict]]:
+    """
+    Récupère le contenu complet des messages par requêtes batch Gmail, plusieurs lots étant
+    en cours à la fois. Au plus max_workers lots sont en avance sur le consommateur.
+    
+    Args:
+        gmail_service: Service Gmail authentifié
+        messages: Références de messages ({"id", ...})
+        batch_size: Nombre de messages par requête batch (par défaut ingestion.gmail.fetch_batch_size, 100 au plus)
+        max_workers: Nombre de lots concurrents (par défaut ingestion.gmail.fetch_workers)
+        
+    Yields:
+        Tuples (référence du message, message complet), dans l'ordre de la liste
+    """
+    default_batch_size, default_workers, max_retries = _get_fetch_config()
+    batch_size = min(batch_size or default_batch_size, GMAIL_MAX_BATCH_SIZE)
+    max_workers = max_workers or default_workers
+    
+    # Le transport httplib2 du service n'est pas thread-safe : un transport autorisé par thread
+    credentials = getattr(getattr(gmail_service, '_http', None), 'credentials', None)
+    local = threading.local()
+    
+    def run_batch(chunk: List[Dict]) -> Dict[str, Dict]:
+        if credentials is not None and not hasattr(local, 'http'):
+            local.http = AuthorizedHttp(credentials, http=httplib2.Http())
+        return _execute_gmail_batch(gmail_service, [m['id'] for m in chunk], getattr(local, 'http', None), max_retries)
+    
+    # Un identifiant ne peut apparaître qu'une fois par batch
+    unique_messages = list({m['id']: m for m in messages}.values())
+    chunks = [unique_messages[i:i + batch_size] for i in range(0, len(unique_messages), batch_size)]
+    if credentials is None:
+        # Sans credentials, les lots partageraient le transport du service avec le consommateur :
+        # récupération séquentielle dans le thread appelant
+        logger.warning("Credentials du service Gmail introuvables, récupération des lots sans concurrence")
+        for chunk in chunks:
+            fetched = run_batch(chunk)
+            yield from ((m, fetched[m['id']]) for m in chunk if m['id'] in fetched)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gmail-fetch") as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append((chunk, executor.submit(run_batch, chunk)))
+            if len(in_flight) >= max_workers:
+                done_chunk, future = in_flight.popleft()
+                fetched = future.result()
+                yield from ((m, fetched[m['id']]) for m in done_chunk if m['id'] in fetched)
+        while in_flight:
+            done_chunk, future = in_flight.popleft()
+            fetched = future.result()
+            yield from ((m, fetched[m['id']]) for m in done_chunk if m['id'] in fetched)
+
+def iter_gmail_emails(gmail_service: Any, user: str, messages: List[Dict]) -> Iterator[Email]:
+    """
+    Récupère (par requêtes batch concurrentes) et parse les messages au fil de la consommation.
+    
+    Args:
+        gmail_service: Service Gmail authentifié
+        user: Adresse email de l'utilisateur
+        messages: Références de messages renvoyées par list_gmail_messages
+        
+    Yields:
+        Objets Email (les messages en erreur sont ignorés)
+    """
+    for msg_data, msg in fetch_gmail_messages_batched(gmail_service, messages):
+        email = parse_gmail_message(msg_data, gmail_service, user, msg=msg)
+        if email:
+            yield email
+
+class GmailHistoryExpiredError(Exception):
+    """L'historyId enregistré n'est plus disponible côté Gmail : une synchronisation complète est nécessaire."""
+
+def list_gmail_history_changes(
+    gmail_service: Any,
+    start_history_id: str,
+    labels: Optional[List[str]] = None
+) -> Tuple[List[Dict], List[str], str]:
+    """
+    Liste les messages ajoutés et supprimés depuis un historyId (users.history.list).
+    
+    Args:
+        gmail_service: Service Gmail authentifié
+        start_history_id: historyId de la dernière synchronisation
+        labels: Ne retenir que les ajouts portant l'un de ces labels (toutes les suppressions sont retenues)
+        
+    Returns:
+        Tuple (références des messages ajoutés, IDs des messages supprimés, nouvel historyId)
+        
+    Raises:
+        GmailHistoryExpiredError: Si l'historique demandé a expiré (HTTP 404)
+    """
+    label_set = set(labels or [])
+    added: Dict[str, Dict] = {}
+    deleted = set()
+    latest_history_id = start_history_id
+    page_token = None
+    
+    while True:
+        try:
+            response = execute_with_backoff(gmail_service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded', 'messageDeleted'],
+                pageToken=page_token
+            ))
+        except HttpError as e:
+            if getattr(e.resp, 'status', None) == 404:
+                raise GmailHistoryExpiredError(f"historyId {start_history_id} expiré") from e
+            raise
+        
+        # Les enregistrements sont chronologiques : le dernier événement d'un message l'emporte
+        for record in response.get('history', []):
+            for item in record.get('messagesAdded', []):
+                message = item.get('message', {})
+                if label_set and not label_set.intersection(message.get('labelIds', [])):
+                    continue
+                added[message['id']] = message
+                deleted.discard(message['id'])
+            for item in record.get('messagesDeleted', []):
+                message_id = item.get('message', {}).get('id')
+                if message_id:
+                    added.pop(message_id, None)
+                    deleted.add(message_id)
+        
+        latest_history_id = response.get('historyId', latest_history_id)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    
+    return list(added.values()), list(deleted), latest_history_id
+
 def fetch_gmail_emails(
     gmail_service: Any,
     user: str,
@@ -216,28 +467,9 @@ def fetch_gmail_emails(
         Tuple contenant la liste des emails et le nombre total d'emails trouvés
     """
     try:
-        # Construire la requête
-        q = query or ""
-        label_query = " OR ".join([f"label:{label}" for label in labels])
-        if label_query:
-            q = f"({q}) AND ({label_query})" if q else label_query
-        
-        # Récupérer les messages correspondant à la requête
-        response = gmail_service.users().messages().list(
-            userId='me',
-            q=q,
-            maxResults=limit
-        ).execute()
-        
-        messages = response.get('messages', [])
+        messages = list_gmail_messages(gmail_service, labels=labels, limit=limit, query=query)
         total_messages = len(messages)
-        
-        # Récupérer et parser chaque message
-        emails = []
-        for msg_data in messages:
-            email = parse_gmail_message(msg_data, gmail_service, user)
-            if email:
-                emails.append(email)
+        emails = list(iter_gmail_emails(gmail_service, user, messages))
         
         logger.info(f"Récupération terminée: {len(emails)}/{total_messages} emails trouvés et parsés")
         return emails, total_messages
@@ -257,11 +489,16 @@ def batch_ingest_gmail_emails_to_qdrant(
     min_date: Optional[datetime.datetime] = None,
     return_count: bool = False,
     batch_size: int = 20,
-    syncstatus: SyncStatus = None
+    syncstatus: SyncStatus = None,
+    incremental: Optional[bool] = None
 ) -> Dict[str, Any]:
     """
     Ingère les emails depuis Gmail vers Qdrant par lots.
     
+    En mode incrémental, seuls les messages ajoutés ou supprimés depuis le dernier historyId
+    enregistré sont traités (users.history.list) ; query, min_date et limit ne s'appliquent
+    qu'aux synchronisations complètes (première synchronisation ou historique expiré).
+    
     Args:
         labels: Liste des labels Gmail à traiter
         limit: Nombre maximum d'emails à ingérer
@@ -274,6 +511,7 @@ def batch_ingest_gmail_emails_to_qdrant(
         return_count: Si True, renvoie uniquement le nombre d'emails ingérés
         batch_size: Nombre de documents à traiter dans chaque lot
         collection: Collection Qdrant cible (par défaut user_id)
+        incremental: Synchronisation incrémentale par historyId (par défaut ingestion.gmail.incremental)
     
     Returns:
         Dictionnaire avec les résultats de l'ingestion
@@ -281,9 +519,11 @@ def batch_ingest_gmail_emails_to_qdrant(
     if verbose:
         logging.getLogger().setLevel(logging.DEBUG)
 
-    # Créer le répertoire temporaire pour les fichiers
-    temp_dir = tempfile.mkdtemp(prefix="gmail_ingest_")
-    logger.info(f"Répertoire temporaire créé: {temp_dir}")
+    # Répertoire temporaire pour les pièces jointes uniquement : les corps d'emails restent en mémoire
+    temp_dir = None
+    if save_attachments:
+        temp_dir = tempfile.mkdtemp(prefix="gmail_ingest_")
+        logger.info(f"Répertoire temporaire créé: {temp_dir}")
 
     # Initialiser le registre de fichiers
     file_registry = FileRegistry(user_id)
@@ -304,11 +544,6 @@ def batch_ingest_gmail_emails_to_qdrant(
         "batches": 0
     }
 
-    start_time = time.time()
-
-    # Liste pour collecter les documents à ingérer par lot
-    batch_documents = []
-    
     # Authentification Gmail
     try:
         gmail_service = get_gmail_service(user_id)
@@ -318,10 +553,13 @@ def batch_ingest_gmail_emails_to_qdrant(
         result["errors"].append(f"Erreur authentification Gmail: {str(e)}")
         return result
 
-    # Récupération du profil utilisateur Gmail
+    # Récupération du profil utilisateur Gmail (son historyId sert de point de reprise
+    # après une synchronisation complète)
+    current_history_id = None
     try:
         profile = gmail_service.users().getProfile(userId='me').execute()
         gmail_user = profile['emailAddress']
+        current_history_id = profile.get('historyId')
         logger.info(f"Utilisateur Gmail authentifié: {gmail_user}")
     except Exception as e:
         logger.error(f"Erreur lors de la récupération du profil Gmail: {e}")
@@ -333,163 +571,209 @@ def batch_ingest_gmail_emails_to_qdrant(
     elif min_date:
         query = f"after:{min_date.strftime('%Y/%m/%d')}"
 
-    # Récupération des emails
-    logger.info(f"Récupération des emails depuis Gmail avec les labels: {labels}")
-    try:
-        emails, total_found = fetch_gmail_emails(
-            gmail_service=gmail_service,
-            user=gmail_user,
-            labels=labels,
-            limit=limit,
-            query=query
-        )
-        
-        result["total_emails_found"] = total_found
-        syncstatus.total_documents = total_found
-        logger.info(f"Nombre d'emails trouvés: {total_found}")
-        
-        if not emails:
-            logger.warning("Aucun email trouvé correspondant aux critères")
-            result["success"] = True  # C'est un succès même s'il n'y a pas d'emails à ingérer
+    if incremental is None:
+        incremental = CONFIG.get("ingestion", {}).get("gmail", {}).get("incremental", False)
+    cursor_store = SyncCursorStore(user_id) if incremental else None
+    start_history_id = cursor_store.get("gmail") if cursor_store and not force_reingest else None
+
+    # Synchronisation incrémentale : uniquement les messages ajoutés/supprimés depuis le dernier historyId
+    messages = None
+    deleted_ids = []
+    if start_history_id:
+        try:
+            messages, deleted_ids, current_history_id = list_gmail_history_changes(gmail_service, start_history_id, labels)
+            result["sync_mode"] = "incremental"
+            logger.info(f"Synchronisation incrémentale depuis l'historyId {start_history_id}: "
+                        f"{len(messages)} messages ajoutés, {len(deleted_ids)} supprimés")
+        except GmailHistoryExpiredError:
+            logger.warning(f"Historique Gmail expiré depuis l'historyId {start_history_id}, synchronisation complète")
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération de l'historique Gmail: {e}")
+            result["errors"].append(f"Erreur historique Gmail: {str(e)}")
             return result
-    except Exception as e:
-        logger.error(f"Erreur lors de la récupération des emails: {e}")
-        result["errors"].append(f"Erreur récupération emails: {str(e)}")
-        return result
 
-    # Traiter chaque email
-    for email_idx, email in enumerate(emails, 1):
+    # Synchronisation complète : liste des messages (identifiants seulement) ; le détail de
+    # chaque message est récupéré au fil du pipeline d'ingestion
+    if messages is None:
+        result["sync_mode"] = "full"
+        logger.info(f"Récupération des emails depuis Gmail avec les labels: {labels}")
         try:
-            # Générer l'identifiant unique de l'email
-            email_id = generate_email_id(email)
-            email_path = f"/google_email/{user_id}/{email.metadata.conversation_id}/{email_id}"
+            messages = list_gmail_messages(
+                gmail_service=gmail_service,
+                labels=labels,
+                limit=limit,
+                query=query
+            )
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération des emails: {e}")
+            result["errors"].append(f"Erreur récupération emails: {str(e)}")
+            return result
 
-            logger.info(f"Préparation de l'email {email_idx}/{len(emails)}: {email.metadata.subject or '(sans sujet)'}")
+    total_found = len(messages)
+    result["total_emails_found"] = total_found
+    if syncstatus:
+        syncstatus.total_documents = total_found
+    logger.info(f"Nombre d'emails trouvés: {total_found}")
 
-            # Stocker l'email en cours de traitement pour suivi
+    # Propagation des suppressions vers Qdrant et le registre
+    if deleted_ids:
+        try:
+            result["deleted_emails"] = delete_documents_by_provider_ids(deleted_ids, file_registry, user_id)
+            logger.info(f"{result['deleted_emails']} documents supprimés pour {len(deleted_ids)} emails supprimés dans Gmail")
+        except Exception as e:
+            logger.error(f"Erreur lors de la suppression des emails supprimés dans Gmail: {e}")
+            result["errors"].append(f"Erreur suppression emails: {str(e)}")
+
+    def fetch_documents():
+        """Prépare les documents de chaque email (corps + pièces jointes) au fil de l'eau."""
+        for email_idx, email in enumerate(iter_gmail_emails(gmail_service, gmail_user, messages), 1):
+            documents = []
             try:
-                with open("/tmp/gmail_ingest_status.json", "w", encoding="utf-8") as f:
-                    json.dump({"subject": email.metadata.subject or "(sans sujet)"}, f)
-            except Exception as e:
-                logger.warning(f"Erreur d'écriture du fichier de statut: {e}")
-
-            # Normaliser le sujet pour les chemins de fichiers
-            email_subject_safe = email.metadata.subject.replace('/', '_').replace('\\', '_') if email.metadata.subject else 'sans_sujet'
-
-            logger.info(f"Folder: {email.metadata.folders} and conversation_id: {email.metadata.conversation_id}")
-
-            # Construire les métadonnées pour l'email
-            metadata = {
-                "doc_id": email_id,
-                "path": email_path,
-                "user": user_id,
-                "filename": f"{email_subject_safe}.eml",
-                "ingestion_type": "google_email",
-                "ingestion_date": datetime.datetime.now().isoformat(),
-                "subject": email.metadata.subject,
-                "sender": email.metadata.sender,
-                "receiver": email.metadata.receiver,
-                "cc": email.metadata.cc,
-                "date": email.metadata.date,
-                "message_id": email.metadata.message_id,
-                "provider_id": email.metadata.provider_id,
-                "has_attachments": bool(email.content.attachments),
-                "gmail_user": gmail_user,
-                "conversation_id": email.metadata.conversation_id,
-                "folder": email.metadata.folders,
-                "body_text": email.content.body_text,
-                
-            }
-
-            # Créer un fichier temporaire pour le contenu de l'email
-            with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".eml", dir=temp_dir) as tmp_file:
-                body_content = email.content.body_html or email.content.body_text or ""
-                tmp_file.write(body_content)
-                tmp_path = tmp_file.name
-
-            # Ajouter le document au lot
-            batch_documents.append({
-                "tmp_path": tmp_path,  # Pour le nettoyage ultérieur
-                "metadata": metadata
-            })
-
-            # Traiter les pièces jointes si activé
-            if save_attachments and email.content.attachments:
-                for att_idx, attachment in enumerate(email.content.attachments, 1):
-                    if not attachment.filename or not attachment.content:
-                        continue
-
-                    # Générer un ID unique pour la pièce jointe
-                    attachment_id = hashlib.md5(f"{email_id}_{attachment.filename}_{att_idx}".encode('utf-8')).hexdigest()
-                    att_path = f"/google_email/{user_id}/{email.metadata.conversation_id}/attachments/{attachment.filename}"
+                # Générer l'identifiant unique de l'email
+                email_id = generate_email_id(email)
+                email_path = f"/google_email/{user_id}/{email.metadata.conversation_id}/{email_id}"
+
+                logger.info(f"Préparation de l'email {email_idx}/{total_found}: {email.metadata.subject or '(sans sujet)'}")
+
+                # Stocker l'email en cours de traitement pour suivi
+                try:
+                    with open("/tmp/gmail_ingest_status.json", "w", encoding="utf-8") as f:
+                        json.dump({"subject": email.metadata.subject or "(sans sujet)"}, f)
+                except Exception as e:
+                    logger.warning(f"Erreur d'écriture du fichier de statut: {e}")
+
+                # Normaliser le sujet pour les chemins de fichiers
+                email_subject_safe = email.metadata.subject.replace('/', '_').replace('\\', '_') if email.metadata.subject else 'sans_sujet'
+
+                logger.info(f"Folder: {email.metadata.folders} and conversation_id: {email.metadata.conversation_id}")
+
+                # Construire les métadonnées pour l'email
+                metadata = {
+                    "doc_id": email_id,
+                    "path": email_path,
+                    "user": user_id,
+                    "filename": f"{email_subject_safe}.eml",
+                    "ingestion_type": "google_email",
+                    "ingestion_date": datetime.datetime.now().isoformat(),
+                    "subject": email.metadata.subject,
+                    "sender": email.metadata.sender,
+                    "receiver": email.metadata.receiver,
+                    "cc": email.metadata.cc,
+                    "date": email.metadata.date,
+                    "message_id": email.metadata.message_id,
+                    "provider_id": email.metadata.provider_id,
+                    "has_attachments": bool(email.content.attachments),
+                    "gmail_user": gmail_user,
+                    "conversation_id": email.metadata.conversation_id,
+                    "folder": email.metadata.folders,
+                    "body_text": email.content.body_text,
+                    "document_type": "email",
+                }
+
+                # Le corps est déjà en mémoire : document passé tel quel au chunking
+                documents.append({
+                    "text": email.content.body_text or "",
+                    "metadata": metadata
+                })
+
+                # Traiter les pièces jointes si activé
+                if save_attachments and email.content.attachments:
+                    for att_idx, attachment in enumerate(email.content.attachments, 1):
+                        if not attachment.filename or not attachment.content:
+                            continue
+
+                        # doc_id dérivé du contenu : une pièce jointe identique dans plusieurs emails
+                        # n'est indexée qu'une fois, chaque email en garde une référence
+                        attachment_id = hashlib.sha256(attachment.content).hexdigest()
+                        att_path = f"{email_path}/attachments/{att_idx}_{attachment.filename}"
                     
-                    # Construire les métadonnées pour la pièce jointe
-                    att_metadata = {
-                        "doc_id": attachment_id,
-                        "path": att_path,
-                        "user": user_id,
-                        "filename": attachment.filename,
-                        "document_type": "email_attachment",
-                        "provider_id": email.metadata.provider_id,
-                        "ingestion_type": "google_email",
-                        "ingestion_date": datetime.datetime.now().isoformat(),
-                        "parent_email_id": email_id,
-                        "content_type": attachment.content_type,
-                        "gmail_user": gmail_user,
-                        "conversation_id": email.metadata.conversation_id,
-                        "folder": email.metadata.folders
-                    }
-
-                    # Créer un fichier temporaire pour la pièce jointe
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(attachment.filename)[1], dir=temp_dir) as att_file:
-                        att_file.write(attachment.content)
-                        att_tmp_path = att_file.name
-
-                    # Ajouter la pièce jointe au lot
-                    batch_documents.append({
-                        "tmp_path": att_tmp_path,  # Pour le nettoyage ultérieur
-                        "metadata": att_metadata,
-                    })
-            # After preparing metadata, save to the email database
-            try:
-                # Parse the email date string into a datetime object
-                parsed_date = parse_email_date(email.metadata.date)
+                        # Construire les métadonnées pour la pièce jointe
+                        att_metadata = {
+                            "doc_id": attachment_id,
+                            "path": att_path,
+                            "user": user_id,
+                            "filename": attachment.filename,
+                            "document_type": "email_attachment",
+                            "provider_id": email.metadata.provider_id,
+                            "ingestion_type": "google_email",
+                            "ingestion_date": datetime.datetime.now().isoformat(),
+                            "parent_email_id": email_id,
+                            "content_type": attachment.content_type,
+                            "gmail_user": gmail_user,
+                            "conversation_id": email.metadata.conversation_id,
+                            "folder": email.metadata.folders
+                        }
+
+                        # Créer un fichier temporaire pour la pièce jointe
+                        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(attachment.filename)[1], dir=temp_dir) as att_file:
+                            att_file.write(attachment.content)
+                            att_tmp_path = att_file.name
+
+                        # Ajouter la pièce jointe au lot
+                        documents.append({
+                            "tmp_path": att_tmp_path,  # Pour le nettoyage ultérieur
+                            "metadata": att_metadata,
+                            # Chemin de la pièce jointe avant le doc_id par contenu, nettoyé à l'enregistrement
+                            "legacy_path": f"/google_email/{user_id}/{email.metadata.conversation_id}/attachments/{attachment.filename}",
+                        })
+                # After preparing metadata, save to the email database
+                try:
+                    # Parse the email date string into a datetime object
+                    parsed_date = parse_email_date(email.metadata.date)
                 
-                email_manager.save_email(
-                    user_id=user_id,
-                    email_id=email.metadata.provider_id,
-                    sender=email.metadata.sender,
-                    recipients=[email.metadata.receiver],  # Convert to list if needed
-                    subject=email.metadata.subject or '',
-                    body=email.content.body_text or '',
-                    html_body=email.content.body_html or '',
-                    sent_date=parsed_date,
-                    source_type="google_email",
-                    conversation_id=email.metadata.conversation_id,
-                    folder=email.metadata.folders
-                )
-                logger.info(f"Email {email_id} saved to database")
-            except Exception as e:
-                logger.error(f"Error saving email to database: {e}")
-
-            # Traiter le lot quand il atteint la taille spécifiée
-            if len(batch_documents) >= batch_size:
-                logger.info(f"Traitement d'un lot de {len(batch_documents)} documents")
-                flush_batch(batch_documents, user_id, result, file_registry, syncstatus)
-                result["batches"] += 1
-
-        except Exception as process_err:
-            logger.error(f"Erreur lors du traitement de l'email: {process_err}")
-            logger.error(f"Trace: {traceback.format_exc()}")
-            result["errors"].append(f"Erreur traitement: {str(process_err)}")
+                    email_manager.save_email(
+                        user_id=user_id,
+                        email_id=email.metadata.provider_id,
+                        sender=email.metadata.sender,
+                        recipients=[email.metadata.receiver],  # Convert to list if needed
+                        subject=email.metadata.subject or '',
+                        body=email.content.body_text or '',
+                        html_body=email.content.body_html or '',
+                        sent_date=parsed_date,
+                        source_type="google_email",
+                        conversation_id=email.metadata.conversation_id,
+                        folder=email.metadata.folders
+                    )
+                    logger.info(f"Email {email_id} saved to database")
+                except Exception as e:
+                    logger.error(f"Error saving email to database: {e}")
+
+            except Exception as process_err:
+                logger.error(f"Erreur lors du traitement de l'email: {process_err}")
+                logger.error(f"Trace: {traceback.format_exc()}")
+                result["errors"].append(f"Erreur traitement: {str(process_err)}")
+                continue
+
+            yield documents
+
+    # Fetch, parsing, embedding et upsert se recouvrent ; la mémoire est bornée par les files du pipeline
+    if messages:
+        pipeline = IngestionPipeline(
+            user_id,
+            file_registry=file_registry,
+            syncstatus=syncstatus,
+            batch_size=batch_size,
+            delete_files=True
+        )
+        try:
+            pipeline.run(fetch_documents(), result)
+        except Exception as e:
+            logger.error(f"Erreur du pipeline d'ingestion: {e}")
+            logger.error(traceback.format_exc())
+            result["errors"].append(f"Erreur pipeline: {str(e)}")
+    else:
+        logger.info("Aucun email à ingérer")
+
+    # Le point de reprise n'avance que si tout a été traité ; sinon la prochaine synchronisation
+    # rejoue les mêmes changements (les documents déjà ingérés sont ignorés par le registre)
+    if cursor_store and current_history_id:
+        if result["errors"]:
+            logger.warning("Erreurs pendant la synchronisation, historyId Gmail non avancé")
+        else:
+            cursor_store.set("gmail", current_history_id)
+            logger.info(f"historyId Gmail enregistré: {current_history_id}")
 
     try:
-        # Traiter les documents restants dans le lot
-        if batch_documents:
-            logger.info(f"Traitement du dernier lot de {len(batch_documents)} documents")
-            flush_batch(batch_documents, user_id, result, file_registry, syncstatus)
-            result["batches"] += 1
-            
         # Nettoyer les fichiers temporaires
         if temp_dir and os.path.exists(temp_dir):
             try:
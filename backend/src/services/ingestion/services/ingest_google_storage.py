@@ -24,7 +24,7 @@ logger = log.bind(name="src.services.ingestion.services.ingest_gdrive_documents"
 
 # Imports internes
 from src.services.auth.google_auth import get_drive_service
-from src.services.ingestion.core.ingest_core import flush_batch
+from src.services.ingestion.core.pipeline import IngestionPipeline
 from src.services.storage.file_registry import FileRegistry
 from src.services.db.models import SyncStatus
 
@@ -325,14 +325,14 @@ def batch_ingest_gdrive_documents(
     
     # Initialiser le registre de fichiers
     file_registry = FileRegistry(user_id)
-    logger.info(f"Registre de fichiers chargé pour {user_id}: {len(file_registry.registry)} entrées")
+    logger.info(f"Registre de fichiers chargé pour {user_id}: {len(file_registry)} entrées")
     
     # Initialiser les statistiques
     start_time = time.time()
     result = {
         "success": False,
         "total_files_found": 0,
-        "items_ingested": 0,  # Utiliser items_ingested pour être cohérent avec flush_batch
+        "items_ingested": 0,  # Utiliser items_ingested pour être cohérent avec les autres sources
         "files_skipped": 0,
         "batches": 0,
         "errors": [],
@@ -340,10 +340,6 @@ def batch_ingest_gdrive_documents(
         "duration": 0
     }
     
-    # Liste pour collecter les documents à ingérer par lot
-    batch_documents = []
-    temp_files_to_cleanup = []
-    
     try:
         # Obtenir le service Google Drive authentifié
         drive_service = get_drive_service(user_id)
@@ -353,7 +349,8 @@ def batch_ingest_gdrive_documents(
         logger.info(f"Récupération des fichiers avec filtre de {days_filter} jours")
         files = fetch_drive_files(drive_service, query, limit, folder_id, days_filter)
         result["total_files_found"] = len(files)
-        syncstatus.total_documents = len(files)
+        if syncstatus:
+            syncstatus.total_documents = len(files)
         if not files:
             logger.info("Aucun fichier trouvé dans Google Drive avec les critères spécifiés")
             result["success"] = True
@@ -361,84 +358,78 @@ def batch_ingest_gdrive_documents(
         
         logger.info(f"Traitement de {len(files)} fichiers Google Drive")
         
-        # Traitement par lot des fichiers Google Drive
-        for file_idx, file_metadata in enumerate(files):
-            try:
-                file_id = file_metadata.get('id')
-                file_name = file_metadata.get('name', 'Fichier sans nom')
-                file_mimetype = file_metadata.get('mimeType', 'application/octet-stream')
-                file_weblink = file_metadata.get('webViewLink', '')
-                file_modified = file_metadata.get('modifiedTime', '')
+        def fetch_documents():
+            """Télécharge les fichiers au fil de l'eau et produit leurs documents."""
+            for file_idx, file_metadata in enumerate(files):
+                try:
+                    file_id = file_metadata.get('id')
+                    file_name = file_metadata.get('name', 'Fichier sans nom')
+                    file_mimetype = file_metadata.get('mimeType', 'application/octet-stream')
+                    file_weblink = file_metadata.get('webViewLink', '')
+                    file_modified = file_metadata.get('modifiedTime', '')
                 
-                # Construire le chemin source normalisé
-                source_path = f"/google_storage/{user_id}/{file_id}/{file_name}"
+                    # Construire le chemin source normalisé
+                    source_path = f"/google_storage/{user_id}/{file_id}/{file_name}"
                 
-                # Générer un hash unique pour ce fichier
-                file_hash = compute_drive_file_hash(file_metadata)
-                doc_id = file_hash
+                    # Générer un hash unique pour ce fichier
+                    file_hash = compute_drive_file_hash(file_metadata)
+                    doc_id = file_hash
                 
-                # Vérifier si le fichier existe déjà dans le registre
-                if not force_reingest and file_registry.file_exists(source_path):
-                    logger.info(f"[SKIP] Fichier déjà ingéré: {file_name} (path: {source_path})")
-                    result['files_skipped'] += 1
-                    continue
+                    # Vérification avant téléchargement : le hash vient des métadonnées du listing,
+                    # un fichier inchangé ne coûte donc aucun transfert
+                    if not force_reingest and not file_registry.has_changed(source_path, doc_id):
+                        logger.info(f"[SKIP] Fichier inchangé: {file_name} (path: {source_path})")
+                        result['files_skipped'] += 1
+                        continue
                 
-                # Log de progression
-                logger.info(f"[{file_idx+1}/{len(files)}] Téléchargement et traitement: {file_name}")
+                    # Log de progression
+                    logger.info(f"[{file_idx+1}/{len(files)}] Téléchargement et traitement: {file_name}")
                 
-                # Télécharger le fichier
-                download_result = download_drive_file(drive_service, file_id, file_metadata)
-                if not download_result:
-                    logger.warning(f"[ERROR] Échec du téléchargement: {file_name}")
-                    result['errors'].append(f"Téléchargement échoué: {file_name}")
-                    continue
+                    # Télécharger le fichier
+                    download_result = download_drive_file(drive_service, file_id, file_metadata)
+                    if not download_result:
+                        logger.warning(f"[ERROR] Échec du téléchargement: {file_name}")
+                        result['errors'].append(f"Téléchargement échoué: {file_name}")
+                        continue
                     
-                temp_file_path, file_content = download_result
-                temp_files_to_cleanup.append(temp_file_path)
+                    temp_file_path, file_content = download_result
                 
-                # Création des métadonnées du document
-                metadata = {
-                    "path": source_path,
-                    "doc_id": doc_id,
-                    "ingestion_type": "google_storage",
-                    "filename": file_name,
-                    "user": user_id,
-                    "ingestion_date": datetime.datetime.now().isoformat()
-                }
-                
-                # Ajouter à la liste de documents à traiter par lot
-                batch_documents.append({
-                    "tmp_path": temp_file_path,
-                    "metadata": metadata
-                })
+                    # Création des métadonnées du document
+                    metadata = {
+                        "path": source_path,
+                        "doc_id": doc_id,
+                        "ingestion_type": "google_storage",
+                        "filename": file_name,
+                        "user": user_id,
+                        "ingestion_date": datetime.datetime.now().isoformat()
+                    }
                 
-                # Traiter le lot si la taille maximale est atteinte
-                if len(batch_documents) >= batch_size:
-                    flush_batch(batch_documents, user_id, result, file_registry,syncstatus)
-                    result["batches"] += 1
-                    logger.info(f"Lot #{result['batches']} traité. Total ingéré: {result['items_ingested']}")
+                    # Le document part dans le pipeline pendant le téléchargement des suivants
+                    document = {
+                        "tmp_path": temp_file_path,
+                        "metadata": metadata
+                    }
                     
-            except Exception as e:
-                error_msg = f"Erreur traitement fichier {file_metadata.get('name', 'inconnu')}: {str(e)}"
-                logger.error(error_msg)
-                logger.error(traceback.format_exc())
-                result["errors"].append(error_msg)
+                except Exception as e:
+                    error_msg = f"Erreur traitement fichier {file_metadata.get('name', 'inconnu')}: {str(e)}"
+                    logger.error(error_msg)
+                    logger.error(traceback.format_exc())
+                    result["errors"].append(error_msg)
+                    continue
+
+                yield document
+
+        # Téléchargement, parsing, embedding et upsert se recouvrent ; chaque fichier
+        # temporaire est supprimé dès que son lot est ingéré
+        pipeline = IngestionPipeline(
+            user_id,
+            file_registry=file_registry,
+            syncstatus=syncstatus,
+            batch_size=batch_size,
+            delete_files=True
+        )
+        pipeline.run(fetch_documents(), result)
         
-        # Traiter le dernier lot s'il reste des documents
-        if batch_documents:
-            logger.info(f"Traitement du dernier lot de {len(batch_documents)} documents")
-            flush_batch(batch_documents, user_id, result, file_registry,syncstatus)
-            result["batches"] += 1
-            
-        # Nettoyer les fichiers temporaires
-        for temp_file in temp_files_to_cleanup:
-            try:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
-                    logger.debug(f"Fichier temporaire supprimé: {temp_file}")
-            except Exception as e:
-                logger.warning(f"Erreur lors de la suppression du fichier temporaire {temp_file}: {e}")
-                
         # Nettoyer le répertoire temporaire
         if temp_dir and os.path.exists(temp_dir):
             try:
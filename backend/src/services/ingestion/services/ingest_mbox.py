@@ -12,8 +12,13 @@ import tempfile
 import json
 import time
 import mailbox
+import itertools
+import multiprocessing
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from email.header import decode_header
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import re
 import base64
 import quopri
@@ -24,11 +29,14 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 # Importer les modules nécessaires
 from src.services.ingestion.services.ingest_google_emails import parse_email_date
-from src.services.ingestion.core.ingest_core import flush_batch
+from src.services.ingestion.core.pipeline import IngestionPipeline
+from src.services.ingestion.core.chunking import _get_parsing_config
 from src.services.storage.file_registry import FileRegistry
+from src.services.storage.sync_cursors import SyncCursorStore
+from src.core.config import CONFIG
 from src.core.logger import log
 from src.services.ingestion.core.model import Email, EmailAttachment, EmailContent, EmailMetadata
-from src.services.ingestion.core.utils import generate_email_id
+from src.services.ingestion.core.utils import compute_file_content_hash, generate_email_id
 from src.services.db.email_manager import EmailManager
 from src.utils.clean_text import clean_body_text
 
@@ -200,6 +208,208 @@ def parse_mbox_message(message, message_id: str, user: str) -> Optional[Email]:
         traceback.print_exc()
         return None
 
+def iter_mbox_messages(mbox_file: str, start_offset: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """
+    Parcourt un fichier MBOX message par message, sans l'indexer en entier (contrairement
+    à len(mailbox.mbox), qui lit tout le fichier pour construire sa table des offsets).
+    
+    Comme mailbox.mbox, chaque ligne commençant par "From " ouvre un nouveau message.
+    
+    Args:
+        mbox_file: Chemin vers le fichier MBOX
+        start_offset: Offset (en octets) du premier message à lire
+        
+    Yields:
+        Tuples (offset de fin du message, contenu brut du message)
+    """
+    with open(mbox_file, 'rb') as f:
+        f.seek(start_offset)
+        position = start_offset
+        lines: List[bytes] = []
+        for line in f:
+            if line.startswith(b'From ') and lines:
+                yield position, _strip_separator(lines)
+                lines = []
+            if lines or line.startswith(b'From '):
+                lines.append(line)
+            position += len(line)
+        if lines:
+            yield position, _strip_separator(lines)
+
+def _strip_separator(lines: List[bytes]) -> bytes:
+    """Retire la ligne vide qui sépare un message du suivant (comme mailbox.mbox)."""
+    if len(lines) > 1 and lines[-1] in (b'\n', b'\r\n'):
+        lines = lines[:-1]
+    return b''.join(lines)
+
+def _mbox_message_id(mbox_file: str, index: int) -> str:
+    """Identifiant d'un message d'après sa position dans le fichier (stable d'une ingestion à l'autre)."""
+    return f"mbox_{os.path.basename(mbox_file)}_{index}"
+
+def _parse_raw_mbox_message(raw: bytes, message_id: str, user: str = "mbox_user") -> Optional[Email]:
+    """
+    Parse le contenu brut d'un message MBOX (exécuté dans un processus du pool de parsing).
+    
+    Args:
+        raw: Contenu brut du message, ligne "From " comprise
+        message_id: ID unique du message
+        user: Adresse email de l'utilisateur
+        
+    Returns:
+        Objet Email ou None si le message est ignoré ou en erreur
+    """
+    from_line, _, body = raw.partition(b'\n')
+    message = mailbox.mboxMessage(body)
+    message.set_from(from_line[5:].decode('ascii', errors='replace').rstrip('\r'))
+    return parse_mbox_message(message, message_id, user)
+
+def _get_mbox_parse_workers() -> int:
+    """Nombre de processus de parsing MBOX (ingestion.mbox.parse_workers, 0 = nombre de CPU)."""
+    workers = CONFIG.get("ingestion", {}).get("mbox", {}).get("parse_workers", 0)
+    return workers or os.cpu_count() or 1
+
+def iter_mbox_parsed(
+    mbox_file: str,
+    limit: int = None,
+    start_offset: int = 0,
+    start_index: int = 0,
+    workers: Optional[int] = None
+) -> Iterator[Tuple[int, int, Optional[Email]]]:
+    """
+    Lit un fichier MBOX au fil de l'eau et parse ses messages dans un pool de processus.
+    
+    Les messages sont produits dans l'ordre du fichier ; au plus 2 × workers messages sont
+    en cours de parsing, la mémoire ne dépend donc pas de la taille du fichier.
+    
+    Args:
+        mbox_file: Chemin vers le fichier MBOX
+        limit: Nombre maximum de messages à lire
+        start_offset: Offset (en octets) du premier message à lire
+        start_index: Index de ce message dans le fichier
+        workers: Nombre de processus de parsing (1 = parsing dans le thread appelant)
+        
+    Yields:
+        Tuples (index du message, offset de fin du message, Email ou None si le message est ignoré)
+    """
+    workers = workers or _get_mbox_parse_workers()
+    file_size = os.path.getsize(mbox_file)
+    logger.info(f"Fichier MBOX ouvert: {mbox_file} ({file_size} octets), lecture à partir de l'offset {start_offset}")
+    
+    messages = iter_mbox_messages(mbox_file, start_offset)
+    if limit:
+        messages = itertools.islice(messages, limit)
+    
+    def log_progress(index: int, end_offset: int) -> None:
+        if (index + 1) % 100 == 0:
+            logger.info(f"Lecture en cours: {index + 1} emails traités ({100 * end_offset / max(file_size, 1):.1f}% du fichier)")
+    
+    if workers <= 1:
+        for index, (end_offset, raw) in enumerate(messages, start_index):
+            yield index, end_offset, _parse_raw_mbox_message(raw, _mbox_message_id(mbox_file, index))
+            log_progress(index, end_offset)
+        return
+    
+    start_method = _get_parsing_config().get("start_method", "spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method)) as pool:
+        in_flight = deque()
+        
+        def next_result() -> Tuple[int, int, Optional[Email]]:
+            index, end_offset, future = in_flight.popleft()
+            try:
+                email = future.result()
+            except Exception as e:
+                logger.error(f"Erreur lors du parsing du message {index}: {e}")
+                email = None
+            log_progress(index, end_offset)
+            return index, end_offset, email
+        
+        for index, (end_offset, raw) in enumerate(messages, start_index):
+            in_flight.append((index, end_offset, pool.submit(_parse_raw_mbox_message, raw, _mbox_message_id(mbox_file, index))))
+            if len(in_flight) >= 2 * workers:
+                yield next_result()
+        while in_flight:
+            yield next_result()
+
+def iter_mbox_emails(mbox_file: str, limit: int = None) -> Iterator[Email]:
+    """
+    Lit un fichier MBOX et produit les emails un par un, sans les garder en mémoire.
+    
+    Args:
+        mbox_file: Chemin vers le fichier MBOX
+        limit: Nombre maximum d'emails à lire
+        
+    Yields:
+        Objets Email (les messages en erreur sont ignorés)
+    """
+    for _, _, email in iter_mbox_parsed(mbox_file, limit):
+        if email is not None:
+            yield email
+
+class MboxCheckpoint:
+    """
+    Point de reprise d'une ingestion MBOX, persisté dans les curseurs de synchronisation :
+    offset (en octets) et index du premier message dont les documents ne sont pas tous ingérés.
+    
+    Les lots pouvant être ingérés dans le désordre, le point de reprise n'avance que sur
+    une suite continue de messages entièrement ingérés.
+    """
+
+    def __init__(self, store: SyncCursorStore, key: str, offset: int = 0, index: int = 0):
+        self.store = store
+        self.key = key
+        self.offset = offset
+        self.index = index
+        self._pending: "OrderedDict[int, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, store: SyncCursorStore, mbox_file: str) -> "MboxCheckpoint":
+        """Charge le point de reprise d'un fichier, en repartant du début s'il ne correspond plus au fichier."""
+        key = os.path.abspath(mbox_file)
+        saved = store.get("mbox", key) or {}
+        offset, index = saved.get("offset", 0), saved.get("index", 0)
+        if offset:
+            with open(mbox_file, 'rb') as f:
+                f.seek(offset)
+                valid = offset <= os.path.getsize(mbox_file) and f.read(5) in (b'From ', b'')
+            if not valid:
+                logger.warning(f"Point de reprise invalide pour {mbox_file} (fichier modifié), lecture depuis le début")
+                offset, index = 0, 0
+        return cls(store, key, offset, index)
+
+    def add(self, index: int, end_offset: int, document_count: int) -> None:
+        """Enregistre un message lu et le nombre de ses documents envoyés au pipeline."""
+        with self._lock:
+            self._pending[index] = [end_offset, document_count]
+            self._advance()
+
+    def on_batch_ingested(self, documents: List[Dict[str, Any]]) -> None:
+        """Callback du pipeline : décompte les documents ingérés et sauvegarde le point de reprise."""
+        with self._lock:
+            for document in documents:
+                index = document.get("mbox_index")
+                if index in self._pending:
+                    self._pending[index][1] -= 1
+            advanced = self._advance()
+        if advanced:
+            self.save()
+
+    def _advance(self) -> bool:
+        advanced = False
+        while self._pending:
+            index, (end_offset, remaining) = next(iter(self._pending.items()))
+            if remaining > 0:
+                break
+            self._pending.popitem(last=False)
+            self.offset, self.index = end_offset, index + 1
+            advanced = True
+        return advanced
+
+    def save(self) -> None:
+        with self._lock:
+            value = {"offset": self.offset, "index": self.index}
+        self.store.set("mbox", value, key=self.key)
+
 def read_mbox_file(mbox_file: str, limit: int = None) -> List[Email]:
     """
     Lit un fichier MBOX et retourne une liste d'objets Email.
@@ -211,31 +421,8 @@ def read_mbox_file(mbox_file: str, limit: int = None) -> List[Email]:
     Returns:
         Liste d'objets Email
     """
-    emails = []
-    
     try:
-        # Ouvrir le fichier MBOX
-        mbox = mailbox.mbox(mbox_file)
-        logger.info(f"Fichier MBOX ouvert: {mbox_file}, {len(mbox)} emails trouvés")
-        
-        # Lire chaque message
-        for idx, message in enumerate(mbox):
-            if limit and idx >= limit:
-                logger.info(f"Limite atteinte: {limit} emails")
-                break
-            
-            # Générer un ID unique pour ce message
-            message_id = f"mbox_{os.path.basename(mbox_file)}_{idx}"
-            
-            # Parser le message
-            email = parse_mbox_message(message, message_id, "mbox_user")
-            if email and email is not None:
-                emails.append(email)
-            
-            # Log progress every 10 emails
-            if (idx + 1) % 100 == 0:
-                logger.info(f"Lecture en cours: {idx + 1}/{len(mbox)} emails traités")
-        
+        emails = list(iter_mbox_emails(mbox_file, limit))
         logger.info(f"Lecture terminée: {len(emails)} emails parsés")
         return emails
     
@@ -326,10 +513,16 @@ def ingest_mbox_to_qdrant(
     min_date: Optional[datetime.datetime] = None,
     batch_size: int = 10,
     return_count: bool = False,
+    resume: Optional[bool] = None,
 ) -> Dict[str, Any]:
     """
     Ingère des emails d'un fichier MBOX dans Qdrant.
     
+    Le fichier est lu au fil de l'eau et ses messages parsés dans un pool de processus
+    (ingestion.mbox.parse_workers). Avec resume, l'ingestion reprend à l'offset du premier
+    message non entièrement ingéré lors de l'exécution précédente, et limit compte les
+    messages lus à partir de cet offset.
+    
     Args:
         mbox_file: Chemin vers le fichier MBOX
         limit: Nombre maximum d'emails à ingérer
@@ -339,6 +532,7 @@ def ingest_mbox_to_qdrant(
         min_date: Date minimale pour filtrer les emails
         batch_size: Taille des lots pour le traitement
         return_count: Si True, retourne le nombre d'emails traités
+        resume: Reprendre au dernier point de reprise (par défaut ingestion.mbox.resume)
         
     Returns:
         Dictionnaire avec les résultats de l'ingestion
@@ -359,13 +553,10 @@ def ingest_mbox_to_qdrant(
     
     # Initialize FileRegistry for this user
     file_registry = FileRegistry(user_id)
-    logger.info(f"File registry loaded for user {user_id}: {len(file_registry.registry)} entries")
+    logger.info(f"File registry loaded for user {user_id}: {len(file_registry)} entries")
     
     # email_manager = EmailManager()
     
-    # Initialize batch for documents
-    batch_documents = []
-    
     try:
         # Vérifier que le fichier MBOX existe
         if not os.path.exists(mbox_file):
@@ -373,155 +564,184 @@ def ingest_mbox_to_qdrant(
         
         logger.info(f"Début de l'ingestion du fichier MBOX: {mbox_file}")
         
-        # Lire les emails du fichier MBOX
-        emails = read_mbox_file(mbox_file, limit)
-        
-        result["total_emails_found"] = len(emails)
-        logger.info(f"Nombre d'emails trouvés: {len(emails)}")
-        
-        # Si aucun email trouvé, terminer
-        if not emails:
-            logger.info("Aucun email trouvé dans le fichier MBOX")
-            result["success"] = True
-            return result
+        # Point de reprise (offset en octets), ignoré si la réingestion est forcée
+        if resume is None:
+            resume = CONFIG.get("ingestion", {}).get("mbox", {}).get("resume", False)
+        checkpoint = MboxCheckpoint.load(SyncCursorStore(user_id), mbox_file) if resume else None
+        if checkpoint and force_reingest:
+            checkpoint.offset, checkpoint.index = 0, 0
+        if checkpoint and checkpoint.offset:
+            logger.info(f"Reprise de l'ingestion à l'offset {checkpoint.offset} (message {checkpoint.index})")
+        result["start_offset"] = checkpoint.offset if checkpoint else 0
         
         # Créer un répertoire temporaire pour les pièces jointes
         temp_dir = None
         if save_attachments:
             temp_dir = tempfile.mkdtemp()
             logger.info(f"Répertoire temporaire pour les pièces jointes: {temp_dir}")
-        # Parcourir chaque email pour la préparation des batch
-        for email_idx, email in enumerate(emails):
-            try:
-                # Filtrer par date si spécifié
-                if min_date:
-                    try:
-                        email_date = parse_email_date(email.metadata.date)
-                        if email_date and email_date < min_date:
-                            logger.debug(f"Email ignoré (trop ancien): {email.metadata.subject}")
-                            result["skipped_emails"] += 1
-                            continue
-                    except Exception as e:
-                        logger.warning(f"Impossible de parser la date de l'email: {e}")
+        
+        def fetch_documents():
+            """Lit le fichier MBOX au fil de l'eau et prépare les documents de chaque email."""
+            parsed = iter_mbox_parsed(
+                mbox_file,
+                limit,
+                start_offset=checkpoint.offset if checkpoint else 0,
+                start_index=checkpoint.index if checkpoint else 0
+            )
+            for email_idx, end_offset, email in parsed:
+                documents = []
+                if email is None:
+                    # Message ignoré (corps trop court, expéditeur exclu ou erreur de parsing)
+                    if checkpoint:
+                        checkpoint.add(email_idx, end_offset, 0)
+                    continue
+                result["total_emails_found"] += 1
+                try:
+                    # Filtrer par date si spécifié
+                    if min_date:
+                        try:
+                            email_date = parse_email_date(email.metadata.date)
+                            if email_date and email_date < min_date:
+                                logger.debug(f"Email ignoré (trop ancien): {email.metadata.subject}")
+                                result["skipped_emails"] += 1
+                                if checkpoint:
+                                    checkpoint.add(email_idx, end_offset, 0)
+                                continue
+                        except Exception as e:
+                            logger.warning(f"Impossible de parser la date de l'email: {e}")
                 
-                # Générer un ID unique pour l'email
-                email_id = generate_email_id(email)
-                email.metadata.doc_id = email_id
+                    # Générer un ID unique pour l'email
+                    email_id = generate_email_id(email)
+                    email.metadata.doc_id = email_id
                 
-                # Vérifier si l'email existe déjà dans le registre
-                source_path = f"/mbox/{user_id}/{email.metadata.conversation_id}/{email_id}"
+                    # Vérifier si l'email existe déjà dans le registre
+                    source_path = f"/mbox/{user_id}/{email.metadata.conversation_id}/{email_id}"
                 
-                # Créer un fichier temporaire avec le contenu de l'email
-                with tempfile.NamedTemporaryFile(mode='w+', suffix='.eml', delete=False) as temp_file:
-                    # Écrire le contenu de l'email dans le fichier temporaire
-                    temp_file.write(email.content.body_text or email.content.body_html or "")
-                    filepath = temp_file.name
                 
-                # Préparer les métadonnées
-                metadata = {
-                    "doc_id": email_id,
-                    "path": source_path,
-                    "user": user_id,
-                    "filename": f"{email.metadata.subject or 'No subject'}.eml",
-                    "sender": email.metadata.sender,
-                    "receiver": email.metadata.receiver,
-                    "cc": email.metadata.cc,
-                    "bcc": email.metadata.bcc,
-                    "subject": email.metadata.subject,
-                    "body_text": email.content.body_text,
-                    "date": email.metadata.date,
-                    "provider_id": email.metadata.provider_id,
-                    "has_attachments": email.metadata.has_attachments,
-                    "content_type": "text/plain",
-                    "ingestion_date": datetime.datetime.now().isoformat(),
-                    "ingestion_type": "mbox",
-                    "conversation_id": email.metadata.conversation_id,
-                    "folder": "mbox"
-                }
+                    # Préparer les métadonnées
+                    metadata = {
+                        "doc_id": email_id,
+                        "path": source_path,
+                        "user": user_id,
+                        "filename": f"{email.metadata.subject or 'No subject'}.eml",
+                        "sender": email.metadata.sender,
+                        "receiver": email.metadata.receiver,
+                        "cc": email.metadata.cc,
+                        "bcc": email.metadata.bcc,
+                        "subject": email.metadata.subject,
+                        "body_text": email.content.body_text,
+                        "date": email.metadata.date,
+                        "provider_id": email.metadata.provider_id,
+                        "has_attachments": email.metadata.has_attachments,
+                        "content_type": "text/plain",
+                        "ingestion_date": datetime.datetime.now().isoformat(),
+                        "ingestion_type": "mbox",
+                        "conversation_id": email.metadata.conversation_id,
+                        "folder": "mbox",
+                        "document_type": "email"
+                    }
                 
-                # Ajouter le document au batch
-                batch_documents.append({
-                    "tmp_path": filepath,
-                    "metadata": metadata
-                })
+                    # Ajouter le document au batch : le corps est déjà en mémoire
+                    documents.append({
+                        "text": email.content.body_text or "",
+                        "metadata": metadata
+                    })
                 
-                # Log progress every 5 emails
-                if email_idx % 5 == 0:
-                    logger.info(f"[{email_idx+1}/{len(emails)}] Préparation des emails pour ingestion")
+                    # Log progress every 5 emails
+                    if email_idx % 5 == 0:
+                        logger.info(f"[{email_idx+1}] Préparation des emails pour ingestion")
                 
-                # Traitement des pièces jointes
-                if save_attachments and email.content.attachments and temp_dir:
-                    attachment_paths = save_mbox_attachments(email, temp_dir)
+                    # Traitement des pièces jointes
+                    if save_attachments and email.content.attachments and temp_dir:
+                        attachment_paths = save_mbox_attachments(email, temp_dir)
                     
-                    for idx, attachment_path in enumerate(attachment_paths):
-                        # Nom du fichier de la pièce jointe
-                        attachment_name = os.path.basename(attachment_path)
+                        for idx, attachment_path in enumerate(attachment_paths):
+                            # Nom du fichier de la pièce jointe
+                            attachment_name = os.path.basename(attachment_path)
                         
-                        # Générer un ID unique pour la pièce jointe
-                        attachment_id = hashlib.md5(f"{email_id}_{attachment_name}_{idx}".encode('utf-8')).hexdigest()
+                            # doc_id dérivé du contenu : une pièce jointe identique dans plusieurs emails
+                            # n'est indexée qu'une fois, chaque email en garde une référence
+                            attachment_id = compute_file_content_hash(attachment_path)
                         
-                        # Métadonnées pour la pièce jointe
-                        attachment_metadata = {
-                            "doc_id": attachment_id,
-                            "path": f"/mbox/{user_id}/{email.metadata.conversation_id}/attachments/{attachment_name}",
-                            "user": user_id,
-                            "filename": attachment_name,
-                            "provider_id": email.metadata.provider_id,
-                            "parent_email_id": email_id,
-                            "subject": email.metadata.subject,
-                            "date": email.metadata.date,
-                            "sender": email.metadata.sender,
-                            "receiver": email.metadata.receiver,
-                            "content_type": "attachment",
-                            "ingestion_date": datetime.datetime.now().isoformat(),
-                            "ingestion_type": "mbox_attachment",
-                            "conversation_id": email.metadata.conversation_id,
-                            "folder": "mbox"
-                        }
+                            # Métadonnées pour la pièce jointe
+                            attachment_metadata = {
+                                "doc_id": attachment_id,
+                                "path": f"{source_path}/attachments/{idx}_{attachment_name}",
+                                "user": user_id,
+                                "filename": attachment_name,
+                                "document_type": "email_attachment",
+                                "provider_id": email.metadata.provider_id,
+                                "parent_email_id": email_id,
+                                "subject": email.metadata.subject,
+                                "date": email.metadata.date,
+                                "sender": email.metadata.sender,
+                                "receiver": email.metadata.receiver,
+                                "content_type": "attachment",
+                                "ingestion_date": datetime.datetime.now().isoformat(),
+                                "ingestion_type": "mbox_attachment",
+                                "conversation_id": email.metadata.conversation_id,
+                                "folder": "mbox"
+                            }
                         
-                        # Ajouter la pièce jointe au batch
-                        batch_documents.append({
-                            "tmp_path": attachment_path,
-                            "metadata": attachment_metadata
-                        })
+                            # Ajouter la pièce jointe au batch
+                            documents.append({
+                                "tmp_path": attachment_path,
+                                "metadata": attachment_metadata,
+                                # Chemin de la pièce jointe avant le doc_id par contenu, nettoyé à l'enregistrement
+                                "legacy_path": f"/mbox/{user_id}/{email.metadata.conversation_id}/attachments/{attachment_name}"
+                            })
                         
-                        result["ingested_attachments"] += 1
+                            result["ingested_attachments"] += 1
                 
-                # # After preparing metadata, save to the email database
-                # try:
-                #     # Parse the email date string into a datetime object
-                #     parsed_date = parse_email_date(email.metadata.date)
+                    # # After preparing metadata, save to the email database
+                    # try:
+                    #     # Parse the email date string into a datetime object
+                    #     parsed_date = parse_email_date(email.metadata.date)
                     
-                #     email_manager.save_email(
-                #         user_id=user_id,
-                #         email_id=email.metadata.provider_id,
-                #         sender=email.metadata.sender,
-                #         recipients=[email.metadata.receiver] if email.metadata.receiver else [],
-                #         subject=email.metadata.subject or '',
-                #         body=email.content.body_text or '',
-                #         sent_date=parsed_date,
-                #         source_type="mbox",
-                #         conversation_id=email.metadata.conversation_id,
-                #         folder="mbox"
-                #     )
-                # except Exception as e:
-                #     logger.error(f"Error saving email to database: {e}")
+                    #     email_manager.save_email(
+                    #         user_id=user_id,
+                    #         email_id=email.metadata.provider_id,
+                    #         sender=email.metadata.sender,
+                    #         recipients=[email.metadata.receiver] if email.metadata.receiver else [],
+                    #         subject=email.metadata.subject or '',
+                    #         body=email.content.body_text or '',
+                    #         sent_date=parsed_date,
+                    #         source_type="mbox",
+                    #         conversation_id=email.metadata.conversation_id,
+                    #         folder="mbox"
+                    #     )
+                    # except Exception as e:
+                    #     logger.error(f"Error saving email to database: {e}")
                 
-                # Procéder par lots de batch_size documents
-                if len(batch_documents) >= batch_size:
-                    flush_batch(batch_documents, user_id, result, file_registry)
-                    result["batches"] += 1
-                    
-            except Exception as e:
-                error_msg = f"Erreur lors de la préparation de l'email {email.metadata.subject}: {str(e)}"
-                logger.error(error_msg)
-                result["errors"].append(error_msg)
-        
-        # Traiter les documents restants dans le batch
-        if batch_documents:
-            logger.info(f"Traitement du dernier lot de {len(batch_documents)} documents")
-            flush_batch(batch_documents, user_id, result, file_registry)
-            result["batches"] += 1
+                except Exception as e:
+                    error_msg = f"Erreur lors de la préparation de l'email {email.metadata.subject}: {str(e)}"
+                    logger.error(error_msg)
+                    result["errors"].append(error_msg)
+                    if checkpoint:
+                        checkpoint.add(email_idx, end_offset, 0)
+                    continue
+
+                if checkpoint:
+                    for document in documents:
+                        document["mbox_index"] = email_idx
+                    checkpoint.add(email_idx, end_offset, len(documents))
+                yield documents
+
+        # Lecture, parsing, embedding et upsert se recouvrent ; la mémoire est bornée par les
+        # files du pipeline et non par la taille du fichier MBOX
+        pipeline = IngestionPipeline(
+            user_id,
+            file_registry=file_registry,
+            batch_size=batch_size,
+            delete_files=True,
+            on_batch_ingested=checkpoint.on_batch_ingested if checkpoint else None
+        )
+        pipeline.run(fetch_documents(), result)
+        logger.info(f"Nombre d'emails trouvés: {result['total_emails_found']}")
+        if checkpoint:
+            checkpoint.save()
+            result["end_offset"] = checkpoint.offset
+            logger.info(f"Point de reprise enregistré: offset {checkpoint.offset} (message {checkpoint.index})")
         
         # Nettoyer le répertoire temporaire
         if temp_dir and os.path.exists(temp_dir):
@@ -532,8 +752,8 @@ def ingest_mbox_to_qdrant(
             except Exception as cleanup_err:
                 logger.warning(f"Erreur lors du nettoyage du répertoire temporaire: {cleanup_err}")
         
-        # Marquer comme succès même s'il y a des erreurs individuelles
-        result["success"] = result["items_ingested"] > 0 or result["ingested_attachments"] > 0
+        # Marquer comme succès même s'il y a des erreurs individuelles (ou si le fichier est vide)
+        result["success"] = result["items_ingested"] > 0 or result["ingested_attachments"] > 0 or result["total_emails_found"] == 0
         
     except Exception as e:
         error_msg = f"Erreur globale lors de l'ingestion du fichier MBOX: {str(e)}"
@@ -9,10 +9,9 @@ import hashlib
 import argparse
 import datetime
 import tempfile
-import base64
 import json
 import time
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Callable, List, Dict, Any, Iterator, Optional, Tuple
 import msal
 import requests
 
@@ -21,27 +20,41 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 # Importer les modules nécessaires
 from src.services.ingestion.services.ingest_google_emails import parse_email_date
-from src.services.ingestion.core.ingest_core import flush_batch
+from src.services.ingestion.core.pipeline import IngestionPipeline
+from src.services.ingestion.core.chunking import SUPPORTED_EXTS
+from src.services.ingestion.core.ingest_core import delete_documents_by_paths, delete_documents_by_provider_ids
 from src.services.storage.file_registry import FileRegistry
+from src.services.storage.sync_cursors import SyncCursorStore
+from src.core.config import CONFIG
 from src.core.logger import log
 from src.services.auth.microsoft_auth import get_outlook_service
 from src.services.ingestion.core.model import Email, EmailAttachment, EmailContent, EmailMetadata
-from src.services.ingestion.core.utils import generate_email_id
+from src.services.ingestion.core.utils import compute_file_content_hash, generate_email_id
 from src.services.db.models import SyncStatus
 from src.services.db.email_manager import EmailManager
 # Utiliser le logger centralisé avec un nom spécifique pour ce module
 logger = log.bind(name="src.services.ingestion.services.ingest_outlook_emails")
 # Définir la portée de l'accès à Outlook/Microsoft Graph
 GRAPH_API_ENDPOINT = 'https://graph.microsoft.com/v1.0'
+# Champs des messages récupérés lors du listage (sans le contenu des pièces jointes)
+OUTLOOK_MESSAGE_FIELDS = 'id,subject,from,toRecipients,ccRecipients,bccRecipients,receivedDateTime,hasAttachments,internetMessageId,body,conversationId'
+# Identifiants immuables : l'ID d'un message ne change pas quand il est déplacé de dossier,
+# les provider_id du registre et les @removed du delta restent comparables
+OUTLOOK_ID_TYPE_PREFERENCE = 'IdType="ImmutableId"'
+# Identifiants traduits par requête translateExchangeIds (1000 au plus)
+TRANSLATE_IDS_BATCH_SIZE = 1000
 
-def parse_outlook_message(message: Dict, access_token: str, user: str, folder: str) -> Optional[Email]:
+def parse_outlook_message(message: Dict, user: str, folder: str) -> Optional[Email]:
     """
     Parse un message Outlook en un objet Email.
     
+    Les pièces jointes ne sont pas récupérées : seul hasAttachments est reporté dans les
+    métadonnées, leur contenu étant téléchargé à la demande (download_outlook_attachments).
+    
     Args:
         message: Message Outlook à parser
-        access_token: Token d'accès Microsoft Graph
         user: Adresse email de l'utilisateur
+        folder: Dossier Outlook du message
         
     Returns:
         Objet Email ou None en cas d'erreur
@@ -63,7 +76,8 @@ def parse_outlook_message(message: Dict, access_token: str, user: str, folder: s
             date=message.get('receivedDateTime', None),
             source="microsoft_email",
             conversation_id=message.get('conversationId', None),
-            folders=folder
+            folders=folder,
+            has_attachments=bool(message.get('hasAttachments', False))
         )
         
         # Récupérer le contenu du message
@@ -83,38 +97,11 @@ def parse_outlook_message(message: Dict, access_token: str, user: str, folder: s
             else:
                 body_text = message['body'].get('content', '')
         
-        # Récupérer les pièces jointes
-        attachments = []
-        
-        if 'hasAttachments' in message and message['hasAttachments']:
-            try:
-                # Récupérer les pièces jointes via l'API Graph
-                headers = {
-                    'Authorization': f'Bearer {access_token}',
-                    'Content-Type': 'application/json'
-                }
-                
-                attachment_url = f"{GRAPH_API_ENDPOINT}/me/messages/{message['id']}/attachments"
-                response = requests.get(attachment_url, headers=headers)
-                
-                if response.status_code == 200:
-                    attachment_data = response.json()
-                    for attachment in attachment_data.get('value', []):
-                        if 'contentBytes' in attachment:
-                            content = base64.b64decode(attachment['contentBytes'])
-                            attachments.append(EmailAttachment(
-                                filename=attachment.get('name', 'sans-nom'),
-                                content=content,
-                                content_type=attachment.get('contentType', 'application/octet-stream')
-                            ))
-            except Exception as e:
-                logger.warning(f"Erreur lors de la récupération des pièces jointes: {e}")
-        
         # Créer l'objet de contenu de l'email
         content = EmailContent(
             body_text=body_text,
             body_html=body_html,
-            attachments=attachments
+            attachments=[]
         )
         
         # Créer et retourner l'objet Email complet
@@ -124,138 +111,377 @@ def parse_outlook_message(message: Dict, access_token: str, user: str, folder: s
         logger.error(f"Erreur lors du parsing du message {message.get('id', 'inconnu')}: {e}")
         return None
 
-def fetch_outlook_emails(
+def iter_outlook_emails(
     access_token: str,
     user: str,
     folders: List[str] = ['inbox'],
     limit: int = 10,
     query: str = None
-) -> Tuple[List[Email], int]:
+) -> Iterator[Email]:
     """
-    Récupère les emails d'Outlook en fonction des critères spécifiés.
+    Récupère et parse les emails d'Outlook au fil de la consommation, dossier par dossier.
     
     Args:
         access_token: Token d'accès Microsoft Graph
         user: Adresse email de l'utilisateur
         folders: Dossiers Outlook à rechercher (inbox, drafts, sentitems, etc.)
-        limit: Nombre maximum d'emails à récupérer
+        limit: Nombre maximum d'emails à récupérer par dossier
         query: Requête de recherche Outlook (OData)
     
-    Returns:
-        Tuple contenant la liste des emails et le nombre total d'emails trouvés
+    Yields:
+        Objets Email (les messages en erreur sont ignorés)
     """
-    try:
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            #'Accept': 'application/json',
-            'Content-Type': 'application/json'
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        #'Accept': 'application/json',
+        'Content-Type': 'application/json',
+        'Prefer': OUTLOOK_ID_TYPE_PREFERENCE
+    }
+    
+    # Parcourir chaque dossier demandé
+    for folder in folders:
+        # Construire la requête
+        endpoint = f"{GRAPH_API_ENDPOINT}/me/mailFolders/{folder}/messages"
+        params = {
+            '$top': min(limit, 50),  # Max 50 par requête API
+            # Sans $expand=attachments : le contenu des pièces jointes n'est téléchargé
+            # que pour les emails nouveaux ou modifiés
+            '$select': OUTLOOK_MESSAGE_FIELDS
+            #'$orderby': 'receivedDateTime desc',  # Plus récent d'abord
         }
         
-        emails = []
-        total_messages = 0
+        if query:
+            params['$filter'] = query
         
-        # Parcourir chaque dossier demandé
-        for folder in folders:
-            # Construire la requête
-            endpoint = f"{GRAPH_API_ENDPOINT}/me/mailFolders/{folder}/messages"
-            params = {
-                '$top': min(limit, 50),  # Max 50 par requête API
-                '$expand': 'attachments'
-                #'$orderby': 'receivedDateTime desc',  # Plus récent d'abord
-                #'$select': 'id,subject,from,toRecipients,ccRecipients,bccRecipients,receivedDateTime,bodyPreview,hasAttachments,internetMessageId,body,conversationId'
-            }
-            
-            if query:
-                params['$filter'] = query
-            
-            # Exécuter la requête
+        # Parcourir les pages (@odata.nextLink) jusqu'à la limite du dossier
+        fetched = 0
+        while endpoint and fetched < limit:
             try:
                 response = requests.get(endpoint, headers=headers, params=params)
                 response.raise_for_status()  # Déclencher une exception si la requête échoue
-                
-                messages = response.json().get('value', [])
-                total_messages += len(messages)
-                
-                # Parser chaque message
-                for message in messages:
-                    email = parse_outlook_message(message, access_token, user, folder)
-                    if email:
-                        emails.append(email)
-                        
+                data = response.json()
             except requests.exceptions.RequestException as e:
                 logger.error(f"Erreur lors de la récupération des emails depuis {folder}: {str(e)}")
-                continue
+                break
+            # Le nextLink contient déjà les paramètres de la requête
+            endpoint, params = data.get('@odata.nextLink'), None
+            
+            # Parser chaque message
+            for message in data.get('value', [])[:limit - fetched]:
+                fetched += 1
+                email = parse_outlook_message(message, user, folder)
+                if email:
+                    yield email
+
+class GraphDeltaExpiredError(Exception):
+    """Le lien delta enregistré n'est plus valide côté Microsoft Graph (HTTP 410)."""
+
+def iter_graph_delta(
+    initial_url: str,
+    headers: Dict[str, str],
+    state: Dict[str, Any],
+    params: Optional[Dict[str, Any]] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    keep: Optional[Callable[[Dict], bool]] = None
+) -> Iterator[Dict]:
+    """
+    Parcourt une requête delta Microsoft Graph page par page (@odata.nextLink) et produit
+    les éléments ajoutés ou modifiés depuis le curseur.
+    
+    Le parcours part du curseur enregistré, ou de initial_url pour une synchronisation complète
+    (première synchronisation ou curseur expiré). À la fin du parcours, state contient :
+        - removed : IDs des éléments supprimés (@removed pour les messages, facette deleted pour les fichiers)
+        - cursor : le @odata.deltaLink, ou le @odata.nextLink de la page suivante si limit a été
+          atteint (la synchronisation suivante reprend alors à cette page)
+        - full_sync : True si le parcours est parti de initial_url
+    
+    Args:
+        initial_url: URL de la requête delta initiale (.../delta)
+        headers: En-têtes HTTP (token d'accès)
+        state: Dictionnaire rempli au fil du parcours
+        params: Paramètres de la requête initiale ($select, $filter...)
+        cursor: deltaLink ou nextLink enregistré lors de la synchronisation précédente
+        limit: Nombre d'éléments au-delà duquel le parcours s'arrête en fin de page
+        keep: Filtre des éléments ajoutés ou modifiés à produire
+        
+    Yields:
+        Éléments ajoutés ou modifiés
+    """
+    state["removed"] = []
+    state["cursor"] = None
+    state["full_sync"] = not cursor
+    url, page_params = (cursor, None) if cursor else (initial_url, params)
+    produced = 0
+    
+    while url:
+        response = requests.get(url, headers=headers, params=page_params)
+        if response.status_code == 410:
+            if not cursor:
+                raise GraphDeltaExpiredError(f"Requête delta refusée: {response.text}")
+            # Jeton de synchronisation expiré : nouvelle synchronisation complète
+            logger.warning("Lien delta Microsoft Graph expiré, synchronisation complète")
+            cursor = None
+            state["full_sync"] = True
+            url, page_params = initial_url, params
+            continue
+        response.raise_for_status()
+        data = response.json()
+        
+        for item in data.get('value', []):
+            if '@removed' in item or 'deleted' in item:
+                state["removed"].append(item['id'])
+            elif keep is None or keep(item):
+                produced += 1
+                yield item
         
-        logger.info(f"Récupération terminée: {len(emails)}/{total_messages} emails trouvés et parsés")
-        return emails, total_messages
+        # Le nextLink contient déjà les paramètres de la requête ; la dernière page porte le deltaLink
+        next_link = data.get('@odata.nextLink')
+        state["cursor"] = data.get('@odata.deltaLink') or next_link
+        url, page_params = next_link, None
+        if limit and produced >= limit:
+            break
+
+def iter_outlook_delta_emails(
+    access_token: str,
+    user: str,
+    folder: str,
+    state: Dict[str, Any],
+    delta_link: Optional[str] = None,
+    limit: Optional[int] = None,
+    date_filter: Optional[str] = None
+) -> Iterator[Email]:
+    """
+    Récupère et parse les emails ajoutés ou modifiés d'un dossier Outlook depuis le dernier
+    lien delta (/mailFolders/{folder}/messages/delta).
+    
+    Args:
+        access_token: Token d'accès Microsoft Graph
+        user: Adresse email de l'utilisateur
+        folder: Dossier Outlook (inbox, sentitems, etc.)
+        state: Rempli par iter_graph_delta (removed, cursor, full_sync)
+        delta_link: Lien delta enregistré (None pour une synchronisation complète)
+        limit: Nombre maximum d'emails à récupérer (arrondi à la page)
+        date_filter: Filtre receivedDateTime de la synchronisation complète (seul filtre
+            accepté par les requêtes delta)
+    
+    Yields:
+        Objets Email (les messages en erreur sont ignorés)
+    """
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json',
+        # Les requêtes delta n'acceptent pas $top
+        'Prefer': f'odata.maxpagesize={min(limit or 50, 50)}, {OUTLOOK_ID_TYPE_PREFERENCE}'
+    }
+    params = {'$select': OUTLOOK_MESSAGE_FIELDS}
+    if date_filter:
+        params['$filter'] = date_filter
+    
+    for message in iter_graph_delta(
+        f"{GRAPH_API_ENDPOINT}/me/mailFolders/{folder}/messages/delta",
+        headers,
+        state,
+        params=params,
+        cursor=delta_link,
+        limit=limit
+    ):
+        email = parse_outlook_message(message, user, folder)
+        if email:
+            yield email
+
+def fetch_outlook_emails(
+    access_token: str,
+    user: str,
+    folders: List[str] = ['inbox'],
+    limit: int = 10,
+    query: str = None
+) -> Tuple[List[Email], int]:
+    """
+    Récupère les emails d'Outlook en fonction des critères spécifiés.
+    
+    Args:
+        access_token: Token d'accès Microsoft Graph
+        user: Adresse email de l'utilisateur
+        folders: Dossiers Outlook à rechercher (inbox, drafts, sentitems, etc.)
+        limit: Nombre maximum d'emails à récupérer
+        query: Requête de recherche Outlook (OData)
+    
+    Returns:
+        Tuple contenant la liste des emails et le nombre total d'emails trouvés
+    """
+    try:
+        emails = list(iter_outlook_emails(access_token, user, folders=folders, limit=limit, query=query))
+        logger.info(f"Récupération terminée: {len(emails)} emails trouvés et parsés")
+        return emails, len(emails)
     
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des emails Outlook: {e}")
         return [], 0
 
-def save_attachments(email: Email, output_dir: str) -> List[str]:
+# Extension à utiliser pour les pièces jointes sans extension
+ATTACHMENT_EXTENSIONS = {
+    'application/pdf': '.pdf',
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'text/plain': '.txt',
+    'text/html': '.html',
+    'application/msword': '.doc',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
+    'application/vnd.ms-excel': '.xls',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': '.xlsx',
+    'application/vnd.ms-powerpoint': '.ppt',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation': '.pptx'
+}
+
+# Taille des blocs écrits sur disque lors du téléchargement d'une pièce jointe
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+
+def _safe_attachment_filename(filename: Optional[str], content_type: Optional[str], idx: int) -> str:
+    """Nettoie le nom d'une pièce jointe et lui ajoute une extension d'après son type MIME si besoin."""
+    safe_filename = "".join([c for c in (filename or "") if c.isalnum() or c in "._- "]).strip()
+    if not safe_filename:
+        safe_filename = f"attachment_{idx}"
+    if '.' not in safe_filename and content_type:
+        safe_filename += ATTACHMENT_EXTENSIONS.get(content_type, '.bin')
+    return safe_filename
+
+def list_outlook_attachments(access_token: str, message_id: str) -> List[EmailAttachment]:
     """
-    Sauvegarde les pièces jointes d'un email dans un répertoire et renvoie leurs chemins.
+    Liste les pièces jointes (fichiers) d'un message sans télécharger leur contenu.
     
     Args:
-        email: L'email contenant les pièces jointes
-        output_dir: Le répertoire de sortie
+        access_token: Token d'accès Microsoft Graph
+        message_id: Identifiant du message
         
     Returns:
-        Liste des chemins des pièces jointes sauvegardées
+        Pièces jointes sans contenu (filename nettoyé, content_type, size, id)
     """
-    attachment_paths = []
+    headers = {'Authorization': f'Bearer {access_token}', 'Prefer': OUTLOOK_ID_TYPE_PREFERENCE}
+    url = f"{GRAPH_API_ENDPOINT}/me/messages/{message_id}/attachments"
+    params = {'$select': 'id,name,contentType,size'}
+    attachments = []
     
-    if not email.content.attachments:
-        return attachment_paths
+    while url:
+        response = requests.get(url, headers=headers, params=params)
+        response.raise_for_status()
+        data = response.json()
+        for attachment in data.get('value', []):
+            # Les pièces jointes de type élément ou référence n'ont pas de contenu à télécharger
+            if attachment.get('@odata.type') != '#microsoft.graph.fileAttachment':
+                continue
+            attachments.append(EmailAttachment(
+                filename=_safe_attachment_filename(attachment.get('name'), attachment.get('contentType'), len(attachments)),
+                content_type=attachment.get('contentType', 'application/octet-stream'),
+                size=attachment.get('size'),
+                id=attachment.get('id')
+            ))
+        url, params = data.get('@odata.nextLink'), None
     
-    # Créer le répertoire de sortie s'il n'existe pas
-    os.makedirs(output_dir, exist_ok=True)
+    return attachments
+
+def download_outlook_attachments(
+    access_token: str,
+    message_id: str,
+    attachments: List[EmailAttachment],
+    output_dir: str
+) -> List[Tuple[EmailAttachment, str]]:
+    """
+    Télécharge le contenu brut des pièces jointes ($value) directement sur disque, par blocs,
+    sans passer par leur encodage base64 en mémoire.
     
-    # Sauvegarder chaque pièce jointe
-    for idx, attachment in enumerate(email.content.attachments):
-        # Nettoyer le nom de fichier
-        safe_filename = "".join([c for c in attachment.filename if c.isalnum() or c in "._- "]).strip()
-        
-        if not safe_filename:
-            safe_filename = f"attachment_{idx}"
-        
-        # Ajouter l'extension si elle n'est pas présente
-        if '.' not in safe_filename and hasattr(attachment, 'content_type'):
-            ext_map = {
-                'application/pdf': '.pdf',
-                'image/jpeg': '.jpg',
-                'image/png': '.png',
-                'text/plain': '.txt',
-                'text/html': '.html',
-                'application/msword': '.doc',
-                'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
-                'application/vnd.ms-excel': '.xls',
-                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': '.xlsx',
-                'application/vnd.ms-powerpoint': '.ppt',
-                'application/vnd.openxmlformats-officedocument.presentationml.presentation': '.pptx'
-            }
-            safe_filename += ext_map.get(attachment.content_type, '.bin')
-        
-        # Chemin complet du fichier
-        file_path = os.path.join(output_dir, safe_filename)
+    Args:
+        access_token: Token d'accès Microsoft Graph
+        message_id: Identifiant du message
+        attachments: Pièces jointes renvoyées par list_outlook_attachments
+        output_dir: Répertoire de sortie
         
+    Returns:
+        Liste de tuples (pièce jointe, chemin du fichier téléchargé)
+    """
+    headers = {'Authorization': f'Bearer {access_token}', 'Prefer': OUTLOOK_ID_TYPE_PREFERENCE}
+    os.makedirs(output_dir, exist_ok=True)
+    downloaded = []
+    
+    for attachment in attachments:
         # Éviter les collisions de noms
-        counter = 1
+        file_path = os.path.join(output_dir, attachment.filename)
         base_name, ext = os.path.splitext(file_path)
+        counter = 1
         while os.path.exists(file_path):
             file_path = f"{base_name}_{counter}{ext}"
             counter += 1
         
-        # Sauvegarder la pièce jointe
+        url = f"{GRAPH_API_ENDPOINT}/me/messages/{message_id}/attachments/{attachment.id}/$value"
         try:
-            with open(file_path, 'wb') as f:
-                f.write(attachment.content)
-            attachment_paths.append(file_path)
+            with requests.get(url, headers=headers, stream=True) as response:
+                response.raise_for_status()
+                with open(file_path, 'wb') as f:
+                    for block in response.iter_content(chunk_size=ATTACHMENT_CHUNK_SIZE):
+                        f.write(block)
+            downloaded.append((attachment, file_path))
         except Exception as e:
-            logger.error(f"Erreur lors de la sauvegarde de la pièce jointe {safe_filename}: {e}")
+            logger.error(f"Erreur lors du téléchargement de la pièce jointe {attachment.filename}: {e}")
+            if os.path.exists(file_path):
+                os.remove(file_path)
     
-    return attachment_paths
+    return downloaded
+
+def migrate_outlook_registry_ids(access_token: str, file_registry: FileRegistry, user_id: str) -> int:
+    """
+    Traduit vers les identifiants immuables le provider_id des entrées Outlook du registre
+    enregistrées avec les identifiants REST (translateExchangeIds).
+    
+    Les chemins et doc_ids existants sont conservés : les suppressions signalées par le delta
+    et le nettoyage des anciennes versions d'un message réingéré retrouvent ainsi ces entrées.
+    Les identifiants non traduits (message supprimé depuis) sont laissés tels quels.
+    
+    Args:
+        access_token: Token d'accès Microsoft Graph
+        file_registry: Registre de fichiers de l'utilisateur
+        user_id: Identifiant de l'utilisateur
+        
+    Returns:
+        int: Nombre d'entrées du registre mises à jour
+    """
+    paths_by_rest_id: Dict[str, List[str]] = {}
+    for path in file_registry.get_files_by_prefix(f"/microsoft_email/{user_id}/"):
+        metadata = (file_registry.get_file_info(path) or {}).get("metadata") or {}
+        if metadata.get("provider_id") and metadata.get("id_type") != "immutable":
+            paths_by_rest_id.setdefault(metadata["provider_id"], []).append(path)
+    
+    headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
+    rest_ids = list(paths_by_rest_id)
+    updated = 0
+    for i in range(0, len(rest_ids), TRANSLATE_IDS_BATCH_SIZE):
+        response = requests.post(
+            f"{GRAPH_API_ENDPOINT}/me/translateExchangeIds",
+            headers=headers,
+            json={
+                "inputIds": rest_ids[i:i + TRANSLATE_IDS_BATCH_SIZE],
+                "sourceIdType": "restId",
+                "targetIdType": "restImmutableEntryId"
+            }
+        )
+        response.raise_for_status()
+        with file_registry.batch():
+            for item in response.json().get('value', []):
+                if not item.get('targetId'):
+                    continue
+                for path in paths_by_rest_id.get(item.get('sourceId'), []):
+                    info = file_registry.get_file_info(path)
+                    if not info:
+                        continue
+                    file_registry.add_file(
+                        doc_id=info.get("doc_id"),
+                        file_hash=info.get("hash"),
+                        source_path=path,
+                        last_modified=info.get("last_modified"),
+                        metadata={**info.get("metadata", {}), "provider_id": item['targetId'], "id_type": "immutable"}
+                    )
+                    updated += 1
+    logger.info(f"Registre Outlook: {updated} entrées passées aux identifiants immuables ({len(rest_ids)} messages)")
+    return updated
 
 def ingest_outlook_emails_to_qdrant(
     folders: List[str] = ["inbox", "sentitems"],
@@ -267,11 +493,17 @@ def ingest_outlook_emails_to_qdrant(
     min_date: Optional[datetime.datetime] = None,
     batch_size: int = 10,
     return_count: bool = False,
-    syncstatus: SyncStatus = None
+    syncstatus: SyncStatus = None,
+    incremental: Optional[bool] = None
 ) -> Dict[str, Any]:
     """
     Ingère des emails Outlook dans Qdrant.
     
+    En mode incrémental, chaque dossier est synchronisé par requête delta à partir du lien
+    enregistré lors de la synchronisation précédente : seuls les messages ajoutés, modifiés ou
+    supprimés depuis sont traités. query ne s'applique alors pas (les requêtes delta
+    n'acceptent qu'un filtre sur receivedDateTime, issu de min_date).
+    
     Args:
         folders: Liste des dossiers Outlook à parcourir
         limit: Nombre maximum d'emails à ingérer
@@ -282,6 +514,7 @@ def ingest_outlook_emails_to_qdrant(
         min_date: Date minimale pour filtrer les emails (ne traite que les emails postérieurs à cette date)
         credit_limit: Limite maximale d'emails à ingérer (basée sur les crédits utilisateur)
         return_count: Si True, retourne le nombre d'emails traités plutôt que le résultat complet
+        incremental: Synchronisation par requêtes delta (par défaut ingestion.outlook.incremental)
         
     Returns:
         Dictionnaire avec les résultats de l'ingestion ou nombre d'emails traités si return_count=True
@@ -306,10 +539,8 @@ def ingest_outlook_emails_to_qdrant(
     
     # Initialize FileRegistry for this user
     file_registry = FileRegistry(user_id)
-    logger.info(f"File registry loaded for user {user_id}: {len(file_registry.registry)} entries")
+    logger.info(f"File registry loaded for user {user_id}: {len(file_registry)} entries")
     email_manager = EmailManager()
-    # Initialize batch for documents
-    batch_documents = []
     
     try:
         # Récupérer le token Outlook
@@ -327,159 +558,247 @@ def ingest_outlook_emails_to_qdrant(
             date_str = min_date.strftime('%Y-%m-%dT%H:%M:%SZ')
             date_filter = f"receivedDateTime ge {date_str}"
             
-            # Combiner avec la requête existante
+            # Combiner avec la requête existante (date_filter seul est utilisé par les requêtes delta)
             if query:
                 query = f"{query} and {date_filter}"
             else:
                 query = date_filter
             logger.info(f"Filtre de date appliqué: {date_filter}")
             
-        # Récupérer les emails
-        emails, total_found = fetch_outlook_emails(
-            access_token=access_token,
-            user=outlook_user,
-            folders=folders,
-            limit=limit,
-            query=query
-        )
-        
-        result["total_emails_found"] = total_found
-        syncstatus.total_documents = total_found
-        logger.info(f"Nombre d'emails trouvés: {total_found}")
-        # Si aucun email trouvé, terminer
-        if not emails:
-            logger.info("Aucun email trouvé correspondant aux critères")
-            result["success"] = True
-            return result
+        if incremental is None:
+            incremental = CONFIG.get("ingestion", {}).get("outlook", {}).get("incremental", False)
+        cursor_store = SyncCursorStore(user_id) if incremental else None
+        # État de la requête delta de chaque dossier (suppressions, lien de reprise)
+        delta_states = {folder: {} for folder in folders} if cursor_store else {}
+        result["sync_mode"] = "incremental" if cursor_store else "full"
         
+        # Migration unique des entrées enregistrées avant les identifiants immuables
+        id_store = cursor_store or SyncCursorStore(user_id)
+        if id_store.get("outlook", "id_type") != "immutable":
+            try:
+                migrate_outlook_registry_ids(access_token, file_registry, user_id)
+                id_store.set("outlook", "immutable", key="id_type")
+            except Exception as e:
+                error_msg = f"Erreur lors de la migration des identifiants Outlook du registre: {e}"
+                logger.error(error_msg)
+                result["errors"].append(error_msg)
+        # provider_id des messages produits pendant ce cycle, et anciennes entrées de chaque
+        # message réingéré (même provider_id, autre chemin), supprimées une fois le message ingéré
+        produced_ids = set()
+        stale_paths: Dict[str, List[str]] = {}
+            
         # Créer un répertoire temporaire pour les pièces jointes
         temp_dir = None
         if save_attachments:
             temp_dir = tempfile.mkdtemp()
             logger.info(f"Répertoire temporaire pour les pièces jointes: {temp_dir}")
         
-        # Parcourir chaque email pour la préparation des batch
-        for email_idx, email in enumerate(emails):
-            try:
-                # Générer un ID unique pour l'email
-                email_id = generate_email_id(email)
-                email.metadata.doc_id = email_id
+        def fetch_documents():
+            """Récupère les emails au fil de l'eau et prépare leurs documents (corps + pièces jointes)."""
+            if cursor_store:
+                emails = (
+                    email
+                    for folder_name in folders
+                    for email in iter_outlook_delta_emails(
+                        access_token=access_token,
+                        user=outlook_user,
+                        folder=folder_name,
+                        state=delta_states[folder_name],
+                        delta_link=None if force_reingest else cursor_store.get("outlook", folder_name),
+                        limit=limit,
+                        date_filter=date_filter
+                    )
+                )
+            else:
+                emails = iter_outlook_emails(
+                    access_token=access_token,
+                    user=outlook_user,
+                    folders=folders,
+                    limit=limit,
+                    query=query
+                )
+            # Parcourir chaque email pour la préparation des documents
+            for email_idx, email in enumerate(emails):
+                result["total_emails_found"] += 1
+                produced_ids.add(email.metadata.provider_id)
+                documents = []
+                try:
+                    # Générer un ID unique pour l'email
+                    email_id = generate_email_id(email)
+                    email.metadata.doc_id = email_id
                 
-                # Vérifier si l'email existe déjà dans le registre
-                source_path = f"/microsoft_email/{user_id}/{email.metadata.conversation_id}/{email_id}"
+                    # Vérifier si l'email existe déjà dans le registre
+                    source_path = f"/microsoft_email/{user_id}/{email.metadata.conversation_id}/{email_id}"
                 
-                # Créer un fichier temporaire avec le contenu de l'email
-                with tempfile.NamedTemporaryFile(mode='w+', suffix='.eml', delete=False) as temp_file:
-                    # Écrire le contenu de l'email dans le fichier temporaire
-                    temp_file.write(email.content.body_text or email.content.body_html or "")
-                    filepath = temp_file.name
-                # Préparer les métadonnées
-                if email.metadata.folders=="inbox":
-                    folder="inbox"
-                elif email.metadata.folders=="sentitems":
-                    folder="sent"
+                    # Préparer les métadonnées
+                    folder = {"inbox": "inbox", "sentitems": "sent"}.get(email.metadata.folders, email.metadata.folders)
 
-                metadata = {
-                    "doc_id": email_id,
-                    "path": source_path,
-                    "user": user_id,
-                    "filename": f"{email.metadata.subject or 'No subject'}.eml",
-                    "sender": email.metadata.sender,
-                    "receiver": email.metadata.receiver,
-                    "cc": email.metadata.cc,
-                    "bcc": email.metadata.bcc,
-                    "subject": email.metadata.subject,
-                    "date": email.metadata.date,
-                    "provider_id": email.metadata.provider_id,
-                    "has_attachments": email.metadata.has_attachments,
-                    "content_type": email.metadata.content_type or "text/plain",
-                    "ingestion_date": datetime.datetime.now().isoformat(),
-                    "ingestion_type": "microsoft_email",
-                    "body_text": email.content.body_text,
-                    "conversation_id": email.metadata.conversation_id,
-                    "folder": folder
-                }
+                    metadata = {
+                        "doc_id": email_id,
+                        "path": source_path,
+                        "user": user_id,
+                        "filename": f"{email.metadata.subject or 'No subject'}.eml",
+                        "sender": email.metadata.sender,
+                        "receiver": email.metadata.receiver,
+                        "cc": email.metadata.cc,
+                        "bcc": email.metadata.bcc,
+                        "subject": email.metadata.subject,
+                        "date": email.metadata.date,
+                        "provider_id": email.metadata.provider_id,
+                        "has_attachments": email.metadata.has_attachments,
+                        "content_type": email.metadata.content_type or "text/plain",
+                        "ingestion_date": datetime.datetime.now().isoformat(),
+                        "ingestion_type": "microsoft_email",
+                        "body_text": email.content.body_text,
+                        "conversation_id": email.metadata.conversation_id,
+                        "folder": folder,
+                        "document_type": "email",
+                        "id_type": "immutable"
+                    }
                 
-                # Ajouter le document au batch
-                batch_documents.append({
-                    "tmp_path": filepath,
-                    "metadata": metadata
-                })
+                    # Ajouter le document au batch : le corps est déjà en mémoire
+                    documents.append({
+                        "text": email.content.body_text or "",
+                        "metadata": metadata
+                    })
                 
-                # Log progress every 5 emails
-                if email_idx % 5 == 0:
-                    logger.info(f"[{email_idx+1}/{len(emails)}] Préparation des emails pour ingestion")
-                # Traitement des pièces jointes
-                if save_attachments and email.attachments and temp_dir:
-                    attachment_paths = save_attachments(email, temp_dir)
+                    # Log progress every 5 emails
+                    if email_idx % 5 == 0:
+                        logger.info(f"[{email_idx+1}] Préparation des emails pour ingestion")
+                    # Traitement des pièces jointes : contenu téléchargé seulement pour un email
+                    # nouveau ou modifié, et pour les formats pris en charge par le chunking
+                    email_changed = force_reingest or file_registry.has_changed(source_path, email_id)
+                    if email_changed:
+                        stale = [
+                            path for path in file_registry.get_paths_by_provider_id(email.metadata.provider_id)
+                            if path != source_path and not path.startswith(f"{source_path}/")
+                        ]
+                        if stale:
+                            stale_paths[source_path] = stale
+                    if save_attachments and temp_dir and email.metadata.has_attachments and email_changed:
+                        try:
+                            attachments = [
+                                attachment for attachment in list_outlook_attachments(access_token, email.metadata.provider_id)
+                                if os.path.splitext(attachment.filename)[1].lower() in SUPPORTED_EXTS
+                            ]
+                        except Exception as e:
+                            logger.warning(f"Erreur lors de la récupération des pièces jointes: {e}")
+                            attachments = []
+                        downloaded = download_outlook_attachments(access_token, email.metadata.provider_id, attachments, temp_dir)
                     
-                    for idx, attachment_path in enumerate(attachment_paths):
-                        # Nom du fichier de la pièce jointe
-                        attachment_name = os.path.basename(attachment_path)
+                        for idx, (attachment, attachment_path) in enumerate(downloaded):
+                            # Nom du fichier de la pièce jointe
+                            attachment_name = os.path.basename(attachment_path)
                         
-                        # Générer un ID unique pour la pièce jointe
-                        attachment_id = hashlib.md5(f"{email_id}_{attachment_name}_{idx}".encode('utf-8')).hexdigest()
-                        # Métadonnées pour la pièce jointe
-                        attachment_metadata = {
-                            "doc_id": attachment_id,
-                            "path": f"/microsoft_email/{user_id}/{email.metadata.conversation_id}/attachments/{attachment_name}",
-                            "user": user_id,
-                            "filename": attachment_name,
-                            "provider_id": email.metadata.provider_id,
-                            "parent_email_id": email_id,
-                            "subject": email.metadata.subject,
-                            "date": email.metadata.date,
-                            "sender": email.metadata.sender,
-                            "receiver": email.metadata.receiver,
-                            "content_type": "attachment",
-                            "ingestion_date": datetime.datetime.now().isoformat(),
-                            "ingestion_type": "microsoft_email_attachment",
-                            "conversation_id": email.metadata.conversation_id,
-                            "folder": folder
-                        }
+                            # doc_id dérivé du contenu : une pièce jointe identique dans plusieurs emails
+                            # n'est indexée qu'une fois, chaque email en garde une référence
+                            attachment_id = compute_file_content_hash(attachment_path)
+                            # Métadonnées pour la pièce jointe
+                            attachment_metadata = {
+                                "doc_id": attachment_id,
+                                "path": f"{source_path}/attachments/{idx}_{attachment_name}",
+                                "user": user_id,
+                                "filename": attachment_name,
+                                "document_type": "email_attachment",
+                                "provider_id": email.metadata.provider_id,
+                                "parent_email_id": email_id,
+                                "subject": email.metadata.subject,
+                                "date": email.metadata.date,
+                                "sender": email.metadata.sender,
+                                "receiver": email.metadata.receiver,
+                                "content_type": "attachment",
+                                "ingestion_date": datetime.datetime.now().isoformat(),
+                                "ingestion_type": "microsoft_email_attachment",
+                                "conversation_id": email.metadata.conversation_id,
+                                "folder": folder,
+                                "id_type": "immutable"
+                            }
                         
-                        # Ajouter la pièce jointe au batch
-                        batch_documents.append({
-                            "tmp_path": attachment_path,
-                            "metadata": attachment_metadata
-                        })
+                            # Ajouter la pièce jointe au batch
+                            documents.append({
+                                "tmp_path": attachment_path,
+                                "metadata": attachment_metadata,
+                                # Chemin de la pièce jointe avant le doc_id par contenu, nettoyé à l'enregistrement
+                                "legacy_path": f"/microsoft_email/{user_id}/{email.metadata.conversation_id}/attachments/{attachment_name}"
+                            })
                         
-                        result["ingested_attachments"] += 1
-                # After preparing metadata, save to the email database
-                try:
-                    # Parse the email date string into a datetime object
-                    parsed_date = parse_email_date(email.metadata.date)
+                            result["ingested_attachments"] += 1
+                    # After preparing metadata, save to the email database
+                    try:
+                        # Parse the email date string into a datetime object
+                        parsed_date = parse_email_date(email.metadata.date)
                     
-                    email_manager.save_email(
-                        user_id=user_id,
-                        email_id=email.metadata.provider_id,
-                        sender=email.metadata.sender,
-                        recipients=[email.metadata.receiver],  # Convert to list if needed
-                        subject=email.metadata.subject or '',
-                        body=email.content.body_text or '',
-                        #html_body=email.content.body_html or '',
-                        sent_date=parsed_date,
-                        source_type="microsoft_email",
-                        conversation_id=email.metadata.conversation_id,
-                        folder=folder
-                    )
+                        email_manager.save_email(
+                            user_id=user_id,
+                            email_id=email.metadata.provider_id,
+                            sender=email.metadata.sender,
+                            recipients=[email.metadata.receiver],  # Convert to list if needed
+                            subject=email.metadata.subject or '',
+                            body=email.content.body_text or '',
+                            #html_body=email.content.body_html or '',
+                            sent_date=parsed_date,
+                            source_type="microsoft_email",
+                            conversation_id=email.metadata.conversation_id,
+                            folder=folder
+                        )
+                    except Exception as e:
+                        logger.error(f"Error saving email to database: {e}")
                 except Exception as e:
-                    logger.error(f"Error saving email to database: {e}")
-                # Procéder par lots de batch_size documents
-                if len(batch_documents) >= batch_size:
-                    flush_batch(batch_documents, user_id, result, file_registry, syncstatus)
-                    result["batches"] += 1
-                    
+                    error_msg = f"Erreur lors de la préparation de l'email {email.metadata.subject}: {str(e)}"
+                    logger.error(error_msg)
+                    result["errors"].append(error_msg)
+                    continue
+
+                yield documents
+
+        # Fetch, parsing, embedding et upsert se recouvrent ; la mémoire est bornée par les files du pipeline
+        pipeline = IngestionPipeline(
+            user_id,
+            file_registry=file_registry,
+            syncstatus=syncstatus,
+            batch_size=batch_size,
+            delete_files=True
+        )
+        pipeline.run(fetch_documents(), result)
+        syncstatus.total_documents = result["total_emails_found"]
+        logger.info(f"Nombre d'emails trouvés: {result['total_emails_found']}")
+        
+        # Anciennes versions des messages réingérés, seulement si la nouvelle version est enregistrée
+        replaced = [path for source_path, paths in stale_paths.items() if file_registry.file_exists(source_path) for path in paths]
+        if replaced:
+            try:
+                result["replaced_documents"] = delete_documents_by_paths(replaced, file_registry, user_id)
+                logger.info(f"{result['replaced_documents']} anciennes entrées supprimées pour {len(stale_paths)} emails réingérés")
             except Exception as e:
-                error_msg = f"Erreur lors de la préparation de l'email {email.metadata.subject}: {str(e)}"
-                logger.error(error_msg)
-                result["errors"].append(error_msg)
+                logger.error(f"Erreur lors de la suppression des anciennes versions des emails: {e}")
+                result["errors"].append(f"Erreur suppression anciennes versions: {str(e)}")
         
-        # Traiter les documents restants dans le batch
-        if batch_documents:
-            logger.info(f"Traitement du dernier lot de {len(batch_documents)} documents")
-            flush_batch(batch_documents, user_id, result, file_registry, syncstatus)
-            result["batches"] += 1
+        if cursor_store:
+            # Propagation des suppressions vers Qdrant et le registre, une fois les ajouts ingérés
+            # (un message modifié puis supprimé pendant la même période est ainsi bien retiré).
+            # Un message déplacé entre deux dossiers synchronisés garde son identifiant immuable :
+            # signalé supprimé dans l'un et ajouté dans l'autre, il n'est pas supprimé.
+            removed_ids = [
+                message_id for state in delta_states.values() for message_id in state.get("removed", [])
+                if message_id not in produced_ids
+            ]
+            if removed_ids:
+                try:
+                    result["deleted_emails"] = delete_documents_by_provider_ids(removed_ids, file_registry, user_id)
+                    logger.info(f"{result['deleted_emails']} documents supprimés pour {len(removed_ids)} emails supprimés dans Outlook")
+                except Exception as e:
+                    logger.error(f"Erreur lors de la suppression des emails supprimés dans Outlook: {e}")
+                    result["errors"].append(f"Erreur suppression emails: {str(e)}")
+            
+            # Les liens delta n'avancent que si tout a été traité ; sinon la prochaine synchronisation
+            # rejoue les mêmes changements (les documents déjà ingérés sont ignorés par le registre)
+            if result["errors"]:
+                logger.warning("Erreurs pendant la synchronisation, liens delta Outlook non avancés")
+            else:
+                for folder_name, state in delta_states.items():
+                    if state.get("cursor"):
+                        cursor_store.set("outlook", state["cursor"], key=folder_name)
+                logger.info(f"Liens delta Outlook enregistrés pour les dossiers: {list(delta_states)}")
         
         # Nettoyer le répertoire temporaire
         if temp_dir and os.path.exists(temp_dir):
@@ -490,8 +809,8 @@ def ingest_outlook_emails_to_qdrant(
             except Exception as cleanup_err:
                 logger.warning(f"Erreur lors du nettoyage du répertoire temporaire: {cleanup_err}")
         
-        # Marquer comme succès même s'il y a des erreurs individuelles
-        result["success"] = result["items_ingested"] > 0 or result["ingested_attachments"] > 0
+        # Marquer comme succès même s'il y a des erreurs individuelles (ou s'il n'y avait aucun email)
+        result["success"] = result["items_ingested"] > 0 or result["ingested_attachments"] > 0 or result["total_emails_found"] == 0
         
     except Exception as e:
         error_msg = f"Erreur globale lors de l'ingestion des emails Outlook: {str(e)}"
@@ -11,7 +11,7 @@ import datetime
 import tempfile
 import time
 import traceback
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import io
 import requests
 
@@ -23,9 +23,13 @@ logger = log.bind(name="src.services.ingestion.services.ingest_onedrive_document
 
 # Internal imports
 from src.services.auth.microsoft_auth import get_drive_service
-from src.services.ingestion.core.ingest_core import flush_batch
+from src.services.ingestion.core.pipeline import IngestionPipeline
+from src.services.ingestion.core.ingest_core import delete_documents_by_paths, get_vector_store_manager
+from src.services.ingestion.services.ingest_microsoft_emails import iter_graph_delta
 from src.services.storage.file_registry import FileRegistry
+from src.services.storage.sync_cursors import SyncCursorStore
 from src.services.db.models import SyncStatus
+from src.core.config import CONFIG
 
 # Microsoft Graph API endpoint
 GRAPH_API_ENDPOINT = "https://graph.microsoft.com/v1.0"
@@ -106,6 +110,49 @@ def compute_onedrive_file_hash(file_metadata: Dict, file_content: Optional[bytes
     
     return hasher.hexdigest()
 
+def rename_onedrive_document(
+    file_registry: FileRegistry,
+    old_path: str,
+    new_path: str,
+    file_metadata: Dict,
+    file_hash: str,
+    collection: str
+) -> bool:
+    """
+    Move the index entry of a renamed file to its new path instead of re-ingesting it.
+    
+    The content is considered unchanged when the file's cTag (content eTag, not changed
+    by a rename) matches the one saved at ingestion. The chunks keep their doc_id; only
+    metadata.path is rewritten in Qdrant, and the registry entry is moved.
+    
+    Args:
+        file_registry: User file registry
+        old_path: Registry path under the previous name
+        new_path: Registry path under the new name
+        file_metadata: OneDrive file metadata from the listing
+        file_hash: Hash of the new listing metadata (stored as the registry hash)
+        collection: User Qdrant collection
+        
+    Returns:
+        True if the file was renamed, False if its content changed or cannot be compared
+    """
+    info = file_registry.get_file_info(old_path)
+    ctag = file_metadata.get('cTag')
+    if not info or not ctag or (info.get("metadata") or {}).get("ctag") != ctag:
+        return False
+    points = get_vector_store_manager(collection).update_path(old_path, new_path)
+    with file_registry.batch():
+        file_registry.add_file(
+            doc_id=info["doc_id"],
+            file_hash=file_hash,
+            source_path=new_path,
+            last_modified=datetime.datetime.now().isoformat(),
+            metadata={**info.get("metadata", {}), "path": new_path, "filename": file_metadata.get('name')}
+        )
+        file_registry.remove_file(old_path)
+    logger.info(f"[RENAME] {old_path} -> {new_path} ({points} chunks)")
+    return True
+
 def get_file_extension_from_mime(mime_type: str) -> str:
     """
     Determine file extension based on MIME type.
@@ -229,7 +276,7 @@ def fetch_onedrive_files(access_token: str, query: str = None, limit: int = 100,
             
             params = {
                 '$top': min(100, limit),
-                '$select': 'id,name,file,folder,lastModifiedDateTime,createdDateTime,size,webUrl,parentReference'
+                '$select': 'id,name,file,folder,lastModifiedDateTime,createdDateTime,size,webUrl,parentReference,cTag'
             }
             
             response = requests.get(url, headers=headers, params=params)
@@ -338,6 +385,52 @@ def fetch_onedrive_files(access_token: str, query: str = None, limit: int = 100,
         return []
 
 
+def iter_onedrive_delta(
+    access_token: str,
+    state: Dict[str, Any],
+    delta_link: Optional[str] = None,
+    limit: int = 100,
+    folder_id: str = None,
+    days_filter: int = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the files added or modified since the saved delta link (/drive/root/delta).
+    
+    Without a delta link, the whole drive (or folder) is enumerated once; the delta link
+    returned at the end then makes the next sync cost proportional to what changed.
+    
+    Args:
+        access_token: Microsoft Graph API access token
+        state: Filled by iter_graph_delta (removed item IDs, resume cursor, full_sync)
+        delta_link: Delta link saved by the previous sync (None for a full sync)
+        limit: Maximum number of files to return (rounded up to the page)
+        folder_id: ID of the folder to track (optional, defaults to root)
+        days_filter: Only return files created or modified in the last N days
+        
+    Yields:
+        File metadata dictionaries
+    """
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Accept': 'application/json'
+    }
+    url = f"{GRAPH_API_ENDPOINT}/me/drive/items/{folder_id}/delta" if folder_id else f"{GRAPH_API_ENDPOINT}/me/drive/root/delta"
+    
+    def keep(item: Dict) -> bool:
+        # Folders are reported too; only files are ingested
+        return 'file' in item and (not days_filter or _is_recent_file(item, days_filter))
+    
+    yield from iter_graph_delta(
+        url,
+        headers,
+        state,
+        params={'$top': min(100, limit)},
+        cursor=delta_link,
+        limit=limit,
+        keep=keep
+    )
+
+
 def batch_ingest_onedrive_documents(
     query: str = None,
     limit: int = 10,
@@ -347,12 +440,17 @@ def batch_ingest_onedrive_documents(
     user_id: str = "",
     batch_size: int = 10,
     syncstatus: SyncStatus = None,
-    days_filter: int = 2
+    days_filter: int = 2,
+    incremental: Optional[bool] = None
 ) -> Dict[str, Any]:
     """
     Ingest documents from OneDrive into Qdrant in batches for better performance.
     Uses FileRegistry to avoid duplications and follows a consistent approach with other sources.
     
+    In incremental mode (ignored when a search query is given), files are listed with a delta
+    query from the delta link saved by the previous sync, so only added, modified or deleted
+    files are processed, and deleted files are removed from Qdrant.
+    
     Args:
         query: OneDrive search query
         limit: Maximum number of files to ingest
@@ -363,6 +461,7 @@ def batch_ingest_onedrive_documents(
         batch_size: Batch size for ingestion to optimize performance
         syncstatus: SyncStatus object to track progress
         days_filter: Only ingest files created or modified in the last N days (default: 2)
+        incremental: Sync with delta queries (defaults to ingestion.onedrive.incremental)
         
     Returns:
         Dictionary containing ingestion statistics:
@@ -370,6 +469,7 @@ def batch_ingest_onedrive_documents(
         - total_files_found: Total number of files found
         - items_ingested: Number of files ingested
         - files_skipped: Number of files skipped
+        - files_renamed: Number of renamed files moved to their new path without re-ingestion
         - batches: Number of batches processed
         - errors: List of errors encountered
         - duration: Total duration of ingestion in seconds
@@ -381,7 +481,7 @@ def batch_ingest_onedrive_documents(
     
     # Initialize file registry
     file_registry = FileRegistry(user_id)
-    logger.info(f"File registry loaded for {user_id}: {len(file_registry.registry)} entries")
+    logger.info(f"File registry loaded for {user_id}: {len(file_registry)} entries")
     
     # Initialize statistics
     start_time = time.time()
@@ -390,16 +490,13 @@ def batch_ingest_onedrive_documents(
         "total_files_found": 0,
         "items_ingested": 0,
         "files_skipped": 0,
+        "files_renamed": 0,
         "batches": 0,
         "errors": [],
         "start_time": start_time,
         "duration": 0
     }
     
-    # List to collect documents to ingest in batches
-    batch_documents = []
-    temp_files_to_cleanup = []
-    
     try:
         # Get Microsoft Graph API access token
         token_data = get_drive_service(user_id)
@@ -413,99 +510,153 @@ def batch_ingest_onedrive_documents(
         access_token = token_data["access_token"]
         logger.info("Microsoft Graph API access token obtained successfully")
         
-        # Fetch files from OneDrive
-        files = fetch_onedrive_files(access_token, query, limit, folder_id, days_filter)
-        result["total_files_found"] = len(files)
-        
-        if syncstatus:
-            syncstatus.total_documents = len(files)
+        # Delta queries do not support search: a query always triggers a full listing
+        if incremental is None:
+            incremental = CONFIG.get("ingestion", {}).get("onedrive", {}).get("incremental", False)
+        cursor_store = SyncCursorStore(user_id) if incremental and not query else None
+        cursor_key = folder_id or "root"
+        delta_state: Dict[str, Any] = {}
+        # Registry entries made stale by a rename or a deletion, removed once the sync is done
+        stale_paths: List[str] = []
+        
+        if cursor_store:
+            # Changed files are listed while the pipeline runs
+            files = iter_onedrive_delta(
+                access_token,
+                delta_state,
+                delta_link=None if force_reingest else cursor_store.get("onedrive", cursor_key),
+                limit=limit,
+                folder_id=folder_id,
+                days_filter=days_filter
+            )
+            result["sync_mode"] = "incremental"
+        else:
+            # Fetch files from OneDrive
+            files = fetch_onedrive_files(access_token, query, limit, folder_id, days_filter)
+            result["total_files_found"] = len(files)
+            result["sync_mode"] = "full"
             
-        if not files:
-            logger.info("No files found in OneDrive with the specified criteria")
-            result["success"] = True
-            return result
-        
-        logger.info(f"Processing {len(files)} OneDrive files")
-        
-        # Process OneDrive files in batches
-        for file_idx, file_metadata in enumerate(files):
-            try:
-                file_id = file_metadata.get('id')
-                file_name = file_metadata.get('name', 'Unnamed file')
-                file_mimetype = file_metadata.get('file', {}).get('mimeType', 'application/octet-stream')
-                file_weblink = file_metadata.get('webUrl', '')
-                file_modified = file_metadata.get('lastModifiedDateTime', '')
+            if syncstatus:
+                syncstatus.total_documents = len(files)
                 
-                # Build normalized source path
-                source_path = f"/microsoft_storage/{user_id}/{file_id}/{file_name}"
+            if not files:
+                logger.info("No files found in OneDrive with the specified criteria")
+                result["success"] = True
+                return result
+            
+            logger.info(f"Processing {len(files)} OneDrive files")
+        
+        def fetch_documents():
+            """Download files one at a time and yield their documents."""
+            for file_idx, file_metadata in enumerate(files):
+                if cursor_store:
+                    result["total_files_found"] += 1
+                try:
+                    file_id = file_metadata.get('id')
+                    file_name = file_metadata.get('name', 'Unnamed file')
+                    file_mimetype = file_metadata.get('file', {}).get('mimeType', 'application/octet-stream')
+                    file_weblink = file_metadata.get('webUrl', '')
+                    file_modified = file_metadata.get('lastModifiedDateTime', '')
                 
-                # Generate unique hash for this file
-                file_hash = compute_onedrive_file_hash(file_metadata)
-                doc_id = file_hash
+                    # Build normalized source path
+                    source_path = f"/microsoft_storage/{user_id}/{file_id}/{file_name}"
+                    
+                    # Generate unique hash for this file
+                    file_hash = compute_onedrive_file_hash(file_metadata)
+                    doc_id = file_hash
+                    
+                    # A renamed file keeps its ID: with unchanged content its chunks are moved to
+                    # the new path, otherwise its entry under the previous name is stale
+                    previous_paths = [
+                        path for path in file_registry.get_files_by_prefix(f"/microsoft_storage/{user_id}/{file_id}/")
+                        if path != source_path
+                    ]
+                    if (len(previous_paths) == 1 and not force_reingest and not file_registry.file_exists(source_path)
+                            and rename_onedrive_document(file_registry, previous_paths[0], source_path,
+                                                         file_metadata, file_hash, user_id)):
+                        result['files_renamed'] += 1
+                        continue
+                    stale_paths.extend(previous_paths)
                 
-                # Check if file already exists in registry
-                if not force_reingest and file_registry.file_exists(source_path):
-                    logger.info(f"[SKIP] File already ingested: {file_name} (path: {source_path})")
-                    result['files_skipped'] += 1
-                    continue
+                    # Pre-download check: the hash comes from the listing metadata,
+                    # so an unchanged file costs no transfer at all
+                    if not force_reingest and not file_registry.has_changed(source_path, doc_id):
+                        logger.info(f"[SKIP] File unchanged: {file_name} (path: {source_path})")
+                        result['files_skipped'] += 1
+                        continue
                 
-                # Progress log
-                logger.info(f"[{file_idx+1}/{len(files)}] Downloading and processing: {file_name}")
+                    # Progress log
+                    progress = f"{file_idx+1}/{len(files)}" if isinstance(files, list) else f"{file_idx+1}"
+                    logger.info(f"[{progress}] Downloading and processing: {file_name}")
                 
-                # Download the file
-                download_result = download_onedrive_file(access_token, file_id, file_metadata)
-                if not download_result:
-                    logger.warning(f"[ERROR] Download failed: {file_name}")
-                    result['errors'].append(f"Download failed: {file_name}")
-                    continue
+                    # Download the file
+                    download_result = download_onedrive_file(access_token, file_id, file_metadata)
+                    if not download_result:
+                        logger.warning(f"[ERROR] Download failed: {file_name}")
+                        result['errors'].append(f"Download failed: {file_name}")
+                        continue
                     
-                temp_file_path, file_content = download_result
-                temp_files_to_cleanup.append(temp_file_path)
-                
-                # Create document metadata
-                metadata = {
-                    "path": source_path,
-                    "doc_id": doc_id,
-                    "ingestion_type": "microsoft_storage",
-                    "filename": file_name,
-                    "user": user_id,
-                    "ingestion_date": datetime.datetime.now().isoformat()
-                }
+                    temp_file_path, file_content = download_result
                 
-                # Add to the list of documents to process in batch
-                batch_documents.append({
-                    "tmp_path": temp_file_path,
-                    "metadata": metadata
-                })
+                    # Create document metadata
+                    metadata = {
+                        "path": source_path,
+                        "doc_id": doc_id,
+                        "ingestion_type": "microsoft_storage",
+                        "filename": file_name,
+                        "user": user_id,
+                        "ctag": file_metadata.get('cTag'),
+                        "ingestion_date": datetime.datetime.now().isoformat()
+                    }
                 
-                # Process the batch if maximum size is reached
-                if len(batch_documents) >= batch_size:
-                    flush_batch(batch_documents, user_id, result, file_registry, syncstatus)
-                    result["batches"] += 1
-                    logger.info(f"Batch #{result['batches']} processed. Total ingested: {result['items_ingested']}")
-                    batch_documents = []
+                    # The document enters the pipeline while the next files are downloading
+                    document = {
+                        "tmp_path": temp_file_path,
+                        "metadata": metadata
+                    }
                     
-            except Exception as e:
-                error_msg = f"Error processing file {file_metadata.get('name', 'unknown')}: {str(e)}"
-                logger.error(error_msg)
-                logger.error(traceback.format_exc())
-                result["errors"].append(error_msg)
-        
-        # Process the last batch if there are remaining documents
-        if batch_documents:
-            logger.info(f"Processing the last batch of {len(batch_documents)} documents")
-            flush_batch(batch_documents, user_id, result, file_registry, syncstatus)
-            result["batches"] += 1
-            
-        # Clean up temporary files
-        for temp_file in temp_files_to_cleanup:
+                except Exception as e:
+                    error_msg = f"Error processing file {file_metadata.get('name', 'unknown')}: {str(e)}"
+                    logger.error(error_msg)
+                    logger.error(traceback.format_exc())
+                    result["errors"].append(error_msg)
+                    continue
+
+                yield document
+
+        # Download, parsing, embedding and upsert overlap; each temporary file
+        # is deleted as soon as its batch has been ingested
+        pipeline = IngestionPipeline(
+            user_id,
+            file_registry=file_registry,
+            syncstatus=syncstatus,
+            batch_size=batch_size,
+            delete_files=True
+        )
+        pipeline.run(fetch_documents(), result)
+        if syncstatus and cursor_store:
+            syncstatus.total_documents = result["total_files_found"]
+        
+        # Deleted files are removed from Qdrant once the changes have been ingested
+        for file_id in delta_state.get("removed", []):
+            stale_paths.extend(file_registry.get_files_by_prefix(f"/microsoft_storage/{user_id}/{file_id}/"))
+        if stale_paths:
             try:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
-                    logger.info(f"Temporary file deleted: {temp_file}")
+                result["files_deleted"] = delete_documents_by_paths(stale_paths, file_registry, user_id)
+                logger.info(f"{result['files_deleted']} deleted or renamed files removed from the index")
             except Exception as e:
-                logger.warning(f"Error deleting temporary file {temp_file}: {e}")
-                
+                logger.error(f"Error removing deleted files: {e}")
+                result["errors"].append(f"Deletion error: {str(e)}")
+        
+        # The delta link only advances when everything was processed; otherwise the next
+        # sync replays the same changes (already ingested files are skipped by the registry)
+        if cursor_store and delta_state.get("cursor"):
+            if result["errors"]:
+                logger.warning("Errors during sync, OneDrive delta link not advanced")
+            else:
+                cursor_store.set("onedrive", delta_state["cursor"], key=cursor_key)
+                logger.info("OneDrive delta link saved")
+        
         # Clean up temporary directory
         if temp_dir and os.path.exists(temp_dir):
             try:
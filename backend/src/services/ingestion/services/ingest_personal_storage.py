@@ -51,7 +51,7 @@ def batch_ingest_user_documents(user_id: str, storage_path: str = None, limit: i
     
     # Initialize FileRegistry for this user
     file_registry = FileRegistry(user_id)
-    logger.info(f"File registry loaded for user {user_id}: {len(file_registry.registry)} entries")
+    logger.info(f"File registry loaded for user {user_id}: {len(file_registry)} entries")
     # Find all files in user directory
     files = []
     for root, _, filenames in os.walk(user_dir):
@@ -8,3 +8,12 @@ class BaseRetriever(ABC):
         Retrieve relevant documents for a given query.
         """
         pass
+
+
+class BaseReranker(ABC):
+    @abstractmethod
+    def rerank(self, query: str, docs: List[Any], top_k: int = 50) -> List[Any]:
+        """
+        Reorder documents by relevance to the query and return the top_k best.
+        """
+        pass
@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+from typing import Dict, List, Optional
+
+# Add the backend directory to the path so we can import src modules
+backend_path = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')
+sys.path.insert(0, backend_path)
+
+from langchain_core.documents import Document
+from src.services.rag.retrieval.base import BaseReranker
+from src.core.config import CONFIG
+from src.core.logger import log
+
+logger = log.bind(name="src.services.rag.retrieval.cross_encoder")
+
+DEFAULT_CROSS_ENCODER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+# Models are loaded once per process and shared by all rerankers with the same settings
+_models: Dict[tuple, object] = {}
+_models_lock = threading.Lock()
+
+
+def get_cross_encoder(model_name: str, max_length: int, device: str = "cpu", backend: str = "torch"):
+    """Return the process-wide CrossEncoder for these settings, loading it on first use."""
+    key = (model_name, max_length, device, backend)
+    with _models_lock:
+        if key not in _models:
+            # Imported lazily: deployments using the LLM reranker do not load torch
+            from sentence_transformers import CrossEncoder
+            kwargs = {"max_length": max_length, "device": device}
+            if backend != "torch":
+                kwargs["backend"] = backend
+            logger.info(f"Loading cross-encoder {model_name} ({backend}, {device}, max_length={max_length})")
+            _models[key] = CrossEncoder(model_name, **kwargs)
+        return _models[key]
+
+
+class CrossEncoderReranker(BaseReranker):
+    """
+    Local cross-encoder reranker (sentence-transformers), configured by retrieval.cross_encoder.
+    Query/passage pairs are scored batch_size at a time and truncated to max_length tokens.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, batch_size: Optional[int] = None,
+                 max_length: Optional[int] = None, device: Optional[str] = None, backend: Optional[str] = None):
+        cfg = CONFIG.get("retrieval", {}).get("cross_encoder", {}) or {}
+        self.model_name = model_name or cfg.get("model", DEFAULT_CROSS_ENCODER_MODEL)
+        self.batch_size = batch_size or cfg.get("batch_size", 32)
+        self.max_length = max_length or cfg.get("max_length", 512)
+        self.device = device or cfg.get("device", "cpu")
+        self.backend = backend or cfg.get("backend", "torch")
+
+    def score(self, query: str, passages: List[str]) -> List[float]:
+        """Relevance scores of passages for the query, in the order of the passages."""
+        if not passages:
+            return []
+        model = get_cross_encoder(self.model_name, self.max_length, self.device, self.backend)
+        # The tokenizer truncates to max_length tokens; trimming characters first avoids
+        # tokenizing whole documents (a token is rarely more than a few characters)
+        char_budget = self.max_length * 8
+        pairs = [(query, passage[:char_budget]) for passage in passages]
+        scores = model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        return [float(score) for score in scores]
+
+    def rerank(self, query: str, docs: List[Document], top_k: int = 50) -> List[Document]:
+        scores = self.score(query, [d.page_content for d in docs])
+        scored_docs = sorted(zip(scores, docs), reverse=True, key=lambda x: x[0])
+        return [d for _, d in scored_docs[:top_k]]
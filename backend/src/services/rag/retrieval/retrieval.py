@@ -1,7 +1,14 @@
-from .base import BaseRetriever
-from typing import List, Dict, Optional
+from .base import BaseReranker, BaseRetriever
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional, Union
+import hashlib
+import json
 import os
+import re
 import sys
+import threading
+import time
 
 # Add the backend directory to the path so we can import src modules
 backend_path = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')
@@ -10,9 +17,274 @@ sys.path.insert(0, backend_path)
 from src.services.embeddings.embedding_service import EmbeddingService
 from src.services.vectorstore.qdrant_manager import VectorStoreManager
 from langchain_qdrant import QdrantVectorStore
+from qdrant_client.http import models as rest
 from langchain_core.documents import Document
 from src.services.rag.retrieval.llm_router import LLM
-from src.core.config import load_config
+from src.services.rag.retrieval.cross_encoder import CrossEncoderReranker
+from src.core.config import CONFIG, load_config
+
+# Retrievers are reused across requests, keyed by collection: building one loads the config,
+# an embeddings client, a VectorStoreManager and a QdrantVectorStore.
+_pool_cfg = CONFIG.get("retrieval", {}).get("retriever_pool", {}) or {}
+RETRIEVER_POOL_MAX_SIZE = _pool_cfg.get("max_size", 32)
+RETRIEVER_POOL_IDLE_TTL = _pool_cfg.get("idle_ttl", 600)
+
+# collection -> (retriever, time of last use), least recently used first
+_retriever_pool: "OrderedDict[Optional[str], tuple]" = OrderedDict()
+_retriever_pool_lock = threading.Lock()
+# Embeddings client shared by all pooled retrievers
+_shared_embedder = None
+_shared_embedder_lock = threading.Lock()
+
+
+def _get_shared_embedder():
+    global _shared_embedder
+    with _shared_embedder_lock:
+        if _shared_embedder is None:
+            _shared_embedder = EmbeddingService()._embedder
+        return _shared_embedder
+
+
+def get_retriever(collection: Optional[str] = None) -> "Retriever":
+    """
+    Return the pooled Retriever for a collection, creating it on first use.
+    The pool holds at most retrieval.retriever_pool.max_size retrievers; retrievers unused
+    for retrieval.retriever_pool.idle_ttl seconds are evicted.
+    """
+    now = time.monotonic()
+    with _retriever_pool_lock:
+        for key in [key for key, (_, last_used) in _retriever_pool.items() if now - last_used > RETRIEVER_POOL_IDLE_TTL]:
+            del _retriever_pool[key]
+        entry = _retriever_pool.get(collection)
+        if entry is not None:
+            _retriever_pool[collection] = (entry[0], now)
+            _retriever_pool.move_to_end(collection)
+            return entry[0]
+        embedder = _get_shared_embedder()
+    # Built outside the lock so a slow collection check does not block other collections
+    retriever = Retriever(collection=collection, embedder=embedder)
+    with _retriever_pool_lock:
+        entry = _retriever_pool.get(collection)
+        if entry is not None:
+            retriever = entry[0]
+        _retriever_pool[collection] = (retriever, time.monotonic())
+        _retriever_pool.move_to_end(collection)
+        while len(_retriever_pool) > RETRIEVER_POOL_MAX_SIZE:
+            _retriever_pool.popitem(last=False)
+    return retriever
+
+
+def clear_retriever_pool() -> None:
+    """Drop all pooled retrievers (e.g. after a configuration change)."""
+    with _retriever_pool_lock:
+        _retriever_pool.clear()
+
+
+class _TTLCache:
+    """Thread-safe LRU cache whose entries expire ttl seconds after being stored."""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        # key -> (value, expiry time), least recently used first
+        self._entries: "OrderedDict[object, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Pre-retrieval LLM expansions (sub-questions, HyDE) share one chat client, run concurrently,
+# and are cached by normalized prompt so repeated questions skip the LLM round trips.
+EXPANSION_MODEL = "gpt-5-nano"
+_expansion_cfg = CONFIG.get("retrieval", {}).get("expansion_cache", {}) or {}
+_expansion_cache = _TTLCache(_expansion_cfg.get("ttl", 3600), _expansion_cfg.get("max_size", 1024))
+_expansion_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-expansion")
+_query_embedding_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="query-embedding")
+_shared_llm = None
+_shared_llm_lock = threading.Lock()
+
+
+def _get_shared_llm():
+    """Return the process-wide chat client used for query expansion and reranking."""
+    global _shared_llm
+    with _shared_llm_lock:
+        if _shared_llm is None:
+            _shared_llm = LLM(model=EXPANSION_MODEL, temperature=1).rag_llm("")
+        return _shared_llm
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Cache key of a prompt: case, whitespace and trailing punctuation are ignored."""
+    return re.sub(r"\s+", " ", prompt).strip().rstrip("?!.;: ").casefold()
+
+
+def _cached_expansion(kind: str, prompt: str, compute: Callable[[str], object]):
+    """Return the cached expansion of a prompt, computing and caching it if missing or expired."""
+    key = (kind, _normalize_prompt(prompt))
+    result = _expansion_cache.get(key)
+    if result is None:
+        result = compute(prompt)
+        _expansion_cache.put(key, result)
+    return result
+
+
+def clear_expansion_cache() -> None:
+    """Drop all cached query expansions."""
+    _expansion_cache.clear()
+
+
+# LLM reranking: passages are scored batch_size at a time per request, with at most
+# max_concurrency requests in flight, and scores are cached by (query, passage hash).
+_rerank_cfg = CONFIG.get("retrieval", {}).get("llm_rerank", {}) or {}
+RERANK_BATCH_SIZE = max(1, _rerank_cfg.get("batch_size", 20))
+RERANK_MAX_CONCURRENCY = max(1, _rerank_cfg.get("max_concurrency", 4))
+RERANK_PASSAGE_CHARS = _rerank_cfg.get("passage_chars", 400)
+_rerank_cache = _TTLCache(_rerank_cfg.get("cache_ttl", 3600), _rerank_cfg.get("cache_max_size", 50000))
+_rerank_executor = ThreadPoolExecutor(max_workers=RERANK_MAX_CONCURRENCY, thread_name_prefix="llm-rerank")
+
+
+def clear_rerank_cache() -> None:
+    """Drop all cached LLM rerank scores."""
+    _rerank_cache.clear()
+
+
+def _message_text(result) -> str:
+    """Text of an LLM result: chat models return a message, completion models a string."""
+    return (result.content if hasattr(result, "content") else str(result)).strip()
+
+
+def _parse_rerank_scores(content: str, count: int) -> List[float]:
+    """
+    Parse the JSON object {"1": score, ...} returned for a batch of count passages.
+    Missing or invalid scores are 0.0; scores are clamped to [0, 1].
+    """
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    try:
+        raw = json.loads(match.group(0)) if match else {}
+    except ValueError:
+        raw = {}
+    scores = []
+    for i in range(1, count + 1):
+        try:
+            scores.append(min(1.0, max(0.0, float(str(raw.get(str(i), 0.0)).replace(",", ".")))))
+        except ValueError:
+            scores.append(0.0)
+    return scores
+
+
+def _score_passage_batch(prompt: str, passages: List[str]) -> List[float]:
+    """Score a batch of passages against the prompt with a single LLM request."""
+    numbered = "\n\n".join(f"[{i}] {passage}" for i, passage in enumerate(passages, 1))
+    scoring_prompt = (
+        f"Question utilisateur : {prompt}\n\n"
+        f"Passages :\n{numbered}\n\n"
+        "Pour chaque passage, donne un score entre 0 et 1 indiquant à quel point il est pertinent "
+        "pour répondre à la question. Réponds uniquement par un objet JSON associant le numéro "
+        'de chaque passage à son score, par exemple {"1": 0.8, "2": 0.1}.'
+    )
+    return _parse_rerank_scores(_message_text(_get_shared_llm().invoke(scoring_prompt)), len(passages))
+
+
+def llm_rerank_scores(prompt: str, passages: List[str]) -> List[float]:
+    """
+    Relevance scores (0 to 1) of passages for a prompt, in the order of the passages.
+    Cached scores are reused; the others are requested RERANK_BATCH_SIZE passages per LLM
+    call, with at most RERANK_MAX_CONCURRENCY calls in flight. A failed call scores its
+    passages 0.0 without caching them.
+    """
+    query_key = _normalize_prompt(prompt)
+    passages = [passage[:RERANK_PASSAGE_CHARS] for passage in passages]
+    keys = [(query_key, hashlib.sha256(passage.encode("utf-8")).hexdigest()) for passage in passages]
+    scores: Dict[tuple, float] = {}
+    missing: Dict[tuple, str] = {}
+    for key, passage in zip(keys, passages):
+        cached = _rerank_cache.get(key)
+        if cached is not None:
+            scores[key] = cached
+        elif key not in missing:
+            missing[key] = passage
+
+    missing_keys = list(missing)
+    batches = [missing_keys[i:i + RERANK_BATCH_SIZE] for i in range(0, len(missing_keys), RERANK_BATCH_SIZE)]
+    futures = [_rerank_executor.submit(_score_passage_batch, prompt, [missing[key] for key in batch]) for batch in batches]
+    for batch, future in zip(batches, futures):
+        try:
+            batch_scores = future.result()
+        except Exception as e:
+            print(f"[WARN] Rerank batch failed: {e}")
+            batch_scores = [0.0] * len(batch)
+        else:
+            for key, score in zip(batch, batch_scores):
+                _rerank_cache.put(key, score)
+        scores.update(zip(batch, batch_scores))
+    return [scores[key] for key in keys]
+
+
+def expand_queries(prompt: str, split_prompt: bool = True, use_hyde: bool = False) -> List[str]:
+    """
+    Build the retrieval queries for a prompt: its sub-questions (or the prompt itself) and,
+    with use_hyde, a hypothetical answer. Both LLM calls run concurrently.
+    """
+    split_future = _expansion_executor.submit(Retriever.split_prompt_into_subquestions, prompt) if split_prompt else None
+    hyde_future = _expansion_executor.submit(Retriever.prompt_to_hyde, prompt) if use_hyde else None
+    queries = split_future.result() if split_future else [prompt]
+    if hyde_future:
+        try:
+            queries.append(hyde_future.result())
+        except Exception as e:
+            print(f"[WARN] HYDE generation failed: {e}")
+    return queries
+
+
+class LLMReranker(BaseReranker):
+    """Reranker scoring passages with the LLM (see Retriever.rerank_documents)."""
+
+    def rerank(self, query: str, docs: List[Document], top_k: int = 50) -> List[Document]:
+        return Retriever.rerank_documents(query, docs, top_k=top_k)
+
+
+RERANKERS = {
+    "llm": LLMReranker,
+    "cross_encoder": CrossEncoderReranker,
+}
+_rerankers: Dict[str, BaseReranker] = {}
+_rerankers_lock = threading.Lock()
+
+
+def get_reranker(name: Optional[str] = None) -> BaseReranker:
+    """
+    Return the shared reranker registered under name. By default the one selected by
+    retrieval.rerank when it names a reranker, otherwise the LLM reranker.
+    """
+    if name is None:
+        configured = CONFIG.get("retrieval", {}).get("rerank")
+        name = configured if isinstance(configured, str) else "llm"
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown reranker: {name} (expected one of {', '.join(RERANKERS)})")
+    with _rerankers_lock:
+        if name not in _rerankers:
+            _rerankers[name] = RERANKERS[name]()
+        return _rerankers[name]
 
 
 def retrieve_documents_advanced(
@@ -20,42 +292,54 @@ def retrieve_documents_advanced(
     top_k: Optional[int] = None,
     metadata_filter: Optional[Dict] = None,
     split_prompt: bool = True,
-    rerank: bool = False,
+    rerank: Union[bool, str] = False,
     use_hyde: bool = False,
     collection: Optional[str] = None,
+    timings: Optional[Dict[str, float]] = None,
 ) -> List[Document]:
     """
     Retrieve relevant documents for a given prompt, with options for prompt splitting, HyDE, and reranking.
     Returns unique documents by unique_id.
     collection: If provided, use this Qdrant collection (e.g., user ID)
+    rerank: True to rerank with the configured reranker, or the name of a reranker in RERANKERS
+    timings: If provided, filled with the duration in seconds of each stage
+        (expansion, search, rerank, total)
     """
-    retriever = Retriever(collection=collection)
-    queries = [prompt]
-    if split_prompt:
-        queries = Retriever.split_prompt_into_subquestions(prompt)
-    if use_hyde:
-        try:
-            hyde = Retriever.prompt_to_hyde(prompt)
-            queries.append(hyde)
-        except Exception as e:
-            print(f"[WARN] HYDE generation failed: {e}")
+    if timings is None:
+        timings = {}
+    start = step_start = time.perf_counter()
+
+    def record(stage: str) -> None:
+        nonlocal step_start
+        now = time.perf_counter()
+        timings[stage] = round(now - step_start, 3)
+        step_start = now
+
+    retriever = get_retriever(collection)
+    queries = expand_queries(prompt, split_prompt=split_prompt, use_hyde=use_hyde)
+    record("expansion")
     all_docs = []
     seen_unique_ids = set()
-    for q in queries:
-        docs = retriever.retrieve(q, top_k=top_k, metadata_filter=metadata_filter)
+    # Concurrent query embeddings and one Qdrant request for all sub-queries
+    for docs in retriever.retrieve_many(queries, top_k=top_k, metadata_filter=metadata_filter):
         for d in docs:
             unique_id = d.metadata.get("unique_id")
             if unique_id and unique_id not in seen_unique_ids:
                 all_docs.append(d)
                 seen_unique_ids.add(unique_id)
+    record("search")
     if rerank:
-        return Retriever.rerank_documents(prompt, all_docs, top_k=top_k or retriever.top_k)
+        reranker = get_reranker(rerank if isinstance(rerank, str) else None)
+        docs = reranker.rerank(prompt, all_docs, top_k=top_k or retriever.top_k)
+        record("rerank")
     else:
-        return all_docs[:top_k] if top_k else all_docs
+        docs = all_docs[:top_k] if top_k else all_docs
+    timings["total"] = round(time.perf_counter() - start, 3)
+    return docs
 
 
 class Retriever(BaseRetriever):
-    def __init__(self, collection: Optional[str] = None):
+    def __init__(self, collection: Optional[str] = None, embedder=None):
         self.config = load_config()
         retrieval_cfg = self.config.get("retrieval", {})
         vectorstore_cfg = retrieval_cfg.get("vectorstore", {})
@@ -63,8 +347,7 @@ class Retriever(BaseRetriever):
         self.COLLECTION_NAME = collection or vectorstore_cfg.get("collection", os.getenv("COLLECTION_NAME", "rag_documents"))
         self.MIN_SCORE = retrieval_cfg.get("min_score", 0.2)
         self.top_k = retrieval_cfg.get("top_k", 50)
-        embedder_instance = EmbeddingService()
-        self.embedder = embedder_instance._embedder
+        self.embedder = embedder if embedder is not None else EmbeddingService()._embedder
         # Use VectorStoreManager for Qdrant client and collection management
         self.vectorstore_manager = VectorStoreManager(self.COLLECTION_NAME)
         self.qdrant_client = self.vectorstore_manager.get_qdrant_client()
@@ -78,23 +361,58 @@ class Retriever(BaseRetriever):
         """
         Retrieve relevant documents for a given query using Qdrant vectorstore.
         """
+        return self.retrieve_many([query], top_k=top_k, metadata_filter=metadata_filter)[0]
+
+    def retrieve_many(self, queries: List[str], top_k: int = None, metadata_filter: Dict = None) -> List[List[Document]]:
+        """
+        Retrieve relevant documents for several queries at once: the queries are embedded
+        concurrently with embed_query and searched with a single Qdrant query_batch_points
+        request. Points scoring below min_score are dropped by Qdrant.
+        Returns one list of documents per query, in the order of the queries.
+        """
+        if not queries:
+            return []
         if top_k is None:
             top_k = self.top_k
-        search_kwargs = {"k": top_k}
-        if metadata_filter:
-            search_kwargs["filter"] = metadata_filter
-        docs = self.vectorstore.similarity_search(query, **search_kwargs)
-        # Filter by min_score if available
-        filtered_docs = [d for d in docs if getattr(d, 'score', 1.0) >= self.MIN_SCORE]
-        return filtered_docs
+        vectors = self.embed_queries(queries)
+        using = self.vectorstore.vector_name or None
+        requests = [
+            rest.QueryRequest(query=vector, filter=metadata_filter or None, limit=top_k, using=using,
+                              score_threshold=self.MIN_SCORE, with_payload=True)
+            for vector in vectors
+        ]
+        responses = self.qdrant_client.query_batch_points(collection_name=self.COLLECTION_NAME, requests=requests)
+        return [[self._document_from_point(point) for point in response.points] for response in responses]
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed search queries with embed_query (not embed_documents: asymmetric models and the
+        embedding cache treat queries differently), concurrently when there are several.
+        """
+        if len(queries) == 1:
+            return [self.embedder.embed_query(queries[0])]
+        return list(_query_embedding_executor.map(self.embedder.embed_query, queries))
+
+    def _document_from_point(self, point) -> Document:
+        """Build a Document from a Qdrant point, with the same payload layout as QdrantVectorStore."""
+        payload = point.payload or {}
+        metadata = dict(payload.get(self.vectorstore.metadata_payload_key) or {})
+        metadata["_id"] = point.id
+        metadata["_collection_name"] = self.COLLECTION_NAME
+        metadata["_score"] = point.score
+        return Document(page_content=payload.get(self.vectorstore.content_payload_key) or "", metadata=metadata)
 
     @staticmethod
     def prompt_to_hyde(prompt: str) -> str:
         """
         Given a user prompt, generate a hypothetical answer (HYDE) using the LLM.
+        Results are cached by normalized prompt.
         """
-        router = LLM(model="gpt-5-nano", temperature=1)
-        llm = router.rag_llm(prompt)
+        return _cached_expansion("hyde", prompt, Retriever._generate_hyde)
+
+    @staticmethod
+    def _generate_hyde(prompt: str) -> str:
+        llm = _get_shared_llm()
         hyde_instruction = (
             "Given the following query, generate a plausible and detailed answer as if you were an expert on the topic. "
             "This answer will be used to create a hypothetical embedding for improved retrieval.\n"
@@ -116,9 +434,13 @@ class Retriever(BaseRetriever):
     def split_prompt_into_subquestions(prompt: str) -> List[str]:
         """
         Use the LLM to split a complex prompt into subquestions.
+        Results are cached by normalized prompt; the returned list is a copy.
         """
-        router = LLM(model="gpt-5-nano", temperature=1)
-        llm = router.rag_llm(prompt)
+        return list(_cached_expansion("split", prompt, Retriever._generate_subquestions))
+
+    @staticmethod
+    def _generate_subquestions(prompt: str) -> List[str]:
+        llm = _get_shared_llm()
         system_prompt = (
             "Tu es un assistant qui reçoit une question complexe ou un prompt utilisateur. "
             "Découpe ce prompt en sous-questions simples et indépendantes, utiles pour la recherche documentaire. "
@@ -137,29 +459,14 @@ class Retriever(BaseRetriever):
     @staticmethod
     def rerank_documents(prompt: str, docs: List[Document], top_k: int = 50) -> List[Document]:
         """
-        Rerank documents according to their relevance to the prompt using the LLM as a cross-encoder.
-        Returns the top_k unique documents by doc_id.
+        Rerank documents according to their relevance to the prompt using the LLM as a scorer.
+        Passages are scored in batches of concurrent LLM requests (see llm_rerank_scores).
+        Returns the top_k documents, best first.
         """
-        router = LLM(model="gpt-5-nano", temperature=1)
-        llm = router.rag_llm(prompt)
-        scored_docs = []
-        for d in docs:
-            scoring_prompt = (
-                f"Question utilisateur : {prompt}\n"
-                f"Passage : {d.page_content[:400]}\n"
-                "Sur une échelle de 0 à 1, à quel point ce passage est-il pertinent pour répondre à la question ? "
-                "Réponds uniquement par un score numérique entre 0 et 1."
-            )
-            try:
-                score_str = llm.invoke(scoring_prompt).strip().replace(",", ".")
-                score = float(score_str.split()[0])
-            except Exception:
-                score = 0.0
-            scored_docs.append((score, d))
-        scored_docs.sort(reverse=True, key=lambda x: x[0])
+        scores = llm_rerank_scores(prompt, [d.page_content for d in docs])
+        scored_docs = sorted(zip(scores, docs), reverse=True, key=lambda x: x[0])
         return [d for _, d in scored_docs[:top_k]]
 
-
 if __name__ == "__main__":
     import sys
     question = sys.argv[1] if len(sys.argv) > 1 else "Decris le bail de madame moreau?"
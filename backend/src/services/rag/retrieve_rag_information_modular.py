@@ -65,6 +65,7 @@ def get_rag_response_modular(question: str, metadata_filter=None, top_k=None, us
     # Use user_id as collection if provided
     collection = user_id if user_id else "rag_documents1536"
     if use_retrieval:
+        retrieval_timings = {}
         docs = retrieve_documents_advanced(
             prompt=question,
             top_k=top_k,
@@ -72,9 +73,10 @@ def get_rag_response_modular(question: str, metadata_filter=None, top_k=None, us
             split_prompt=split_prompt,
             rerank=rerank,
             use_hyde=use_hyde,
-            collection=collection
+            collection=collection,
+            timings=retrieval_timings
         )
-        logger.info(f"Number of retrieved documents: {len(docs)}")
+        logger.info(f"Number of retrieved documents: {len(docs)}, timings: {retrieval_timings}")
 
         def get_chunk_source(doc):
             metadata = getattr(doc, "metadata", {}) or {}
@@ -175,6 +177,7 @@ def get_rag_response_modular(question: str, metadata_filter=None, top_k=None, us
             "context": context,
             "documents": docs,
             "sources_info": sources_info,  # <-- new field with mappings
+            "retrieval_timings": retrieval_timings,
         }
     else:
         prompt_template = (
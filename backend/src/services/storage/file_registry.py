@@ -5,59 +5,89 @@ Permet de suivre les fichiers, leurs hashes, dates de modification et IDs.
 import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
-import json
 import logging
 import hashlib
+import threading
+from contextlib import contextmanager
+from functools import wraps
 from typing import Dict, List, Optional, Any, Set
 from datetime import datetime
 
+from src.core.config import CONFIG
 from src.core.logger import log
+from src.services.storage.file_registry_backends import (
+    JsonRegistryBackend,
+    SqliteRegistryBackend,
+    migrate_json_to_sqlite
+)
 logger = log.bind(name="src.services.storage.file_registry")
 backend_dir = os.path.abspath(os.path.join(__file__, '..', '..', '..', '..'))
 data_dir = os.path.join(backend_dir, 'data', 'file_registry')
-print(data_dir)
+
+
+def _synchronized(method):
+    """Exécute la méthode sous le verrou du registre."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class FileRegistry:
     """
-    Classe permettant de gérer un registre des fichiers ingérés dans Qdrant
-    sous forme de fichier JSON.
+    Classe permettant de gérer un registre des fichiers ingérés dans Qdrant.
+    Le stockage est délégué à un backend JSON (historique) ou SQLite,
+    choisi par storage.file_registry.backend dans config.yaml.
     """
-    def __init__(self,user_id):
+    def __init__(self, user_id, *, backend: Optional[str] = None, registry_dir: Optional[str] = None):
         """
         Initialise le registre des fichiers.
         
         Args:
             user_id: Identifiant de l'utilisateur.
+            backend: "json" ou "sqlite". Par défaut, valeur de la configuration.
+            registry_dir: Répertoire des registres. Par défaut data/file_registry.
         """
-        backend_dir = os.path.abspath(os.path.join(__file__, '..', '..', '..', '..'))
-        data_dir = os.path.join(backend_dir, 'data', 'file_registry')
-        os.makedirs(data_dir, exist_ok=True)
-        self.registry_path = os.path.join(data_dir, f'file_registry_{user_id}.json')
-        self.registry: Dict[str, Dict[str, Any]] = {}
-        self._load_registry()
-    
-    def _load_registry(self) -> None:
-        """Charge le registre depuis le fichier JSON s'il existe."""
-        if os.path.exists(self.registry_path):
-            try:
-                with open(self.registry_path, 'r', encoding='utf-8') as f:
-                    self.registry = json.load(f)
-            except (json.JSONDecodeError, IOError) as e:
-                logger.error(f"Erreur lors du chargement du registre: {e}")
-                # Si le fichier est corrompu, créer un nouveau registre vide
-                self.registry = {}
+        registry_dir = registry_dir or data_dir
+        # Le registre est partagé entre les générateurs des fournisseurs et l'étage d'upsert
+        # du pipeline : chaque accès, et tout un bloc batch(), se fait sous ce verrou
+        self._lock = threading.RLock()
+        os.makedirs(registry_dir, exist_ok=True)
+        if backend is None:
+            backend = CONFIG.get("storage", {}).get("file_registry", {}).get("backend", "json")
+        self.backend_name = backend
+        json_path = os.path.join(registry_dir, f'file_registry_{user_id}.json')
+
+        if backend == "sqlite":
+            self.registry_path = os.path.join(registry_dir, f'file_registry_{user_id}.sqlite')
+            if not os.path.exists(self.registry_path) and os.path.exists(json_path):
+                # Première ouverture en SQLite: import unique du registre JSON existant
+                migrate_json_to_sqlite(json_path, self.registry_path)
+            self._backend = SqliteRegistryBackend(self.registry_path)
+        elif backend == "json":
+            self.registry_path = json_path
+            self._backend = JsonRegistryBackend(self.registry_path)
         else:
-            logger.info("Aucun registre existant trouvé, création d'un nouveau registre")
-            self.registry = {}
-            self._save_registry()
-    
-    def _save_registry(self) -> None:
-        """Sauvegarde le registre dans le fichier JSON."""
-        try:
-            with open(self.registry_path, 'w', encoding='utf-8') as f:
-                json.dump(self.registry, f, indent=2, ensure_ascii=False)
-            logger.debug(f"Registre sauvegardé: {len(self.registry)} fichiers")
-        except IOError as e:
-            logger.error(f"Erreur lors de la sauvegarde du registre: {e}")
+            raise ValueError(f"Backend de registre '{backend}' non pris en charge")
+
+    @_synchronized
+    def __len__(self) -> int:
+        """Nombre de fichiers dans le registre."""
+        return self._backend.count()
+
+    @contextmanager
+    def batch(self):
+        """
+        Regroupe les modifications du registre et les écrit une seule fois en sortie de bloc.
+
+        Exemple:
+            with file_registry.batch():
+                for doc in docs:
+                    file_registry.add_file(...)
+        """
+        with self._lock, self._backend.batch():
+            yield self
     
     def compute_file_hash(self, file_content: bytes) -> str:
         """
@@ -73,6 +103,7 @@ class FileRegistry:
         hasher.update(file_content)
         return hasher.hexdigest()
     
+    @_synchronized
     def add_file(self, 
                 doc_id: str, 
                 file_hash: str, 
@@ -93,7 +124,7 @@ class FileRegistry:
         """
         if last_modified is None:
             last_modified = datetime.now().isoformat()
-        self.registry[source_path] = {
+        entry = {
             "doc_id": doc_id,
             "hash": file_hash,
             "source_path": source_path,  # Utiliser file_path comme fallback
@@ -102,10 +133,11 @@ class FileRegistry:
         }
         
         if metadata:
-            self.registry[source_path]["metadata"] = metadata
+            entry["metadata"] = metadata
             
-        self._save_registry()
+        self._backend.put(source_path, entry)
         
+    @_synchronized
     def remove_file(self, file_path: str) -> bool:
         """
         Supprime un fichier du registre.
@@ -116,12 +148,9 @@ class FileRegistry:
         Returns:
             True si le fichier a été supprimé, False sinon.
         """
-        if file_path in self.registry:
-            del self.registry[file_path]
-            self._save_registry()
-            return True
-        return False
+        return self._backend.delete(file_path)
     
+    @_synchronized
     def file_exists(self, file_path: str) -> bool:
         """
         Vérifie si un fichier existe dans le registre.
@@ -132,8 +161,9 @@ class FileRegistry:
         Returns:
             True si le fichier existe dans le registre, False sinon.
         """
-        return file_path in self.registry
+        return self._backend.contains(file_path)
     
+    @_synchronized
     def get_file_info(self, file_path: str) -> Optional[Dict[str, Any]]:
         """
         Récupère les informations d'un fichier dans le registre.
@@ -144,8 +174,9 @@ class FileRegistry:
         Returns:
             Informations du fichier ou None s'il n'existe pas.
         """
-        return self.registry.get(file_path)
+        return self._backend.get(file_path)
     
+    @_synchronized
     def get_doc_id(self, file_path: str) -> Optional[str]:
         """
         Récupère l'ID du document dans Qdrant.
@@ -159,6 +190,7 @@ class FileRegistry:
         file_info = self.get_file_info(file_path)
         return file_info["doc_id"] if file_info else None
     
+    @_synchronized
     def has_changed(self, file_path: str, new_hash: str) -> bool:
         """
         Vérifie si un fichier a changé en comparant son hash.
@@ -175,6 +207,7 @@ class FileRegistry:
             return True  # Considéré comme changé s'il n'existe pas
         return file_info["hash"] != new_hash
     
+    @_synchronized
     def get_all_file_paths(self) -> Set[str]:
         """
         Récupère l'ensemble des chemins de fichiers dans le registre.
@@ -182,8 +215,9 @@ class FileRegistry:
         Returns:
             Ensemble des chemins de fichiers.
         """
-        return set(self.registry.keys())
+        return set(self._backend.paths())
     
+    @_synchronized
     def get_files_by_prefix(self, prefix: str) -> List[str]:
         """
         Récupère les fichiers dont le chemin commence par un préfixe.
@@ -194,8 +228,9 @@ class FileRegistry:
         Returns:
             Liste des chemins de fichiers correspondants.
         """
-        return [path for path in self.registry.keys() if path.startswith(prefix)]
+        return self._backend.paths_with_prefix(prefix)
         
+    @_synchronized
     def get_user_documents(self, document_type: Optional[str] = None, include_metadata: bool = True) -> List[Dict[str, Any]]:
         """
         Récupère les documents/emails uniques d'un utilisateur avec leurs métadonnées.
@@ -210,13 +245,8 @@ class FileRegistry:
         """
         results = []
         
-        # Parcourir tous les fichiers dans le registre
-        for file_path, file_info in self.registry.items():
-            # Si un type de document est spécifié, vérifier dans les métadonnées
-            if document_type and "metadata" in file_info:
-                if file_info["metadata"].get("document_type") != document_type:
-                    continue
-            
+        # Documents filtrés par type, du plus récent au plus ancien
+        for file_path, file_info in self._backend.documents(document_type):
             # Construire les informations de base du document
             doc_info = {
                 "path": file_path,
@@ -235,11 +265,9 @@ class FileRegistry:
             
             results.append(doc_info)
         
-        # Trier par date de modification (du plus récent au plus ancien)
-        results.sort(key=lambda x: x.get("last_modified", ""), reverse=True)
-        
         return results
         
+    @_synchronized
     def count_user_documents(self, document_type: Optional[str] = None, prefix: Optional[str] = None) -> int:
         """
         Compte le nombre de documents/emails d'un utilisateur, avec filtrage optionnel.
@@ -253,26 +281,37 @@ class FileRegistry:
         Returns:
             Nombre de documents correspondants aux critères.
         """
-        count = 0
+        return self._backend.count_documents(document_type=document_type, prefix=prefix)
+
+    @_synchronized
+    def get_paths_by_doc_id(self, doc_id: str) -> List[str]:
+        """
+        Récupère les chemins des entrées partageant un doc_id, par exemple une même pièce
+        jointe référencée par plusieurs emails. Leur nombre sert de compteur de références
+        des chunks du document dans Qdrant.
         
-        # Si un préfixe est spécifié, filtrer d'abord par préfixe
-        if prefix:
-            file_paths = self.get_files_by_prefix(prefix)
-        else:
-            file_paths = list(self.registry.keys())
+        Args:
+            doc_id: Identifiant du document dans Qdrant.
             
-        # Si aucun type de document n'est spécifié, retourner simplement le nombre de fichiers
-        if not document_type:
-            return len(file_paths)
+        Returns:
+            Liste des chemins correspondants.
+        """
+        return list(self._backend.paths_by_doc_id(doc_id))
+
+    @_synchronized
+    def get_paths_by_provider_id(self, provider_id: str) -> List[str]:
+        """
+        Récupère les chemins des entrées ayant un provider_id donné (un email et ses pièces jointes).
+        
+        Args:
+            provider_id: Identifiant de l'élément chez le fournisseur.
             
-        # Compter les fichiers correspondant au type spécifié
-        for path in file_paths:
-            file_info = self.registry.get(path, {})
-            if "metadata" in file_info and file_info["metadata"].get("document_type") == document_type:
-                count += 1
-                
-        return count
+        Returns:
+            Liste des chemins correspondants.
+        """
+        return list(self._backend.paths_by_provider_id(provider_id))
 
+    @_synchronized
     def update_email_classification(self, email_id: str, user_id: str, classified_action: str = 'not classified') -> bool:
         """
         Met à jour le statut de classification d'un email dans le registre.
@@ -287,22 +326,19 @@ class FileRegistry:
         """
         updated = False
         
-        # Parcourir tous les fichiers dans le registre pour trouver l'email correspondant
-        for file_path, file_info in self.registry.items():
-            # Vérifier si c'est un email et s'il correspond à l'ID recherché
-            if "metadata" in file_info and file_info["metadata"].get("provider_id") == email_id:
-                # Mettre à jour le statut de classification dans les métadonnées
-                if "metadata" not in file_info:
-                    file_info["metadata"] = {}
-                
-                file_info["metadata"]["is_classified"] = classified_action
-                file_info["last_modified"] = datetime.now().isoformat()
-                updated = True
-                logger.info(f"Classification de l'email {email_id} mise à jour: {classified_action}")
+        # Retrouver les entrées de l'email par son provider_id
+        for file_path in self._backend.paths_by_provider_id(email_id):
+            file_info = self._backend.get(file_path)
+            if not file_info:
+                continue
+            # Mettre à jour le statut de classification dans les métadonnées
+            file_info["metadata"]["is_classified"] = classified_action
+            file_info["last_modified"] = datetime.now().isoformat()
+            self._backend.put(file_path, file_info)
+            updated = True
+            logger.info(f"Classification de l'email {email_id} mise à jour: {classified_action}")
         
-        # Sauvegarder les modifications si au moins un email a été mis à jour
         if updated:
-            self._save_registry()
             return True
         else:
             logger.warning(f"Aucun email avec l'ID {email_id} trouvé dans le registre pour l'utilisateur {user_id}")
@@ -0,0 +1,495 @@
+"""
+Backends de stockage du registre des fichiers ingérés.
+
+- JsonRegistryBackend: un fichier JSON par utilisateur (format historique).
+- SqliteRegistryBackend: une base SQLite (WAL) par utilisateur, indexée sur
+  source_path, doc_id, metadata.provider_id et document_type.
+
+Les entrées ont la même forme dans les deux backends:
+{"doc_id", "hash", "source_path", "last_modified", "last_synced", "metadata"?}
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+import json
+import bisect
+import heapq
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Iterator, Tuple
+
+from src.core.logger import log
+logger = log.bind(name="src.services.storage.file_registry_backends")
+
+
+class RegistryCorruptedError(Exception):
+    """Le fichier du registre existe mais ne peut pas être lu."""
+
+
+class RegistryBackend(ABC):
+    """Interface commune des backends du registre."""
+
+    _batch_depth = 0
+
+    @contextmanager
+    def batch(self):
+        """
+        Regroupe les modifications et ne les persiste qu'une fois, à la sortie
+        du bloc le plus externe (y compris en cas d'exception, les modifications
+        déjà appliquées étant conservées).
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._flush()
+
+    def _flush(self) -> None:
+        """Persiste les modifications mises en attente par batch()."""
+
+    @abstractmethod
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """Retourne l'entrée d'un chemin ou None."""
+
+    @abstractmethod
+    def put(self, path: str, entry: Dict[str, Any]) -> None:
+        """Ajoute ou remplace l'entrée d'un chemin."""
+
+    @abstractmethod
+    def delete(self, path: str) -> bool:
+        """Supprime l'entrée d'un chemin. Retourne True si elle existait."""
+
+    @abstractmethod
+    def contains(self, path: str) -> bool:
+        """Indique si un chemin est présent."""
+
+    @abstractmethod
+    def paths(self) -> List[str]:
+        """Retourne tous les chemins."""
+
+    @abstractmethod
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Itère sur les couples (chemin, entrée)."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Nombre d'entrées."""
+
+    @abstractmethod
+    def paths_with_prefix(self, prefix: str) -> List[str]:
+        """Chemins commençant par un préfixe."""
+
+    @abstractmethod
+    def paths_by_doc_id(self, doc_id: str) -> List[str]:
+        """Chemins des entrées partageant un doc_id (contenu dédupliqué)."""
+
+    @abstractmethod
+    def paths_by_provider_id(self, provider_id: str) -> List[str]:
+        """Chemins dont metadata.provider_id vaut provider_id."""
+
+    @abstractmethod
+    def documents(self, document_type: Optional[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """Entrées (filtrées par type si demandé), de la plus récente à la plus ancienne."""
+
+    @abstractmethod
+    def count_documents(self, document_type: Optional[str] = None, prefix: Optional[str] = None) -> int:
+        """Nombre d'entrées filtrées par type et/ou préfixe."""
+
+
+def _document_type(entry: Dict[str, Any]) -> Optional[str]:
+    metadata = entry.get("metadata")
+    return metadata.get("document_type") if isinstance(metadata, dict) else None
+
+
+def _provider_id(entry: Dict[str, Any]) -> Optional[str]:
+    metadata = entry.get("metadata")
+    return metadata.get("provider_id") if isinstance(metadata, dict) else None
+
+
+# Clé d'index des entrées sans métadonnées (jamais filtrées par type)
+_NO_METADATA = ("__no_metadata__",)
+
+
+class JsonRegistryBackend(RegistryBackend):
+    """
+    Registre stocké sous forme d'un dictionnaire JSON {source_path: entrée}.
+    Le fichier est réécrit à chaque modification, ou une seule fois par bloc batch().
+
+    Des index secondaires en mémoire (doc_id, provider_id, document_type, last_modified,
+    chemins triés) sont construits au chargement et maintenus à chaque put/delete.
+    """
+
+    def __init__(self, registry_path: str):
+        self.registry_path = registry_path
+        self.registry: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._load()
+        self._build_indexes()
+
+    def _build_indexes(self) -> None:
+        """Construit les index secondaires à partir du registre chargé."""
+        # doc_id -> chemins
+        self._by_doc_id: Dict[str, set] = {}
+        # provider_id -> chemins
+        self._by_provider_id: Dict[str, set] = {}
+        # document_type (ou _NO_METADATA) -> [(last_modified, chemin)] trié
+        self._by_type: Dict[Any, List[Tuple[str, str]]] = {}
+        # [(last_modified, chemin)] trié, toutes entrées confondues
+        self._by_last_modified: List[Tuple[str, str]] = []
+        # chemins triés, pour les recherches par préfixe
+        self._sorted_paths: List[str] = sorted(self.registry.keys())
+        # chemin -> clés sous lesquelles l'entrée est indexée
+        self._index_keys: Dict[str, Tuple[str, Any, Optional[str], Optional[str]]] = {}
+
+        for path, entry in self.registry.items():
+            keys = self._entry_keys(entry)
+            self._index_keys[path] = keys
+            last_modified, type_key, provider_id, doc_id = keys
+            self._by_last_modified.append((last_modified, path))
+            self._by_type.setdefault(type_key, []).append((last_modified, path))
+            if doc_id:
+                self._by_doc_id.setdefault(doc_id, set()).add(path)
+            if provider_id:
+                self._by_provider_id.setdefault(provider_id, set()).add(path)
+        self._by_last_modified.sort()
+        for entries in self._by_type.values():
+            entries.sort()
+
+    @staticmethod
+    def _entry_keys(entry: Dict[str, Any]) -> Tuple[str, Any, Optional[str], Optional[str]]:
+        type_key = _document_type(entry) if "metadata" in entry else _NO_METADATA
+        return entry.get("last_modified") or "", type_key, _provider_id(entry), entry.get("doc_id")
+
+    @staticmethod
+    def _sorted_remove(items: list, item) -> None:
+        index = bisect.bisect_left(items, item)
+        if index < len(items) and items[index] == item:
+            del items[index]
+
+    def _index_add(self, path: str, entry: Dict[str, Any]) -> None:
+        keys = self._entry_keys(entry)
+        self._index_keys[path] = keys
+        last_modified, type_key, provider_id, doc_id = keys
+        bisect.insort(self._by_last_modified, (last_modified, path))
+        bisect.insort(self._by_type.setdefault(type_key, []), (last_modified, path))
+        if doc_id:
+            self._by_doc_id.setdefault(doc_id, set()).add(path)
+        if provider_id:
+            self._by_provider_id.setdefault(provider_id, set()).add(path)
+        bisect.insort(self._sorted_paths, path)
+
+    def _index_remove(self, path: str) -> None:
+        # Les clés enregistrées sont utilisées car l'entrée a pu être modifiée sur place
+        keys = self._index_keys.pop(path, None)
+        if keys is None:
+            return
+        last_modified, type_key, provider_id, doc_id = keys
+        self._sorted_remove(self._by_last_modified, (last_modified, path))
+        self._sorted_remove(self._by_type.get(type_key, []), (last_modified, path))
+        if doc_id and doc_id in self._by_doc_id:
+            self._by_doc_id[doc_id].discard(path)
+            if not self._by_doc_id[doc_id]:
+                del self._by_doc_id[doc_id]
+        if provider_id and provider_id in self._by_provider_id:
+            self._by_provider_id[provider_id].discard(path)
+            if not self._by_provider_id[provider_id]:
+                del self._by_provider_id[provider_id]
+        self._sorted_remove(self._sorted_paths, path)
+
+    def _load(self) -> None:
+        """Charge le registre depuis le fichier JSON s'il existe."""
+        if os.path.exists(self.registry_path):
+            try:
+                with open(self.registry_path, 'r', encoding='utf-8') as f:
+                    self.registry = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logger.error(f"Erreur lors du chargement du registre {self.registry_path}: {e}")
+                # Ne pas repartir d'un registre vide: cela forcerait une réingestion complète
+                raise RegistryCorruptedError(f"Registre illisible: {self.registry_path}") from e
+        else:
+            logger.info("Aucun registre existant trouvé, création d'un nouveau registre")
+            self.registry = {}
+            self._write()
+
+    def _save(self) -> None:
+        """Sauvegarde le registre, ou la diffère jusqu'à la fin du bloc batch() en cours."""
+        if self._batch_depth:
+            self._dirty = True
+            return
+        self._write()
+
+    def _flush(self) -> None:
+        if self._dirty:
+            self._write()
+
+    def _write(self) -> None:
+        """Écrit le registre dans un fichier temporaire puis le renomme (écriture atomique)."""
+        directory = os.path.dirname(os.path.abspath(self.registry_path))
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                json.dump(self.registry, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.registry_path)
+            self._dirty = False
+            logger.debug(f"Registre sauvegardé: {len(self.registry)} fichiers")
+        except (IOError, OSError) as e:
+            logger.error(f"Erreur lors de la sauvegarde du registre: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        return self.registry.get(path)
+
+    def put(self, path: str, entry: Dict[str, Any]) -> None:
+        self._index_remove(path)
+        self.registry[path] = entry
+        self._index_add(path, entry)
+        self._save()
+
+    def delete(self, path: str) -> bool:
+        if path in self.registry:
+            self._index_remove(path)
+            del self.registry[path]
+            self._save()
+            return True
+        return False
+
+    def contains(self, path: str) -> bool:
+        return path in self.registry
+
+    def paths(self) -> List[str]:
+        return list(self.registry.keys())
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        return iter(list(self.registry.items()))
+
+    def count(self) -> int:
+        return len(self.registry)
+
+    def paths_with_prefix(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._sorted_paths, prefix)
+        end = bisect.bisect_left(self._sorted_paths, prefix + "\U0010ffff", lo=start)
+        return self._sorted_paths[start:end]
+
+    def paths_by_doc_id(self, doc_id: str) -> List[str]:
+        return list(self._by_doc_id.get(doc_id, ()))
+
+    def paths_by_provider_id(self, provider_id: str) -> List[str]:
+        return list(self._by_provider_id.get(provider_id, ()))
+
+    def documents(self, document_type: Optional[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        if document_type:
+            # Les entrées sans métadonnées ne sont pas filtrées (comportement historique)
+            ordered = heapq.merge(
+                reversed(self._by_type.get(document_type, [])),
+                reversed(self._by_type.get(_NO_METADATA, [])),
+                reverse=True
+            )
+        else:
+            ordered = reversed(self._by_last_modified)
+        return [(path, self.registry[path]) for _, path in ordered]
+
+    def count_documents(self, document_type: Optional[str] = None, prefix: Optional[str] = None) -> int:
+        if not prefix:
+            return len(self._by_type.get(document_type, [])) if document_type else len(self.registry)
+        paths = self.paths_with_prefix(prefix)
+        if not document_type:
+            return len(paths)
+        return sum(1 for path in paths if self._index_keys[path][1] == document_type)
+
+
+class SqliteRegistryBackend(RegistryBackend):
+    """
+    Registre stocké dans une base SQLite en mode WAL.
+    Chaque modification est une écriture d'une seule ligne indexée.
+    """
+
+    _SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS files ("
+        " source_path TEXT PRIMARY KEY,"
+        " doc_id TEXT,"
+        " hash TEXT,"
+        " last_modified TEXT,"
+        " last_synced TEXT,"
+        " provider_id TEXT,"
+        " document_type TEXT,"
+        " has_metadata INTEGER NOT NULL DEFAULT 0,"
+        " entry TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_files_doc_id ON files(doc_id)",
+        "CREATE INDEX IF NOT EXISTS idx_files_provider_id ON files(provider_id)",
+        "CREATE INDEX IF NOT EXISTS idx_files_document_type ON files(document_type, last_modified)",
+        "CREATE INDEX IF NOT EXISTS idx_files_last_modified ON files(last_modified)",
+    ]
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self._SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def _commit(self) -> None:
+        """Valide la transaction, sauf à l'intérieur d'un bloc batch()."""
+        if not self._batch_depth:
+            self._conn.commit()
+
+    def _flush(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    @staticmethod
+    def _row(path: str, entry: Dict[str, Any]) -> Tuple:
+        return (
+            path,
+            entry.get("doc_id"),
+            entry.get("hash"),
+            entry.get("last_modified"),
+            entry.get("last_synced"),
+            _provider_id(entry),
+            _document_type(entry),
+            1 if "metadata" in entry else 0,
+            json.dumps(entry, ensure_ascii=False),
+        )
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT entry FROM files WHERE source_path = ?", (path,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def put(self, path: str, entry: Dict[str, Any]) -> None:
+        self.put_many([(path, entry)])
+
+    def put_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Ajoute ou remplace plusieurs entrées dans une seule transaction."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files "
+                "(source_path, doc_id, hash, last_modified, last_synced, provider_id, document_type, has_metadata, entry) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._row(path, entry) for path, entry in items]
+            )
+            self._commit()
+
+    def delete(self, path: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM files WHERE source_path = ?", (path,))
+            self._commit()
+            return cursor.rowcount > 0
+
+    def contains(self, path: str) -> bool:
+        return bool(self._query("SELECT 1 FROM files WHERE source_path = ?", (path,)))
+
+    def paths(self) -> List[str]:
+        return [row[0] for row in self._query("SELECT source_path FROM files")]
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for path, entry in self._query("SELECT source_path, entry FROM files"):
+            yield path, json.loads(entry)
+
+    def count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM files")[0][0]
+
+    @staticmethod
+    def _prefix_range(prefix: str) -> Tuple[str, str]:
+        # Plage [prefix, prefix + U+10FFFF) pour utiliser l'index de la clé primaire
+        return prefix, prefix + "\U0010ffff"
+
+    def paths_with_prefix(self, prefix: str) -> List[str]:
+        low, high = self._prefix_range(prefix)
+        rows = self._query("SELECT source_path FROM files WHERE source_path >= ? AND source_path < ?", (low, high))
+        return [row[0] for row in rows]
+
+    def paths_by_doc_id(self, doc_id: str) -> List[str]:
+        return [row[0] for row in self._query("SELECT source_path FROM files WHERE doc_id = ?", (doc_id,))]
+
+    def paths_by_provider_id(self, provider_id: str) -> List[str]:
+        return [row[0] for row in self._query("SELECT source_path FROM files WHERE provider_id = ?", (provider_id,))]
+
+    def documents(self, document_type: Optional[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        if document_type:
+            # Les entrées sans métadonnées ne sont pas filtrées (comportement historique)
+            rows = self._query(
+                "SELECT source_path, entry FROM files "
+                "WHERE document_type = ? OR has_metadata = 0 "
+                "ORDER BY last_modified DESC",
+                (document_type,)
+            )
+        else:
+            rows = self._query("SELECT source_path, entry FROM files ORDER BY last_modified DESC")
+        return [(path, json.loads(entry)) for path, entry in rows]
+
+    def count_documents(self, document_type: Optional[str] = None, prefix: Optional[str] = None) -> int:
+        clauses, params = [], []
+        if prefix:
+            low, high = self._prefix_range(prefix)
+            clauses.append("source_path >= ? AND source_path < ?")
+            params.extend([low, high])
+        if document_type:
+            clauses.append("document_type = ?")
+            params.append(document_type)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(f"SELECT COUNT(*) FROM files{where}", tuple(params))[0][0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def remove_sqlite_files(db_path: str) -> None:
+    """Supprime une base SQLite et ses fichiers -wal/-shm éventuels."""
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def migrate_json_to_sqlite(json_path: str, db_path: str) -> int:
+    """
+    Importe un registre JSON existant dans une base SQLite.
+
+    La base est construite dans un fichier temporaire puis renommée : une migration
+    interrompue ne laisse jamais une base partielle à la place du registre.
+
+    Args:
+        json_path: Chemin du fichier file_registry_{user_id}.json.
+        db_path: Chemin de la base SQLite cible.
+
+    Returns:
+        Nombre d'entrées importées.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        registry = json.load(f)
+    tmp_path = f"{db_path}.tmp"
+    remove_sqlite_files(tmp_path)
+    try:
+        backend = SqliteRegistryBackend(tmp_path)
+        try:
+            backend.put_many(list(registry.items()))
+            # Retour au journal classique : le WAL est reporté dans la base avant le renommage
+            with backend._lock:
+                backend._conn.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            backend.close()
+        # Un -wal/-shm orphelin de la cible serait rejoué sur la nouvelle base
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.replace(tmp_path, db_path)
+    except Exception:
+        remove_sqlite_files(tmp_path)
+        raise
+    logger.info(f"Registre migré de {json_path} vers {db_path}: {len(registry)} entrées")
+    return len(registry)
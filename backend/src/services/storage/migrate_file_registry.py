@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Migration unique des registres JSON (file_registry_{user_id}.json) vers SQLite.
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+import glob
+import argparse
+
+from src.core.logger import log
+from src.services.storage.file_registry import data_dir
+from src.services.storage.file_registry_backends import migrate_json_to_sqlite, remove_sqlite_files
+
+logger = log.bind(name="src.services.storage.migrate_file_registry")
+
+
+def migrate_all(registry_dir: str = data_dir, force: bool = False) -> dict:
+    """
+    Migre tous les registres JSON d'un répertoire vers SQLite.
+
+    Args:
+        registry_dir: Répertoire contenant les fichiers file_registry_*.json.
+        force: Recréer la base SQLite même si elle existe déjà.
+
+    Returns:
+        Dictionnaire {user_id: nombre d'entrées migrées}.
+    """
+    results = {}
+    for json_path in sorted(glob.glob(os.path.join(registry_dir, "file_registry_*.json"))):
+        user_id = os.path.basename(json_path)[len("file_registry_"):-len(".json")]
+        db_path = os.path.join(registry_dir, f"file_registry_{user_id}.sqlite")
+        if os.path.exists(db_path):
+            if not force:
+                logger.info(f"Registre SQLite déjà présent pour {user_id}, ignoré")
+                continue
+            remove_sqlite_files(db_path)
+        try:
+            results[user_id] = migrate_json_to_sqlite(json_path, db_path)
+        except Exception as e:
+            logger.error(f"Échec de la migration du registre de {user_id}: {e}")
+    return results
+
+
+def main():
+    """Point d'entrée principal du script."""
+    parser = argparse.ArgumentParser(description="Migration des registres de fichiers JSON vers SQLite.")
+    parser.add_argument('--registry-dir', default=data_dir, help='Répertoire des registres')
+    parser.add_argument('--force', action='store_true', help='Recréer les bases SQLite existantes')
+    args = parser.parse_args()
+
+    results = migrate_all(args.registry_dir, args.force)
+    print(f"{len(results)} registres migrés, {sum(results.values())} entrées au total")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
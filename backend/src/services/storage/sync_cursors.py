@@ -0,0 +1,109 @@
+"""
+Curseurs de synchronisation incrémentale par utilisateur.
+
+Stocke, pour chaque fournisseur, le point de reprise renvoyé par son API de changements
+(historyId Gmail, deltaLink Microsoft Graph, ...) afin que la synchronisation suivante ne
+demande que les changements intervenus depuis.
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+import json
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+from src.core.logger import log
+
+logger = log.bind(name="src.services.storage.sync_cursors")
+backend_dir = os.path.abspath(os.path.join(__file__, '..', '..', '..', '..'))
+data_dir = os.path.join(backend_dir, 'data', 'sync_cursors')
+
+
+class SyncCursorStore:
+    """
+    Curseurs de synchronisation d'un utilisateur, persistés dans un fichier JSON.
+
+    Les curseurs sont rangés par fournisseur puis par clé (par exemple un dossier),
+    la clé "default" étant utilisée pour les fournisseurs à curseur unique.
+    """
+
+    def __init__(self, user_id: str, cursor_dir: Optional[str] = None):
+        """
+        Initialise le stockage des curseurs.
+
+        Args:
+            user_id: Identifiant de l'utilisateur.
+            cursor_dir: Répertoire des curseurs. Par défaut data/sync_cursors.
+        """
+        cursor_dir = cursor_dir or data_dir
+        os.makedirs(cursor_dir, exist_ok=True)
+        self.path = os.path.join(cursor_dir, f'sync_cursors_{user_id}.json')
+        self._lock = threading.Lock()
+        self._cursors: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, OSError, json.JSONDecodeError) as e:
+            # Un curseur perdu ne fait que provoquer une synchronisation complète
+            logger.warning(f"Curseurs de synchronisation illisibles ({self.path}), synchronisation complète: {e}")
+            return {}
+
+    def _write(self) -> None:
+        """Écrit les curseurs dans un fichier temporaire puis le renomme (écriture atomique)."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                json.dump(self._cursors, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            logger.error(f"Erreur lors de la sauvegarde des curseurs de synchronisation: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, provider: str, key: str = "default") -> Optional[Any]:
+        """
+        Retourne le curseur enregistré pour un fournisseur.
+
+        Args:
+            provider: Nom du fournisseur (gmail, outlook, onedrive...).
+            key: Clé du curseur (dossier, drive...).
+
+        Returns:
+            Le curseur, ou None si aucune synchronisation n'a encore été enregistrée.
+        """
+        with self._lock:
+            return self._cursors.get(provider, {}).get(key)
+
+    def set(self, provider: str, value: Any, key: str = "default") -> None:
+        """
+        Enregistre le curseur d'un fournisseur.
+
+        Args:
+            provider: Nom du fournisseur.
+            value: Curseur renvoyé par l'API du fournisseur.
+            key: Clé du curseur.
+        """
+        with self._lock:
+            self._cursors.setdefault(provider, {})[key] = value
+            self._write()
+
+    def clear(self, provider: str, key: Optional[str] = None) -> None:
+        """
+        Supprime un curseur (ou tous les curseurs d'un fournisseur si key est None),
+        ce qui force une synchronisation complète au prochain passage.
+        """
+        with self._lock:
+            if key is None:
+                self._cursors.pop(provider, None)
+            else:
+                self._cursors.get(provider, {}).pop(key, None)
+            self._write()
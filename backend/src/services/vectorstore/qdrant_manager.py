@@ -2,14 +2,22 @@ import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')))
 import logging
+import threading
+import time
 import traceback
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as rest
-from typing import List, Dict, Any
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+from typing import List, Dict, Any, Optional
 from langchain_qdrant import QdrantVectorStore
 from src.services.embeddings.embedding_service import EmbeddingService
 from src.core.logger import log
 from src.core.config import (
+    CONFIG,
     QDRANT_URL,
     QDRANT_API_KEY
 )
@@ -17,33 +25,139 @@ from src.core.config import (
 # Configure logging
 logger = log.bind(name="src.services.vectorstore.qdrant_manager")
 
+# Payload fields written by ingestion and used in filters (deletion, rename, metadata_filter)
+PAYLOAD_INDEXES = {
+    "metadata.doc_id": rest.PayloadSchemaType.KEYWORD,
+    "metadata.path": rest.PayloadSchemaType.KEYWORD,
+    "metadata.user": rest.PayloadSchemaType.KEYWORD,
+    "metadata.document_type": rest.PayloadSchemaType.KEYWORD,
+    "metadata.conversation_id": rest.PayloadSchemaType.KEYWORD,
+    "metadata.date": rest.PayloadSchemaType.DATETIME,
+}
+
+# How long a collection checked by ensure_collection_exists is trusted without a new get_collection
+KNOWN_COLLECTIONS_TTL = CONFIG.get("retrieval", {}).get("vectorstore", {}).get("known_collections_ttl", 300)
+
+# Path renames sent per batch_update_points request
+RENAME_BATCH_SIZE = 500
+
+# One QdrantClient per URL for the whole process (the client keeps its own HTTP connection pool)
+_client_pool: Dict[str, QdrantClient] = {}
+_client_pool_lock = threading.Lock()
+
+# (url, collection_name) -> time of the last successful existence check
+_known_collections: Dict[tuple, float] = {}
+_known_collections_lock = threading.Lock()
+
+
+def get_pooled_qdrant_client(url: str = None, api_key: str = None) -> QdrantClient:
+    """Return the process-wide QdrantClient for a URL, creating it on first use."""
+    url = url or QDRANT_URL
+    api_key = api_key if api_key is not None else QDRANT_API_KEY
+    with _client_pool_lock:
+        if url not in _client_pool:
+            if api_key:
+                _client_pool[url] = QdrantClient(url=url, api_key=api_key)
+            else:
+                _client_pool[url] = QdrantClient(url=url)
+        return _client_pool[url]
+
+
+def _is_collection_missing_error(error: Exception) -> bool:
+    message = str(error)
+    return "doesn't exist" in message or "not found" in message.lower()
+
+
+def forget_collection(collection_name: str, url: str = None) -> None:
+    """Drop a collection from the known-collections registry so the next operation re-checks it."""
+    with _known_collections_lock:
+        _known_collections.pop((url or QDRANT_URL, collection_name), None)
+
+
 class VectorStoreManager:
     def __init__(self, collection_name: str):
-        # Increase timeout to 300 seconds (5 minutes) for large batch operations
-        if QDRANT_API_KEY:
-            self.client = QdrantClient(
-                url=QDRANT_URL, 
-                api_key=QDRANT_API_KEY
-            )
-        else:
-            self.client = QdrantClient(
-                url=QDRANT_URL
-            )
+        self.url = QDRANT_URL
+        self.client = get_pooled_qdrant_client(self.url)
         self.collection_name = collection_name
         self.ensure_collection_exists()
 
-    def ensure_collection_exists(self, vector_size=1536, distance="Cosine"):
-        """Create the collection if it does not exist."""
+    def _is_known_collection(self) -> bool:
+        with _known_collections_lock:
+            checked_at = _known_collections.get((self.url, self.collection_name))
+        return checked_at is not None and time.monotonic() - checked_at < KNOWN_COLLECTIONS_TTL
+
+    def _mark_known_collection(self) -> None:
+        with _known_collections_lock:
+            _known_collections[(self.url, self.collection_name)] = time.monotonic()
+
+    @contextmanager
+    def _collection_guard(self):
+        """Forget the collection in the registry if an operation reports it missing."""
         try:
-            self.client.get_collection(self.collection_name)
+            yield
         except Exception as e:
-            if "doesn't exist" in str(e) or "not found" in str(e).lower():
+            if _is_collection_missing_error(e):
+                logger.warning(f"Collection {self.collection_name} not found, invalidating known-collections registry")
+                forget_collection(self.collection_name, self.url)
+            raise
+
+    def ensure_collection_exists(self, vector_size=1536, distance="Cosine", force: bool = False):
+        """Create the collection if it does not exist, and make sure payload indexes exist.
+
+        The result is remembered process-wide for KNOWN_COLLECTIONS_TTL seconds, so
+        repeated calls do not hit Qdrant. Pass force=True to bypass the registry.
+        """
+        if not force and self._is_known_collection():
+            return
+        try:
+            info = self.client.get_collection(self.collection_name)
+        except Exception as e:
+            if _is_collection_missing_error(e):
                 self.client.recreate_collection(
                     collection_name=self.collection_name,
                     vectors_config={"size": vector_size, "distance": distance}
                 )
+                self.ensure_payload_indexes(existing_schema={})
+                self._mark_known_collection()
+                return
             else:
                 raise
+        # Existing collections created before payload indexing are migrated in place
+        self.ensure_payload_indexes(existing_schema=info.payload_schema or {})
+        self._mark_known_collection()
+
+    def ensure_payload_indexes(self, existing_schema: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Create the payload indexes used by filtered operations, if missing.
+
+        Idempotent: fields that are already indexed are skipped, so this is safe
+        to call on every bootstrap and doubles as the migration for existing
+        collections.
+
+        Args:
+            existing_schema: payload_schema of the collection if already fetched
+
+        Returns:
+            List[str]: Names of the fields for which an index was created
+        """
+        if existing_schema is None:
+            existing_schema = self.client.get_collection(self.collection_name).payload_schema or {}
+        created = []
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name in existing_schema:
+                continue
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema,
+                    wait=True
+                )
+                created.append(field_name)
+            except Exception as e:
+                logger.warning(f"Could not create payload index on {field_name} for {self.collection_name}: {str(e)}")
+        if created:
+            logger.info(f"Created payload indexes on {created} for collection {self.collection_name}")
+        return created
 
     def add_documents(self, docs: List[Any], embedder = None,vectorstore = None):
         """Add a list of langchain Document objects to the collection."""
@@ -53,17 +167,34 @@ class VectorStoreManager:
             embedder = embedder_instance._embedder
         if vectorstore is None:
             vectorstore = QdrantVectorStore(client=self.client, collection_name=self.collection_name, embedding=embedder)
-        vectorstore.add_documents(docs)
+        with self._collection_guard():
+            vectorstore.add_documents(docs)
 
-    def add_documents_in_batches(self, docs: List[Any], batch_size: int = 10) -> Dict[str, Any]:
+    def add_documents_in_batches(
+        self,
+        docs: List[Any],
+        batch_size: Optional[int] = None,
+        pipelined: Optional[bool] = None,
+        max_in_flight: Optional[int] = None,
+        max_batch_chars: Optional[int] = None,
+    ) -> Dict[str, Any]:
         """Add a list of langchain Document objects to the collection in batches.
         
         This method breaks down large document lists into smaller batches for more
         efficient processing, better memory management, and improved error handling.
+
+        In pipelined mode (ingestion.upload.pipelined in config.yaml), batches are
+        sized by total characters and the embedding requests for the next batches
+        run in a thread pool while the current batch is being upserted into Qdrant.
         
         Args:
             docs: List of langchain Document objects to add to the collection
-            batch_size: Number of documents to process in each batch (default: 20)
+            batch_size: Number of documents per batch (serial mode, default 10), or
+                maximum number of documents per batch (pipelined mode, default
+                ingestion.upload.max_batch_docs)
+            pipelined: Overlap embedding and upsert (default from config)
+            max_in_flight: Maximum number of batches being embedded ahead of the upsert
+            max_batch_chars: Maximum total characters per batch in pipelined mode
             
         Returns:
             Dict containing stats about the process:
@@ -71,22 +202,63 @@ class VectorStoreManager:
                 - processed: Number of documents successfully processed
                 - errors: Number of batches with errors
                 - batches: Total number of batches processed
+                - timings: Seconds spent per stage (embed, upsert, total)
+                - embedding_cache: Embedding cache hits/misses for this call (if enabled)
         """
         self.ensure_collection_exists()
-        # batch_size = 1
+        upload_cfg = CONFIG.get("ingestion", {}).get("upload", {}) or {}
+        if pipelined is None:
+            pipelined = upload_cfg.get("pipelined", False)
         embedder_instance = EmbeddingService()
-        vectorstore = QdrantVectorStore(client=self.client, collection_name=self.collection_name, embedding=embedder_instance._embedder)
         
         total_docs = len(docs)
         if total_docs == 0:
             return {"total": 0, "processed": 0, "errors": 0, "batches": 0}
+
+        cache_before = embedder_instance.cache_stats()
             
         stats = {
             "total": total_docs,
             "processed": 0,
             "errors": 0,
-            "batches": 0
+            "batches": 0,
+            "timings": {"embed": 0.0, "upsert": 0.0, "total": 0.0}
         }
+        start_time = time.time()
+
+        if pipelined:
+            self._add_documents_pipelined(
+                docs,
+                embedder_instance._embedder,
+                stats,
+                max_batch_docs=batch_size or upload_cfg.get("max_batch_docs", 64),
+                max_in_flight=max_in_flight or upload_cfg.get("max_in_flight", 3),
+                max_batch_chars=max_batch_chars or upload_cfg.get("max_batch_chars", 40000),
+            )
+        else:
+            self._add_documents_serial(docs, embedder_instance._embedder, stats, batch_size or 10)
+
+        stats["timings"] = {k: round(v, 3) for k, v in stats["timings"].items()}
+        stats["timings"]["total"] = round(time.time() - start_time, 3)
+        
+        success_rate = (stats["processed"] / stats["total"]) * 100 if stats["total"] > 0 else 0
+        logger.info(f"Document batch processing complete: {stats['processed']}/{stats['total']} documents processed successfully ({success_rate:.1f}%) in {stats['timings']['total']}s (embed {stats['timings']['embed']}s, upsert {stats['timings']['upsert']}s)")
+
+        if cache_before:
+            cache_after = embedder_instance.cache_stats()
+            stats["embedding_cache"] = {
+                "hits": cache_after["hits"] - cache_before["hits"],
+                "misses": cache_after["misses"] - cache_before["misses"],
+                "entries": cache_after["entries"],
+            }
+            logger.info(f"Embedding cache: {stats['embedding_cache']['hits']} hits, {stats['embedding_cache']['misses']} misses")
+        
+        return stats
+
+    def _add_documents_serial(self, docs: List[Any], embedder, stats: Dict[str, Any], batch_size: int) -> None:
+        """Embed and upsert fixed-size batches one after another."""
+        vectorstore = QdrantVectorStore(client=self.client, collection_name=self.collection_name, embedding=embedder)
+        total_docs = len(docs)
         
         # Calculate number of batches
         num_batches = (total_docs + batch_size - 1) // batch_size  # Ceiling division
@@ -98,9 +270,6 @@ class VectorStoreManager:
             batch = docs[i:i+batch_size]
             batch_num = (i // batch_size) + 1
             stats["batches"] += 1
-            #logger.debug(docs[i].metadata)
-            # logger.debug({k: v for k, v in docs[i].metadata.items() if k != "page_content" and k != "body_text"})
-            # logger.debug(f"Document {i} preview: {docs[i].metadata['page_content'][:500]  }")
 
             try:
                 logger.debug(f"Processing batch {batch_num}/{num_batches} with {len(batch)} documents")
@@ -113,24 +282,116 @@ class VectorStoreManager:
 
                 logger.info(f"📄 Batch {batch_num}: {len(batch)} documents, total {total_chars_batch:,} characters (avg {avg_chars:.0f} chars/doc)")
 
-                self.add_documents(batch,embedder_instance._embedder,vectorstore)
+                # Embedding and upsert are not separable here, count them as upsert time
+                step_start = time.time()
+                self.add_documents(batch,embedder,vectorstore)
+                stats["timings"]["upsert"] += time.time() - step_start
                 stats["processed"] += len(batch)
             except Exception as e:
                 stats["errors"] += 1
                 logger.error(f"Error processing batch {batch_num}/{num_batches}: {str(e)}")
                 # Continue processing other batches despite errors
-        
-        success_rate = (stats["processed"] / stats["total"]) * 100 if stats["total"] > 0 else 0
-        logger.info(f"Document batch processing complete: {stats['processed']}/{stats['total']} documents processed successfully ({success_rate:.1f}%)")
-        
-        return stats
+
+    @staticmethod
+    def _iter_char_batches(docs: List[Any], max_batch_chars: int, max_batch_docs: int):
+        """Yield batches bounded by total characters and by document count."""
+        batch = []
+        batch_chars = 0
+        for doc in docs:
+            doc_chars = len(doc.page_content or "")
+            if batch and (batch_chars + doc_chars > max_batch_chars or len(batch) >= max_batch_docs):
+                yield batch
+                batch = []
+                batch_chars = 0
+            batch.append(doc)
+            batch_chars += doc_chars
+        if batch:
+            yield batch
+
+    def _add_documents_pipelined(
+        self,
+        docs: List[Any],
+        embedder,
+        stats: Dict[str, Any],
+        max_batch_docs: int,
+        max_in_flight: int,
+        max_batch_chars: int,
+    ) -> None:
+        """Embed upcoming batches in a thread pool while the current batch is upserted."""
+        batches = list(self._iter_char_batches(docs, max_batch_chars, max_batch_docs))
+        num_batches = len(batches)
+        logger.info(f"Processing {len(docs)} chunks in {num_batches} pipelined batches (max {max_batch_chars:,} chars, {max_in_flight} in flight)")
+
+        def embed_batch(batch):
+            step_start = time.time()
+            vectors = embedder.embed_documents([doc.page_content for doc in batch])
+            return vectors, time.time() - step_start
+
+        in_flight = deque()
+        next_batch = 0
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed") as executor:
+            while next_batch < num_batches or in_flight:
+                # Keep up to max_in_flight embedding requests running ahead of the upsert
+                while next_batch < num_batches and len(in_flight) < max_in_flight:
+                    batch = batches[next_batch]
+                    in_flight.append((next_batch + 1, batch, executor.submit(embed_batch, batch)))
+                    next_batch += 1
+
+                batch_num, batch, future = in_flight.popleft()
+                stats["batches"] += 1
+                try:
+                    vectors, embed_duration = future.result()
+                    stats["timings"]["embed"] += embed_duration
+
+                    step_start = time.time()
+                    self.upsert_embedded(batch, vectors)
+                    stats["timings"]["upsert"] += time.time() - step_start
+                    stats["processed"] += len(batch)
+                    logger.debug(f"Batch {batch_num}/{num_batches}: {len(batch)} documents upserted")
+                except Exception as e:
+                    stats["errors"] += 1
+                    logger.error(f"Error processing batch {batch_num}/{num_batches}: {str(e)}")
+                    # Continue processing other batches despite errors
+
+    def upsert_embedded(self, docs: List[Any], vectors: List[List[float]]) -> None:
+        """Upsert already embedded langchain Documents, with the same payload layout as QdrantVectorStore.
+
+        Args:
+            docs: Documents to store
+            vectors: Embedding of each document, in the same order
+        """
+        points = [
+            rest.PointStruct(
+                id=uuid.uuid4().hex,
+                vector=vector,
+                payload={
+                    QdrantVectorStore.CONTENT_KEY: doc.page_content,
+                    QdrantVectorStore.METADATA_KEY: doc.metadata,
+                },
+            )
+            for doc, vector in zip(docs, vectors)
+        ]
+        with self._collection_guard():
+            self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
 
     def delete_by_path(self, path: str):
         self.ensure_collection_exists()
-        self.client.delete(
-            collection_name=self.collection_name,
-            points_selector=rest.Filter(must=[{"key": "path", "match": {"value": path}}])
-        )
+        with self._collection_guard():
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=rest.FilterSelector(filter=rest.Filter(must=[
+                    rest.FieldCondition(key="metadata.path", match=rest.MatchValue(value=path))
+                ]))
+            )
+
+    @staticmethod
+    def _doc_ids_filter(doc_ids: List[str]) -> rest.Filter:
+        """Build a filter matching doc_ids on the indexed metadata.doc_id field."""
+        if len(doc_ids) == 1:
+            match = rest.MatchValue(value=doc_ids[0])
+        else:
+            match = rest.MatchAny(any=list(doc_ids))
+        return rest.Filter(must=[rest.FieldCondition(key="metadata.doc_id", match=match)])
 
     def delete_by_doc_id(self, doc_id: str) -> int:
         """Delete all points associated with a document ID.
@@ -141,92 +402,177 @@ class VectorStoreManager:
         Returns:
             int: Number of points deleted
         """
-        logger.debug(f"QDRANT DELETION: Starting deletion for doc_id={doc_id} in collection={self.collection_name}")
-        self.ensure_collection_exists()
-        
-        # Find points with doc_id at root or in metadata
-        points_to_delete = set()
-        offset = None
-        while True:
-            try:
-                points, next_offset = self.client.scroll(
-                    collection_name=self.collection_name,
-                    offset=offset,
-                    limit=100,
-                    with_payload=True
-                )
-                logger.debug(f"QDRANT DELETION: Scrolled batch of {len(points)} points")
-                
-                for point in points:
-                    payload = point.payload or {}
-                    root_id = payload.get("doc_id")
-                    meta_id = payload.get("metadata", {}).get("doc_id") if isinstance(payload.get("metadata"), dict) else None
-                    if root_id == doc_id or meta_id == doc_id:
-                        points_to_delete.add(point.id)
-                        logger.debug(f"QDRANT DELETION: Found matching point: id={point.id}, root_id={root_id}, meta_id={meta_id}")
-                
-                if next_offset is None:
-                    break
-                offset = next_offset
-            except Exception as e:
-                logger.error(f"QDRANT DELETION ERROR: Error while scrolling collection: {str(e)}")
-                logger.error(traceback.format_exc())
-                raise
-        
-        deleted_count = len(points_to_delete)
-        logger.debug(f"QDRANT DELETION: Found {deleted_count} points to delete for doc_id={doc_id}")
+        return self.delete_by_doc_ids([doc_id])
+
+    def delete_by_doc_ids(self, doc_ids: List[str]) -> int:
+        """Delete all points associated with any of the given document IDs.
+
+        Matching is done server-side with a payload filter (indexed on
+        metadata.doc_id), so the cost does not depend on the collection size.
         
-        if points_to_delete:
-            try:
-                # Delete by root doc_id
-                logger.debug(f"QDRANT DELETION: Deleting by root doc_id filter")
-                self.client.delete(
+        Args:
+            doc_ids: The document IDs to delete
+            
+        Returns:
+            int: Number of points deleted
+        """
+        doc_ids = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id]
+        if not doc_ids:
+            return 0
+        logger.debug(f"QDRANT DELETION: Starting deletion for {len(doc_ids)} doc_ids in collection={self.collection_name}")
+        self.ensure_collection_exists()
+
+        doc_filter = self._doc_ids_filter(doc_ids)
+        try:
+            with self._collection_guard():
+                deleted_count = self.client.count(
                     collection_name=self.collection_name,
-                    points_selector=rest.Filter(must=[{"key": "doc_id", "match": {"value": doc_id}}])
-                )
-                
-                # Delete by metadata.doc_id if needed
-                logger.debug(f"QDRANT DELETION: Deleting by metadata.doc_id filter")
+                    count_filter=doc_filter,
+                    exact=True
+                ).count
+        except Exception as e:
+            logger.error(f"QDRANT DELETION ERROR: Error while counting points: {str(e)}")
+            logger.error(traceback.format_exc())
+            raise
+
+        if not deleted_count:
+            logger.warning(f"QDRANT DELETION: No points found to delete for doc_ids={doc_ids}")
+            return 0
+
+        try:
+            with self._collection_guard():
                 self.client.delete(
                     collection_name=self.collection_name,
-                    points_selector=rest.Filter(must=[{"key": "metadata.doc_id", "match": {"value": doc_id}}])
+                    points_selector=rest.FilterSelector(filter=doc_filter)
                 )
-                logger.debug(f"QDRANT DELETION: Successfully deleted {deleted_count} points for doc_id={doc_id}")
-            except Exception as e:
-                logger.error(f"QDRANT DELETION ERROR: Failed to delete points: {str(e)}")
-                logger.error(traceback.format_exc())
-                logger.debug(traceback.format_exc(), flush=True)
-                raise
-        else:
-            logger.warning(f"QDRANT DELETION: No points found to delete for doc_id={doc_id}")
-            logger.debug(f"QDRANT DELETION: No points found to delete for doc_id={doc_id}", flush=True)
+            logger.debug(f"QDRANT DELETION: Successfully deleted {deleted_count} points for {len(doc_ids)} doc_ids")
+        except Exception as e:
+            logger.error(f"QDRANT DELETION ERROR: Failed to delete points: {str(e)}")
+            logger.error(traceback.format_exc())
+            raise
         
         return deleted_count
 
     def update_path(self, old_path: str, new_path: str) -> int:
-        self.ensure_collection_exists()
-        points = []
-        offset = None
-        while True:
-            scroll_result = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter=rest.Filter(must=[{"key": "path", "match": {"value": old_path}}]),
-                with_payload=True,
-                offset=offset
-            )
-            points.extend(scroll_result[0])
-            # if scroll_result[1] is None:
-            #     break
-            offset = scroll_result[1]
-        if not points:
+        """Rename the path of every chunk of a document.
+
+        Args:
+            old_path: Current value of metadata.path
+            new_path: New value of metadata.path
+
+        Returns:
+            int: Number of points updated
+        """
+        return self.rename_paths({old_path: new_path})
+
+    def rename_paths(self, renames: Dict[str, str]) -> int:
+        """Rename metadata.path for several documents.
+
+        Renames are sent as filter-based set_payload operations on the indexed
+        metadata.path field, grouped in batch_update_points requests of
+        RENAME_BATCH_SIZE operations, whatever the number of chunks. Each group is
+        counted first and skipped when none of its paths has a point.
+
+        Args:
+            renames: Mapping of old path -> new path
+
+        Returns:
+            int: Number of points updated
+        """
+        renames = {old: new for old, new in renames.items() if old and old != new}
+        if not renames:
             return 0
-        for point in points:
-            self.client.set_payload(
-                collection_name=self.collection_name,
-                payload={"path": new_path},
-                points=[point.id]
-            )
-        return len(points)
+        self.ensure_collection_exists()
+        items = list(renames.items())
+        updated = 0
+        for start in range(0, len(items), RENAME_BATCH_SIZE):
+            batch = items[start:start + RENAME_BATCH_SIZE]
+            with self._collection_guard():
+                count = self.client.count(
+                    collection_name=self.collection_name,
+                    count_filter=rest.Filter(must=[
+                        rest.FieldCondition(key="metadata.path", match=rest.MatchAny(any=[old for old, _ in batch]))
+                    ]),
+                    exact=True
+                ).count
+            if not count:
+                continue
+            operations = [
+                # key="metadata" updates metadata.path without touching the other metadata fields
+                rest.SetPayloadOperation(set_payload=rest.SetPayload(
+                    payload={"path": new_path},
+                    filter=rest.Filter(must=[
+                        rest.FieldCondition(key="metadata.path", match=rest.MatchValue(value=old_path))
+                    ]),
+                    key="metadata",
+                ))
+                for old_path, new_path in batch
+            ]
+            with self._collection_guard():
+                self.client.batch_update_points(
+                    collection_name=self.collection_name,
+                    update_operations=operations,
+                    wait=True
+                )
+            updated += count
+        logger.debug(f"Renamed {len(renames)} paths ({updated} points)")
+        return updated
+
+    def rename_path_prefix(self, old_prefix: str, new_prefix: str, paths: Optional[List[str]] = None) -> int:
+        """Rename every document whose path starts with old_prefix (folder rename).
+
+        Args:
+            old_prefix: Current folder prefix
+            new_prefix: New folder prefix
+            paths: Known document paths under the prefix (e.g. from
+                FileRegistry.get_files_by_prefix). If None, the distinct paths are
+                looked up in Qdrant.
+
+        Returns:
+            int: Number of points updated
+        """
+        if paths is None:
+            paths = self._distinct_paths()
+        renames = {
+            path: new_prefix + path[len(old_prefix):]
+            for path in paths
+            if path and path.startswith(old_prefix)
+        }
+        logger.info(f"Renaming {len(renames)} documents from prefix {old_prefix} to {new_prefix}")
+        return self.rename_paths(renames)
+
+    def _distinct_paths(self) -> List[str]:
+        """Return the distinct metadata.path values of the collection."""
+        self.ensure_collection_exists()
+        try:
+            # Facet counts run on the payload index, without reading any point
+            with self._collection_guard():
+                response = self.client.facet(
+                    collection_name=self.collection_name,
+                    key="metadata.path",
+                    limit=1000000,
+                    exact=True
+                )
+            return [hit.value for hit in response.hits]
+        except (AttributeError, UnexpectedResponse, ResponseHandlingException):
+            # Older qdrant-client or server without facet support: scroll only the path field
+            paths = set()
+            offset = None
+            while True:
+                with self._collection_guard():
+                    points, offset = self.client.scroll(
+                        collection_name=self.collection_name,
+                        offset=offset,
+                        limit=1000,
+                        with_payload=["metadata.path"]
+                    )
+                for point in points:
+                    metadata = (point.payload or {}).get("metadata") or {}
+                    if metadata.get("path"):
+                        paths.add(metadata["path"])
+                if offset is None:
+                    break
+            return list(paths)
 
     def fetch_existing_doc_ids(self) -> set:
         self.ensure_collection_exists()
@@ -234,12 +580,13 @@ class VectorStoreManager:
         offset = None
         page_size = 100
         while True:
-            points, next_offset = self.client.scroll(
-                collection_name=self.collection_name,
-                offset=offset,
-                limit=page_size,
-                with_payload=True
-            )
+            with self._collection_guard():
+                points, next_offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    offset=offset,
+                    limit=page_size,
+                    with_payload=True
+                )
             for point in points:
                 payload = point.payload or {}
                 doc_id = None
@@ -256,12 +603,14 @@ class VectorStoreManager:
 
     def count(self) -> int:
         self.ensure_collection_exists()
-        info = self.client.get_collection(self.collection_name)
+        with self._collection_guard():
+            info = self.client.get_collection(self.collection_name)
         return info.points_count
 
     def purge_all(self):
         self.ensure_collection_exists()
-        self.client.delete(collection_name=self.collection_name, points_selector=rest.PointIdsSelector(points=[]))  # Use Qdrant's API for full purge if available
+        with self._collection_guard():
+            self.client.delete(collection_name=self.collection_name, points_selector=rest.PointIdsSelector(points=[]))  # Use Qdrant's API for full purge if available
 
     def get_qdrant_client(self):
         """Return the underlying QdrantClient instance."""
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import uuid
+import random
+import logging
+import argparse
+import statistics
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+
+# allow imports of your project modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.core.config import QDRANT_URL, QDRANT_API_KEY
+from src.services.vectorstore.qdrant_manager import VectorStoreManager
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("qdrant_payload_index_benchmark")
+
+VECTOR_SIZE = 1536
+DOCUMENT_TYPES = ["email", "email_attachment", "pdf", "docx", "xlsx"]
+
+
+def random_vector():
+    return [random.uniform(-1, 1) for _ in range(VECTOR_SIZE)]
+
+
+def populate(client, collection, num_points, num_docs, batch_size=256):
+    """Insert random points shaped like ingestion payloads."""
+    for i in range(0, num_points, batch_size):
+        points = []
+        for j in range(i, min(i + batch_size, num_points)):
+            doc_num = j % num_docs
+            points.append(rest.PointStruct(
+                id=uuid.uuid4().hex,
+                vector=random_vector(),
+                payload={
+                    "page_content": f"chunk {j}",
+                    "metadata": {
+                        "doc_id": f"doc-{doc_num}",
+                        "path": f"/bench/{doc_num}",
+                        "user": "bench",
+                        "document_type": DOCUMENT_TYPES[doc_num % len(DOCUMENT_TYPES)],
+                        "conversation_id": f"conv-{doc_num // 10}",
+                        "date": f"2025-{(doc_num % 12) + 1:02d}-01T00:00:00",
+                    },
+                },
+            ))
+        client.upsert(collection_name=collection, points=points, wait=True)
+
+
+def run_queries(client, collection, num_docs, num_queries):
+    """Return latencies (ms) of filtered searches and filtered counts."""
+    latencies = []
+    for _ in range(num_queries):
+        doc_num = random.randrange(num_docs)
+        query_filter = rest.Filter(must=[
+            rest.FieldCondition(key="metadata.conversation_id", match=rest.MatchValue(value=f"conv-{doc_num // 10}")),
+            rest.FieldCondition(key="metadata.document_type", match=rest.MatchValue(value=DOCUMENT_TYPES[doc_num % len(DOCUMENT_TYPES)])),
+        ])
+        start = time.perf_counter()
+        client.search(collection_name=collection, query_vector=random_vector(), query_filter=query_filter, limit=10)
+        client.count(
+            collection_name=collection,
+            count_filter=rest.Filter(must=[rest.FieldCondition(key="metadata.doc_id", match=rest.MatchValue(value=f"doc-{doc_num}"))]),
+            exact=True,
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    logger.info(f"{label}: p50={statistics.median(latencies):.1f}ms p95={p95:.1f}ms mean={statistics.mean(latencies):.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filtered search latency before/after payload indexes")
+    parser.add_argument("--points", type=int, default=50000, help="Number of points to insert")
+    parser.add_argument("--docs", type=int, default=5000, help="Number of distinct doc_ids")
+    parser.add_argument("--queries", type=int, default=200, help="Number of filtered queries per run")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY) if QDRANT_API_KEY else QdrantClient(url=QDRANT_URL)
+    collection = f"bench_payload_indexes_{uuid.uuid4().hex[:8]}"
+
+    try:
+        # Raw collection without payload indexes, as created before the migration
+        client.create_collection(
+            collection_name=collection,
+            vectors_config=rest.VectorParams(size=VECTOR_SIZE, distance=rest.Distance.COSINE),
+        )
+        logger.info(f"Populating {collection} with {args.points} points")
+        populate(client, collection, args.points, args.docs)
+
+        summarize("Without payload indexes", run_queries(client, collection, args.docs, args.queries))
+
+        # Bootstrap through VectorStoreManager, which migrates the collection
+        created = VectorStoreManager(collection).ensure_payload_indexes()
+        logger.info(f"Payload indexes present after bootstrap: {sorted(client.get_collection(collection).payload_schema)} (created by second call: {created or 'none'})")
+
+        summarize("With payload indexes", run_queries(client, collection, args.docs, args.queries))
+    finally:
+        client.delete_collection(collection)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os
+import sys
+import logging
+import argparse
+from qdrant_client import QdrantClient
+
+# allow imports of your project modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.core.config import QDRANT_URL, QDRANT_API_KEY
+from src.services.vectorstore.qdrant_manager import VectorStoreManager
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("qdrant_payload_indexes")
+
+
+def main():
+    """Create missing payload indexes on existing collections (idempotent)."""
+    parser = argparse.ArgumentParser(description="Create payload indexes on existing Qdrant collections")
+    parser.add_argument("--collection", nargs="*", help="Collections to migrate (default: all)")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY) if QDRANT_API_KEY else QdrantClient(url=QDRANT_URL)
+    names = args.collection or [c.name for c in client.get_collections().collections]
+    if not names:
+        logger.info("No collections found at all.")
+        return
+
+    for name in names:
+        # VectorStoreManager bootstrap already creates missing indexes, this reports what was done
+        manager = VectorStoreManager(name)
+        created = manager.ensure_payload_indexes()
+        schema = manager.client.get_collection(name).payload_schema or {}
+        logger.info(f"{name}: {len(schema)} indexed fields ({', '.join(sorted(schema))}), created now: {created or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+
+# allow imports of your project modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from langchain_core.documents import Document
+from src.services.rag.retrieval.retrieval import RERANKERS, clear_rerank_cache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("reranker_benchmark")
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "rerank_fixture.json")
+
+
+def load_fixture(path):
+    """Return [(query, documents, relevant ids)] from a fixture file."""
+    with open(path, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    return [
+        (
+            case["query"],
+            [Document(page_content=p["text"], metadata={"unique_id": p["id"]}) for p in case["passages"]],
+            {p["id"] for p in case["passages"] if p.get("relevant")},
+        )
+        for case in cases
+    ]
+
+
+def recall_at_k(ranked, relevant, k):
+    top = {d.metadata["unique_id"] for d in ranked[:k]}
+    return len(top & relevant) / len(relevant) if relevant else 1.0
+
+
+def run(name, rerank, cases, k):
+    latencies, recalls = [], []
+    for query, docs, relevant in cases:
+        start = time.perf_counter()
+        ranked = rerank(query, docs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(recall_at_k(ranked, relevant, k))
+    logger.info(
+        f"{name}: recall@{k}={statistics.mean(recalls):.3f} "
+        f"p50={statistics.median(latencies):.1f}ms max={max(latencies):.1f}ms mean={statistics.mean(latencies):.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reranker latency and recall@k on a fixture set")
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE, help="JSON list of {query, passages: [{id, text, relevant}]}")
+    parser.add_argument("-k", type=int, default=2, help="Cutoff for recall@k")
+    parser.add_argument("--rerankers", nargs="+", default=list(RERANKERS), choices=list(RERANKERS))
+    args = parser.parse_args()
+
+    cases = load_fixture(args.fixture)
+    logger.info(f"{len(cases)} queries, {sum(len(docs) for _, docs, _ in cases)} passages")
+
+    for name in args.rerankers:
+        reranker = RERANKERS[name]()
+        # Warm-up loads the cross-encoder model and the LLM client; the LLM score cache is
+        # then emptied so that the measured pass times real requests
+        reranker.rerank(cases[0][0], cases[0][1][:1], top_k=1)
+        clear_rerank_cache()
+        run(name, lambda query, docs: reranker.rerank(query, docs, top_k=len(docs)), cases, args.k)
+
+
+if __name__ == "__main__":
+    main()
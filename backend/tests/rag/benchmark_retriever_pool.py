@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import statistics
+
+# allow imports of your project modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.services.embeddings.embedding_service import EmbeddingService
+from src.services.rag.retrieval.retrieval import Retriever, get_retriever, clear_retriever_pool
+from src.services.vectorstore import qdrant_manager
+from src.services.vectorstore.qdrant_manager import forget_collection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("retriever_pool_benchmark")
+
+
+def measure(build, collection, num_requests, query=None):
+    """Return per-request latencies (ms) of getting a retriever (and searching if query is set)."""
+    latencies = []
+    for _ in range(num_requests):
+        start = time.perf_counter()
+        retriever = build(collection)
+        if query:
+            retriever.retrieve(query, top_k=10)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def build_unpooled(collection):
+    """Build a retriever the way a request used to: new embedder, new Qdrant client, new collection check."""
+    qdrant_manager._client_pool.clear()
+    forget_collection(collection)
+    return Retriever(collection=collection, embedder=EmbeddingService()._embedder)
+
+
+def summarize(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    logger.info(f"{label}: p50={statistics.median(latencies):.2f}ms p95={p95:.2f}ms mean={statistics.mean(latencies):.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request retriever setup overhead, rebuilt vs pooled")
+    parser.add_argument("--collection", default="rag_documents1536", help="Existing Qdrant collection")
+    parser.add_argument("--requests", type=int, default=50, help="Number of simulated requests")
+    parser.add_argument("--query", default=None, help="Also run a search per request (hits the embeddings API)")
+    args = parser.parse_args()
+
+    # Before: a new Retriever per request, as retrieve_documents_advanced used to do
+    summarize("rebuilt per request", measure(build_unpooled, args.collection, args.requests, args.query))
+
+    # After: the first request fills the pool, the following ones reuse it
+    clear_retriever_pool()
+    latencies = measure(get_retriever, args.collection, args.requests + 1, args.query)
+    logger.info(f"pooled, first request: {latencies[0]:.2f}ms")
+    summarize("pooled", latencies[1:])
+
+
+if __name__ == "__main__":
+    main()
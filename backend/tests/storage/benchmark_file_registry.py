@@ -0,0 +1,85 @@
+"""
+Benchmark des backends du FileRegistry (JSON vs SQLite).
+
+Mesure, pour 1k, 10k et 100k entrées, le temps d'ingestion via add_file,
+d'ouverture du registre, de lookup file_exists et de
+update_email_classification.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.services.storage.file_registry import FileRegistry
+
+
+def make_metadata(i):
+    return {
+        "doc_id": f"doc-{i}",
+        "path": f"/google_email/bench/conv-{i // 5}/email-{i}",
+        "provider_id": f"msg-{i}",
+        "document_type": "email" if i % 4 else "email_attachment",
+        "subject": f"Sujet {i}",
+        "body_text": "Lorem ipsum dolor sit amet " * 20,
+    }
+
+
+def bench_backend(backend, size, lookups, registry_dir):
+    timings = {}
+    registry = FileRegistry("bench", backend=backend, registry_dir=registry_dir)
+
+    start = time.perf_counter()
+    for i in range(size):
+        metadata = make_metadata(i)
+        registry.add_file(doc_id=metadata["doc_id"], file_hash=metadata["doc_id"], source_path=metadata["path"], metadata=metadata)
+    timings["add_file (total)"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    registry = FileRegistry("bench", backend=backend, registry_dir=registry_dir)
+    timings["open"] = time.perf_counter() - start
+
+    sample = [make_metadata(random.randrange(size))["path"] for _ in range(lookups)]
+    start = time.perf_counter()
+    for path in sample:
+        registry.file_exists(path)
+    timings[f"file_exists x{lookups}"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(min(lookups, 100)):
+        registry.update_email_classification(f"msg-{random.randrange(size)}", "bench", "reply")
+    timings[f"update_email_classification x{min(lookups, 100)}"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    registry.count_user_documents(document_type="email")
+    timings["count_user_documents"] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON vs SQLite FileRegistry")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--max-json-size", type=int, default=10000,
+                        help="Au-delà, le backend JSON (quadratique) n'est pas mesuré")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(f"\n=== {size} entrées ===")
+        for backend in ("json", "sqlite"):
+            if backend == "json" and size > args.max_json_size:
+                print(f"{backend:>6}: ignoré (--max-json-size={args.max_json_size})")
+                continue
+            registry_dir = tempfile.mkdtemp(prefix=f"registry_bench_{backend}_")
+            try:
+                timings = bench_backend(backend, size, args.lookups, registry_dir)
+            finally:
+                shutil.rmtree(registry_dir, ignore_errors=True)
+            print(f"{backend:>6}: " + ", ".join(f"{name}={duration:.3f}s" for name, duration in timings.items()))
+
+
+if __name__ == "__main__":
+    main()